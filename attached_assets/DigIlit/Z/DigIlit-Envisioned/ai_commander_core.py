@@ -6,7 +6,7 @@ Not just understanding—CREATING complete, deployable systems.
 
 This is a single-file, self-sufficient automation commander that:
 - Ingests a shared knowledge base (repo + knowledge directories)
-- Builds a semantic index (TF-IDF, optional embeddings)
+- Builds a semantic index (BM25 and TF-IDF, optional embeddings)
 - Generates complete blueprints and executable artifacts
 - Self-ingests generated artifacts back into the knowledge base
 - Supports mutation/autopilot loops to grow knowledge over time
@@ -17,7 +17,7 @@ Run:
 Interactive commands:
   help
   gather [optional_path]
-  search <query>
+  search <query> [category:… path:… ext:… quality:…]
   execute <vision>
   deploy <blueprint_id>
   blueprints
@@ -33,17 +33,29 @@ import os
 import sys
 import json
 import asyncio
+import fnmatch
 import hashlib
+import heapq
+import bisect
 import re
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from datetime import datetime
 import textwrap
 import logging
 import warnings
 import importlib
+import importlib.util
+import itertools
+import functools
+import contextlib
+import time
+import sqlite3
+import stat as stat_mod
+import threading
+from array import array
 
 # Quiet noisy libs
 for name in (
@@ -55,23 +67,23 @@ for name in (
     logging.getLogger(name).setLevel(logging.ERROR)
 warnings.filterwarnings("ignore", category=UserWarning, module="pdfminer")
 
-# ----- Optional heavy deps with lazy install -----
+# ----- Optional heavy deps -----
 HAVE_NUMPY = False
 HAVE_SKLEARN = False
 HAVE_RAPIDFUZZ = False
 HAVE_ST = False
+HAVE_WATCHDOG = False
 
 try:  # core ML
     import numpy as np
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
     HAVE_NUMPY = True
+    from sklearn.feature_extraction.text import HashingVectorizer
     HAVE_SKLEARN = True
 except Exception:
     pass
 
 try:
-    from rapidfuzz import fuzz
+    from rapidfuzz import fuzz, process
     HAVE_RAPIDFUZZ = True
 except Exception:
     pass
@@ -82,6 +94,13 @@ try:
 except Exception:
     HAVE_ST = False
 
+try:  # inotify/FSEvents-backed file watching; polling otherwise
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    HAVE_WATCHDOG = True
+except Exception:
+    pass
+
 # Light-weight PDF fallback
 def extract_text_from_pdf(pdf_path: str) -> str:
     try:
@@ -91,249 +110,3855 @@ def extract_text_from_pdf(pdf_path: str) -> str:
         return ""
 
 
-# ===== Knowledge Graph =====
+TEXT_EXTS = {".txt", ".md", ".rst", ".rxt", ".rtf", ".py", ".js", ".ts", ".tsx", ".json", ".c", ".cpp", ".rs", ".go", ".java", ".cs"}
+# Formats whose extraction is CPU-heavy enough to be worth a worker process
+BINARY_EXTS = {".pdf", ".docx", ".pptx"}
+# What ingest_path_recursive picks up, and the largest file it will read
+INGEST_EXTS = {".txt", ".md", ".rst", ".rxt", ".rtf", ".py", ".js", ".ts", ".tsx", ".json"} | BINARY_EXTS
+INGEST_MAX_BYTES = 5_000_000
+# Package providing the extractor for each binary format
+EXTRACTOR_MODULES = {".pdf": "pdfminer", ".docx": "docx", ".pptx": "pptx"}
+
+
+class ExtractionError(Exception):
+    """A file's extraction failed, overran its budget or crashed its worker."""
+
+
+def extractor_available(suffix: str) -> bool:
+    """Whether the package that extracts ``suffix`` files is installed (text formats always are)."""
+    module = EXTRACTOR_MODULES.get(suffix.lower())
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def iter_document_blocks(path: str, block_chars: int = 1 << 16):
+    """Yield the text of a supported file incrementally.
+
+    Text files are read in blocks of ``block_chars``, PDFs page by page, PPTX
+    slide by slide and DOCX files a batch of paragraphs at a time, so callers
+    never need the whole document in memory at once. A missing extractor or
+    a document it cannot read raises ``ExtractionError`` rather than passing
+    for an empty or truncated text.
+    """
+    file_path = Path(path)
+    suf = file_path.suffix.lower()
+    if suf in TEXT_EXTS:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as fh:
+            while True:
+                block = fh.read(block_chars)
+                if not block:
+                    return
+                yield block
+    elif suf == ".docx":
+        try:
+            import docx  # python-docx
+        except ImportError as e:
+            raise ExtractionError("python-docx is not installed") from e
+        try:
+            doc = docx.Document(file_path)
+        except Exception as e:
+            raise ExtractionError(f"unreadable .docx: {e}") from e
+        batch: List[str] = []
+        size = 0
+        for para in doc.paragraphs:
+            batch.append(para.text)
+            size += len(para.text) + 1
+            if size >= block_chars:
+                yield "\n".join(batch) + "\n"
+                batch, size = [], 0
+        if batch:
+            yield "\n".join(batch)
+    elif suf == ".pptx":
+        try:
+            from pptx import Presentation  # python-pptx
+        except ImportError as e:
+            raise ExtractionError("python-pptx is not installed") from e
+        try:
+            deck = Presentation(str(file_path))
+        except Exception as e:
+            raise ExtractionError(f"unreadable .pptx: {e}") from e
+        for slide in deck.slides:
+            texts = []
+            for shape in slide.shapes:
+                if getattr(shape, "has_text_frame", False):
+                    texts.append(shape.text_frame.text)
+                elif getattr(shape, "has_table", False):
+                    for row in shape.table.rows:
+                        texts.append("\t".join(cell.text for cell in row.cells))
+            if slide.has_notes_slide:
+                texts.append(slide.notes_slide.notes_text_frame.text)
+            text = "\n".join(t for t in texts if t.strip())
+            if text:
+                yield text + "\n\n"
+    elif suf == ".pdf":
+        try:
+            from pdfminer.high_level import extract_pages
+            from pdfminer.layout import LTTextContainer
+        except ImportError as e:
+            raise ExtractionError("pdfminer.six is not installed") from e
+        try:
+            for page in extract_pages(str(file_path)):
+                text = "".join(el.get_text() for el in page if isinstance(el, LTTextContainer))
+                if text:
+                    yield text + "\n\n"
+        except Exception as e:
+            # Pages already yielded are not the document: fail it rather than pass it off as whole
+            raise ExtractionError(f"unreadable .pdf: {e}") from e
+
+
+def extract_document_text(path: str) -> str:
+    """Plain text of a supported file."""
+    return "".join(iter_document_blocks(path))
+
+
+# Bump when extraction output changes so cached texts are re-extracted
+# (2: failed extractions raise instead of caching an empty or placeholder text)
+EXTRACTOR_VERSION = 2
+
+
+class TextCache:
+    """Content-addressed cache of extracted text, shared with document_converter.py.
+
+    Entries live at ``<dir>/<sha1[:2]>/<sha1>.v<EXTRACTOR_VERSION>.txt``, keyed
+    by the source file's SHA-1, so each binary document is extracted once
+    whichever tool (or copy of the file) asks first. ``converted.jsonl`` maps
+    the converter's ``.txt`` outputs to their sources, one appended line per
+    output, so the graph can skip them.
+    """
+
+    DIRNAME = ".qa_textcache"
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._outputs_file = self.directory / "converted.jsonl"
+        self._legacy_outputs_file = self.directory / "converted.json"
+
+    def entry(self, digest: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.v{EXTRACTOR_VERSION}.txt"
+
+    def blocks(self, path: str, digest: Optional[str] = None, block_chars: int = 1 << 16):
+        """Stream the text of ``path``, from the cache or else extracting and caching it.
+
+        A fresh extraction is written to a temporary file alongside and only
+        moved into place once the source has been read to the end without
+        error, so a failed extraction is retried next time rather than cached.
+        """
+        digest = digest or _file_sha1(Path(path))
+        entry = self.entry(digest)
+        try:
+            fh = open(entry, "r", encoding="utf-8")
+        except OSError:
+            fh = None
+        if fh is not None:
+            with fh:
+                while True:
+                    block = fh.read(block_chars)
+                    if not block:
+                        return
+                    yield block
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            out = open(tmp, "w", encoding="utf-8")
+        except OSError:
+            yield from iter_document_blocks(path, block_chars)  # read-only or full disk: extract uncached
+            return
+        complete = False
+        try:
+            with out:
+                for block in iter_document_blocks(path, block_chars):
+                    out.write(block)
+                    yield block
+            complete = True
+        finally:
+            try:
+                if complete:
+                    os.replace(tmp, entry)
+                else:
+                    tmp.unlink()
+            except OSError:
+                pass
+
+    def ensure(self, path: str, digest: Optional[str] = None) -> Path:
+        """Path of the cached text of ``path``, extracting it first if needed."""
+        digest = digest or _file_sha1(Path(path))
+        for _block in self.blocks(path, digest):
+            pass
+        return self.entry(digest)
+
+    def clear(self):
+        """Drop every cached text, so each document is extracted afresh."""
+        import shutil
+        for child in self.directory.iterdir() if self.directory.is_dir() else ():
+            if child.is_dir():
+                shutil.rmtree(child, ignore_errors=True)
+
+    def sweep(self, max_age: float = 3600.0):
+        """Remove temporaries left by extractions that were killed mid-file."""
+        cutoff = time.time() - max_age
+        for tmp in self.directory.glob("*/*.tmp"):
+            try:
+                if tmp.stat().st_mtime < cutoff:
+                    tmp.unlink()
+            except OSError:
+                pass
+
+    def converted_outputs(self) -> Dict[str, str]:
+        try:
+            outputs = json.loads(self._legacy_outputs_file.read_text(encoding="utf-8"))
+        except Exception:
+            outputs = {}
+        try:
+            with open(self._outputs_file, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        output, source = json.loads(line)
+                    except ValueError:
+                        continue  # torn by a crash mid-append
+                    outputs[output] = source
+        except OSError:
+            pass
+        return outputs
+
+    def record_output(self, output: Path, source: Path):
+        """Append one output → source line; later lines win when read back."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        line = json.dumps([os.path.abspath(output), os.path.abspath(source)])
+        with open(self._outputs_file, "a+b") as fh:
+            # Terminate a line torn by an earlier crash so it cannot swallow this one
+            if fh.tell() > 0:
+                fh.seek(-1, os.SEEK_END)
+                if fh.read(1) != b"\n":
+                    line = "\n" + line
+            fh.write((line + "\n").encode("utf-8"))
+
+
+# ===== Chunking =====
+# Preferred cut points, strongest first: headings / blank lines, sentence ends, any whitespace
+_CHUNK_BOUNDARIES = (
+    re.compile(r"\n(?=#{1,6}\s)|\n[ \t]*\n"),
+    re.compile(r"(?<=[.!?])[\"')\]]*\s+"),
+    re.compile(r"\s+"),
+)
+
+
+def _chunk_cut(buf: str, size: int) -> int:
+    """Best cut position in ``buf[:size]``, searching only its second half."""
+    lo = size // 2
+    window = buf[lo:size]
+    for pattern in _CHUNK_BOUNDARIES:
+        last = None
+        for last in pattern.finditer(window):
+            pass
+        if last is not None and last.end() > 0:
+            return lo + last.end()
+    return size
+
+
+def chunk_stream(blocks, size: int = 8000, overlap: int = 400):
+    """Re-cut an iterable of text blocks into chunks of at most ``size`` chars.
+
+    Chunks end at a heading, paragraph or sentence boundary where one falls in
+    the last half of the window, and each chunk repeats up to ``overlap`` chars
+    (snapped to a word start) from the end of the previous one. Only about one
+    chunk plus one block is held in memory at a time.
+    """
+    size = max(64, int(size))
+    overlap = max(0, min(int(overlap), size // 4))
+    buf = ""
+    for block in blocks:
+        buf += block
+        while len(buf) > size:
+            cut = _chunk_cut(buf, size)
+            chunk = buf[:cut]
+            if chunk.strip():
+                yield chunk
+            start = cut
+            if overlap:
+                start = cut - overlap
+                m = re.search(r"\s+", buf[start:cut])
+                start = start + m.end() if m and start + m.end() < cut else cut - overlap
+            buf = buf[start:]
+    if buf.strip():
+        yield buf
+
+
+def chunk_text(text: str, size: int = 8000, overlap: int = 400) -> List[str]:
+    return list(chunk_stream([text], size, overlap))
+
+
+def iter_document_chunks(path: str, size: int = 8000, overlap: int = 400):
+    return chunk_stream(iter_document_blocks(path), size, overlap)
+
+
+def _file_sha1(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_of(doc_path: str) -> str:
+    """Map a document path (possibly a ``#partN`` chunk) back to its source file."""
+    return re.sub(r"#part\d+$", "", doc_path)
+
+
+def _content_hash(text: str) -> str:
+    """Hash of whitespace-normalised text; identical bodies map to one document."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _canonical_path(path: Path) -> str:
+    """One spelling per file: relative to the working directory when inside it, else absolute."""
+    path_abs = os.path.abspath(path)
+    cwd = os.getcwd()
+    if path_abs.startswith(cwd.rstrip(os.sep) + os.sep):
+        return os.path.relpath(path_abs, cwd)
+    return path_abs
+
+
+def _is_under(path: str, root: Path) -> bool:
+    root_abs = os.path.abspath(root)
+    path_abs = os.path.abspath(path)
+    return path_abs == root_abs or path_abs.startswith(root_abs.rstrip(os.sep) + os.sep)
+
+
+# ===== Directory walking =====
+# Never descended into, wherever they appear below an ingest root
+PRUNE_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", "output", "blueprints",
+    ".venv", "venv", ".tox", ".mypy_cache", ".pytest_cache",
+}
+IGNORE_FILES = (".gitignore", ".qaignore")
+# Extensions where one very long line means a bundle rather than prose
+CODE_EXTS = {".py", ".js", ".ts", ".tsx", ".json", ".c", ".cpp", ".rs", ".go", ".java", ".cs", ".css"}
+# Extensions build tools emit bundles in, the only ones judged by file name
+BUNDLE_EXTS = {".js", ".mjs", ".cjs", ".css"}
+# foo.min.js, app.bundle.js, and content-hashed build outputs such as main.3f9a1c2e.js or
+# 2225-9715d6f84b41ae2d.js: a name, a separator, then a hash segment of hex digits and letters
+_MINIFIED_NAME = re.compile(
+    r"\.(?:min|bundle|chunk)\.\w+$|(?<=\w)[-.](?=[0-9a-f]*[0-9])(?=[0-9a-f]*[a-f])[0-9a-f]{8,}\.\w+$", re.I
+)
+_GENERATED_MARK = re.compile(rb"@generated|DO NOT EDIT|auto-?generated|automatically generated", re.I)
+SNIFF_BYTES = 4096
+# Below this size a code file on few, long lines is just small (a one-line JSON config), not minified
+MINIFIED_MIN_BYTES = 32 * 1024
+
+
+def _ignore_pattern(pattern: str) -> str:
+    """Translate one gitignore glob into a regex over ``/``-separated paths."""
+    out, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and "]" in pattern[i + 1:]:
+            j = pattern.index("]", i + 1)
+            body = pattern[i + 1:j]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+            i = j + 1
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """The rules of one ``.gitignore``/``.qaignore``, relative to its directory.
+
+    Supports comments, ``!`` negation, trailing ``/`` (directories only),
+    anchored patterns (containing ``/``) and ``*``, ``?``, ``[...]``, ``**``.
+    """
+
+    def __init__(self, lines):
+        self.rules: List[Tuple[Any, bool, bool]] = []  # (regex, negated, dir_only)
+        for raw in lines:
+            line = raw.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            line = line.replace("\\#", "#").replace("\\!", "!")
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            if not line:
+                continue
+            if "/" in line:
+                regex = "^" + _ignore_pattern(line.lstrip("/")) + "$"
+            else:
+                regex = "(?:^|/)" + _ignore_pattern(line) + "$"
+            self.rules.append((re.compile(regex), negated, dir_only))
+
+    @classmethod
+    def load(cls, directory: str) -> List["IgnoreRules"]:
+        found = []
+        for name in IGNORE_FILES:
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8", errors="ignore") as fh:
+                    rules = cls(fh)
+            except OSError:
+                continue
+            if rules.rules:
+                found.append(rules)
+        return found
+
+    def match(self, rel: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included, None if no rule applies."""
+        verdict = None
+        for regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.search(rel):
+                verdict = not negated
+        return verdict
+
+
+def _ignored(stack: List[Tuple[str, "IgnoreRules"]], path: str, is_dir: bool) -> bool:
+    ignored = False
+    for base, rules in stack:
+        verdict = rules.match(os.path.relpath(path, base).replace(os.sep, "/"), is_dir)
+        if verdict is not None:
+            ignored = verdict  # deeper and later rules win, as in git
+    return ignored
+
+
+def _looks_unindexable(path: str, name: str, suffix: str, size: int) -> Optional[str]:
+    """Reason to skip a text file judged from its name and first few KB, else None."""
+    if suffix in BUNDLE_EXTS and _MINIFIED_NAME.search(name):
+        return "minified"
+    try:
+        with open(path, "rb") as fh:
+            head = fh.read(SNIFF_BYTES)
+    except OSError:
+        return "unreadable"
+    if b"\0" in head:
+        return "binary"
+    if suffix not in CODE_EXTS:
+        return None  # prose may legitimately mention generation or run long lines
+    if _GENERATED_MARK.search(head):
+        return "generated"
+    if size > MINIFIED_MIN_BYTES:
+        longest = max(len(line) for line in head.split(b"\n"))
+        if longest > SNIFF_BYTES // 2 or head.count(b"\n") < 3:
+            return "minified"
+    return None
+
+
+def walk_ingestable(
+    root: Path,
+    exts: set,
+    max_bytes: int,
+    skipped: Optional[Dict[str, int]] = None,
+    sniff: bool = True,
+    exclude: Optional[List[Path]] = None,
+    known=None,
+    only: Optional[List[str]] = None,
+):
+    """Yield ``(path, stat)`` for files under ``root`` worth ingesting.
+
+    Built on ``os.scandir``: directories in ``PRUNE_DIRS`` or ``exclude``,
+    ``.qa_*`` sidecars and anything matched by a ``.gitignore``/``.qaignore``
+    at or below ``root`` are pruned before descending, and only files with a
+    wanted extension are stat'ed. Text files that look minified, generated or binary from their
+    first few KB are skipped (unless ``sniff`` is off); ``skipped`` (if
+    given) counts them by reason. Files for which ``known(path, stat)`` is
+    true were judged on an earlier walk and are not read again. ``only``
+    (files or directories under ``root``) limits the walk to those paths,
+    each judged by the rules that would apply on reaching it from ``root``.
+    """
+    root_str = os.fspath(root)
+    excluded = {os.path.abspath(x) for x in exclude or ()}
+
+    def descend(path: str, name: str, stack):
+        """Ignore stack for directory ``path``, or None when it is pruned."""
+        if name.startswith(".qa_") or name in PRUNE_DIRS or _ignored(stack, path, True):
+            return None
+        if excluded and os.path.abspath(path) in excluded:
+            return None
+        return stack + [(path, r) for r in IgnoreRules.load(path)]
+
+    def admit(path: str, name: str, stack, stat) -> Optional[os.stat_result]:
+        """Stat of file ``path`` if it is worth ingesting, else None; ``stat`` is called last."""
+        suffix = os.path.splitext(name)[1].lower()
+        if name.startswith(".qa_") or suffix not in exts or _ignored(stack, path, False):
+            return None
+        try:
+            st = stat()
+        except OSError:
+            return None
+        if st.st_size > max_bytes:
+            return None
+        if sniff and suffix not in BINARY_EXTS and not (known and known(path, st)):
+            reason = _looks_unindexable(path, name, suffix, st.st_size)
+            if reason:
+                if skipped is not None:
+                    skipped[reason] = skipped.get(reason, 0) + 1
+                return None
+        return st
+
+    root_stack = [(root_str, r) for r in IgnoreRules.load(root_str)]
+    todo = []
+    if only is None:
+        todo.append((root_str, root_stack))
+    for target in only or ():
+        rel = os.path.relpath(target, root_str)
+        if rel == os.curdir:
+            todo.append((root_str, root_stack))
+            continue
+        parts = rel.split(os.sep)
+        if parts[0] == os.pardir:
+            continue
+        directory, stack = root_str, root_stack
+        for part in parts[:-1]:
+            directory = os.path.join(directory, part)
+            stack = descend(directory, part, stack)
+            if stack is None:
+                break
+        if stack is None:
+            continue
+        path = os.path.join(directory, parts[-1])
+        try:
+            is_dir = stat_mod.S_ISDIR(os.lstat(path).st_mode)
+        except OSError:
+            continue  # gone: nothing to yield, so the caller sees it as removed
+        if is_dir:
+            sub = descend(path, parts[-1], stack)
+            if sub is not None:
+                todo.append((path, sub))
+            continue
+        st = admit(path, parts[-1], stack, functools.partial(os.stat, path))
+        if st is not None:
+            yield path, st
+    while todo:
+        directory, stack = todo.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                sub = descend(entry.path, entry.name, stack)
+                if sub is not None:
+                    todo.append((entry.path, sub))
+                continue
+            st = admit(entry.path, entry.name, stack, entry.stat)
+            if st is not None:
+                yield entry.path, st
+
+
+# ===== Isolated extraction =====
+def _extract_chunks(path: str, size: int, overlap: int, cache_dir: Optional[str], digest: Optional[str]):
+    """A file's chunks, read through the ``TextCache`` in ``cache_dir`` when given."""
+    blocks = TextCache(cache_dir).blocks(path, digest) if cache_dir else iter_document_blocks(path)
+    return chunk_stream(blocks, size, overlap)
+
+
+def _extraction_worker(conn, as_limit: int):
+    """Worker loop: stream one file's chunks per message until told to stop."""
+    if as_limit:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (as_limit, as_limit))
+        except Exception:
+            pass
+    # Startup (interpreter + imports) must not count against the first file's deadline
+    conn.send(("ready", None))
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        try:
+            for chunk in _extract_chunks(*task):
+                conn.send(("chunk", chunk))
+            conn.send(("done", None))
+        except MemoryError:
+            conn.send(("error", "exceeded memory budget"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _worker_context():
+    """Start-method context for helper processes (extraction workers, BM25 shards).
+
+    Avoids fork, as the parent may hold threads (store compactor, watcher).
+    Under forkserver the server imports this module once and every worker
+    forks from it, so a worker starts in milliseconds rather than
+    re-importing numpy, scikit-learn and any embedding stack. Another
+    calling script is still re-run in each worker, as multiprocessing does,
+    but finds those imports already done.
+    """
+    import multiprocessing
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    ctx = multiprocessing.get_context("forkserver")
+    # No effect once the server runs
+    ctx.set_forkserver_preload(["__main__"] if __name__ == "__main__" else [__name__])
+    return ctx
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+class IsolatedExtractor:
+    """Runs extractions in worker processes, each file under a time and memory budget.
+
+    A worker that overruns its deadline or RSS budget is killed and replaced,
+    so one pathological document costs at most ``timeout`` seconds. The RSS
+    budget counts growth past the worker's size when it came up, since the
+    modules it inherits are not the document's doing. Where /proc is
+    unavailable the memory budget falls back to RLIMIT_AS. If workers cannot
+    start at all, files are extracted in-process instead.
+    """
+
+    POLL_INTERVAL = 0.25
+    # A worker not ready this long after launch (interpreter + imports) failed to start
+    START_TIMEOUT = 60.0
+    # Workers failing to come up in a row before extraction falls back in-process
+    MAX_START_FAILURES = 3
+
+    def __init__(self, workers: int = 1, timeout: float = 120.0, max_mb: int = 1024):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_bytes = max_mb * 1024 * 1024
+        self._ctx = _worker_context()
+        self._use_proc = os.path.exists(f"/proc/{os.getpid()}/statm")
+
+    def _start(self) -> Dict[str, Any]:
+        parent, child = self._ctx.Pipe()
+        as_limit = 0 if self._use_proc else self.max_bytes
+        proc = self._ctx.Process(target=_extraction_worker, args=(child, as_limit), daemon=True)
+        try:
+            proc.start()
+        except Exception as e:
+            # e.g. a forkserver that died preloading the main script; counts as a failed start
+            print(f"⚠️  Could not launch extraction worker: {type(e).__name__}: {e}")
+            proc = None
+        child.close()
+        # Until "ready" arrives the deadline bounds startup
+        deadline = time.monotonic() + self.START_TIMEOUT
+        return {"proc": proc, "conn": parent, "task": None, "deadline": deadline, "ready": False, "base_rss": 0}
+
+    @staticmethod
+    def _kill(slot: Dict[str, Any]):
+        try:
+            slot["proc"].kill()
+            slot["proc"].join(1)
+        except Exception:
+            pass
+        slot["conn"].close()
+
+    @staticmethod
+    def _resume(slots: List[Optional[Dict[str, Any]]], since: float):
+        """Push deadlines back by the time the consumer kept the generator suspended."""
+        held = time.monotonic() - since
+        for slot in slots:
+            if slot is not None:
+                slot["deadline"] += held
+
+    def run(
+        self,
+        paths: List[str],
+        chunk_size: int = 8000,
+        overlap: int = 400,
+        cache_dir: Optional[str] = None,
+        digests: Optional[List[Optional[str]]] = None,
+    ):
+        """Yield ``(index, kind, payload)`` events in input order.
+
+        Each path produces zero or more ``("chunk", text)`` events followed by
+        one ``("done", None)`` or ``("failed", reason)``. Chunks of the file at
+        the head of the order are passed on as they arrive; later files are
+        buffered until their turn. With ``cache_dir`` the text is read from, or
+        extracted into, the ``TextCache`` there (``digests`` may supply the
+        source hashes already computed by the caller). Budgets only run while
+        the generator does: time the caller spends on yielded chunks is not
+        charged to the files still being extracted.
+        """
+        from collections import deque
+        from multiprocessing.connection import wait
+
+        pending = deque(enumerate(paths))
+        buffered: Dict[int, List[Tuple[str, Optional[str]]]] = defaultdict(list)
+        finished: set = set()
+        slots: List[Optional[Dict[str, Any]]] = [None] * min(self.workers, len(paths))
+        next_out = 0
+        start_failures = 0  # in a row
+        inline = False
+        try:
+            while next_out < len(paths):
+                for i, slot in enumerate(slots):
+                    if pending and slot is None and not inline:
+                        slot = slots[i] = self._start()
+                    if pending and slot is not None and slot["ready"] and slot["task"] is None:
+                        idx, path = pending.popleft()
+                        digest = digests[idx] if digests else None
+                        slot["conn"].send((path, chunk_size, overlap, cache_dir, digest))
+                        slot["task"] = idx
+                        slot["deadline"] = time.monotonic() + self.timeout
+                while next_out < len(paths):
+                    for kind, payload in buffered.pop(next_out, ()):
+                        held = time.monotonic()
+                        yield next_out, kind, payload
+                        self._resume(slots, held)
+                    if next_out not in finished:
+                        break
+                    next_out += 1
+                if inline and pending and pending[0][0] == next_out:
+                    # No budget in-process, but ingestion still makes progress
+                    idx, path = pending.popleft()
+                    digest = digests[idx] if digests else None
+                    try:
+                        for chunk in _extract_chunks(path, chunk_size, overlap, cache_dir, digest):
+                            held = time.monotonic()
+                            yield idx, "chunk", chunk
+                            self._resume(slots, held)
+                        buffered[idx].append(("done", None))
+                    except Exception as e:
+                        buffered[idx].append(("failed", f"{type(e).__name__}: {e}"))
+                    finished.add(idx)
+                    continue
+                starting = [s for s in slots if s is not None and not s["ready"]]
+                busy = [s for s in slots if s is not None and s["task"] is not None]
+                if not busy and not starting:
+                    continue
+                ready = wait([s["conn"] for s in busy + starting], timeout=self.POLL_INTERVAL)
+                now = time.monotonic()
+                for s in starting:
+                    if s["conn"] in ready:
+                        try:
+                            s["conn"].recv()
+                            s["ready"] = True
+                            if self._use_proc:
+                                s["base_rss"] = _rss_bytes(s["proc"].pid) or 0
+                            start_failures = 0
+                            continue
+                        except (EOFError, OSError):
+                            pass
+                    elif now <= s["deadline"]:
+                        continue
+                    # Could not start: drop the slot and try a fresh one next round, a few times
+                    self._kill(s)
+                    slots[slots.index(s)] = None
+                    start_failures += 1
+                    if start_failures >= self.MAX_START_FAILURES and not inline:
+                        inline = True
+                        print(f"⚠️  Extraction workers failed to start {start_failures} times; extracting in-process")
+                for s in busy:
+                    idx = s["task"]
+                    failure = None
+                    if s["conn"] in ready:
+                        try:
+                            while s["task"] is not None and s["conn"].poll():
+                                status, payload = s["conn"].recv()
+                                if status == "chunk":
+                                    buffered[idx].append(("chunk", payload))
+                                    continue
+                                buffered[idx].append(("done", None) if status == "done" else ("failed", payload))
+                                finished.add(idx)
+                                s["task"] = None
+                        except (EOFError, OSError):
+                            failure = "worker crashed"
+                    if failure is not None or s["task"] is None:
+                        pass
+                    elif now > s["deadline"]:
+                        failure = f"timed out after {self.timeout:g}s"
+                    elif self._use_proc and (_rss_bytes(s["proc"].pid) or 0) - s["base_rss"] > self.max_bytes:
+                        failure = f"exceeded {self.max_bytes // (1024 * 1024)} MB memory budget"
+                    if failure is None:
+                        continue
+                    self._kill(s)
+                    slots[slots.index(s)] = None
+                    buffered[idx].append(("failed", failure))
+                    finished.add(idx)
+        finally:
+            for s in slots:
+                if s is None:
+                    continue
+                try:
+                    s["conn"].send(None)
+                    s["proc"].join(1)
+                except Exception:
+                    pass
+                if s["proc"] is not None and s["proc"].is_alive():
+                    self._kill(s)
+                else:
+                    s["conn"].close()
+
+
+# ===== Embedding cache =====
+class EmbeddingCache:
+    """Append-only float16 embedding store keyed by content hash.
+
+    Vectors live in ``vectors.f16`` (raw rows, memory-mapped on read) and the
+    row keys in ``keys.txt`` (one hash per line, same order), both inside the
+    generation directory named by ``meta.json``. Appends touch only the tails
+    of both files; ``compact`` writes the live rows to a new generation and
+    publishes it by replacing ``meta.json``, so the pair switches together.
+    """
+
+    VERSION = 1
+
+    def __init__(self, directory: Path, model_name: str):
+        self.directory = Path(directory)
+        self.model_name = model_name
+        self._meta_file = self.directory / "meta.json"
+        self._use(self.directory)
+        self.dim: Optional[int] = None
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._mmap = None
+        self._load()
+
+    def _use(self, gen_dir: Path):
+        self._gen_dir = gen_dir
+        self._vec_file = gen_dir / "vectors.f16"
+        self._key_file = gen_dir / "keys.txt"
+
+    def _load(self):
+        try:
+            meta = json.loads(self._meta_file.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        if meta.get("version") != self.VERSION or meta.get("model") != self.model_name:
+            return
+        self.dim = int(meta["dim"])
+        # Caches written before generations kept their files beside meta.json
+        self._use(self.directory / meta["dir"] if meta.get("dir") else self.directory)
+        keys = self._key_file.read_text(encoding="utf-8").split() if self._key_file.exists() else []
+        n_vec = (self._vec_file.stat().st_size // (2 * self.dim)) if self._vec_file.exists() else 0
+        # A crash between the two appends leaves one file longer; trust the shorter one
+        self._keys = keys[: min(len(keys), n_vec)]
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def rows(self, keys: List[str]) -> List[int]:
+        return [self._rows[k] for k in keys]
+
+    def matrix(self):
+        """Memory-mapped ``(rows, dim)`` float16 view of every cached vector."""
+        if not self._keys:
+            return None
+        if self._mmap is None or self._mmap.shape[0] != len(self._keys):
+            self._mmap = np.memmap(self._vec_file, dtype=np.float16, mode="r", shape=(len(self._keys), self.dim))
+        return self._mmap
+
+    def append(self, keys: List[str], vectors):
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if not keys:
+            return
+        if self.dim is None or not self._keys:
+            self._reset(vectors.shape[1])
+        self._mmap = None
+        with open(self._vec_file, "r+b") as fh:
+            fh.seek(len(self._keys) * 2 * self.dim)
+            fh.write(vectors.tobytes())
+            fh.truncate()
+        with open(self._key_file, "a", encoding="utf-8") as fh:
+            fh.write("".join(k + "\n" for k in keys))
+        for k in keys:
+            self._rows[k] = len(self._keys)
+            self._keys.append(k)
+
+    def compact(self, live: set):
+        """Drop rows whose keys are no longer referenced by any document."""
+        keep = [i for i, k in enumerate(self._keys) if k in live]
+        if len(keep) == len(self._keys):
+            return
+        mat = self.matrix()
+        kept = np.ascontiguousarray(mat[keep]) if keep else np.zeros((0, self.dim), dtype=np.float16)
+        keys = [self._keys[i] for i in keep]
+        self._mmap = mat = None
+        self._publish(kept.tobytes(), keys)
+        print(f"🧹 Compacted embedding cache: {len(self._keys)} → {len(keys)} rows")
+        self._keys = keys
+        self._rows = {k: i for i, k in enumerate(keys)}
+
+    def _reset(self, dim: int):
+        self.dim = int(dim)
+        self._keys, self._rows, self._mmap = [], {}, None
+        self._publish(b"", [])
+
+    def _publish(self, vectors: bytes, keys: List[str]):
+        """Write a new generation holding ``vectors`` and ``keys`` and switch ``meta.json`` to it.
+
+        Until ``meta.json`` is replaced a crash leaves the previous generation
+        in use, so the vector and key files never disagree about row order.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"gen-{os.urandom(6).hex()}"
+        gen_dir = self.directory / name
+        gen_dir.mkdir()
+        (gen_dir / "vectors.f16").write_bytes(vectors)
+        (gen_dir / "keys.txt").write_text("".join(k + "\n" for k in keys), encoding="utf-8")
+        meta = {"version": self.VERSION, "model": self.model_name, "dim": self.dim, "dir": name}
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self._meta_file)
+        self._use(gen_dir)
+        import shutil
+        for child in self.directory.iterdir():
+            if child.is_dir() and child.name != name:
+                shutil.rmtree(child, ignore_errors=True)
+            elif child.name in ("vectors.f16", "keys.txt"):
+                child.unlink()  # files of the pre-generation layout
+
+
+class EmbeddingMatrix:
+    """Unit-normalised embedding rows held as float32, float16 or int8.
+
+    int8 rows carry a float32 scale each (``row ≈ q * scale``), so a query
+    scores ``(q_rows @ qvec) * scales`` without dequantizing the matrix; the
+    scan converts ``BLOCK`` rows at a time. ``rerank`` re-scores a short list
+    of candidates against the full-precision source rows (the memory-mapped
+    embedding cache), which recovers the exact order among the hits.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    # Rows converted per step: small enough to stay in cache, so int8 scans as fast as float32
+    # (NumPy's float16 -> float32 conversion is slow, which makes float16 the slowest to scan)
+    BLOCK = 4096
+
+    def __init__(self, data, scales=None, source=None, source_rows=None):
+        self.data = data
+        self.scales = scales
+        self.source = source
+        self.source_rows = source_rows
+
+    @classmethod
+    def build(cls, vectors, rows=None, dtype: str = "float16") -> "EmbeddingMatrix":
+        """Normalise and quantize ``vectors[rows]`` (every row by default) block by block."""
+        if dtype not in cls.DTYPES:
+            raise ValueError(f"unknown embedding dtype: {dtype}")
+        rows = np.arange(len(vectors)) if rows is None else np.asarray(rows, dtype=np.int64)
+        data = np.empty((len(rows), vectors.shape[1]), dtype=np.int8 if dtype == "int8" else dtype)
+        scales = np.empty(len(rows), dtype=np.float32) if dtype == "int8" else None
+        for lo in range(0, len(rows), cls.BLOCK):
+            block = np.asarray(vectors[rows[lo:lo + cls.BLOCK]], dtype=np.float32)
+            block /= np.linalg.norm(block, axis=1, keepdims=True) + 1e-9
+            if scales is None:
+                data[lo:lo + cls.BLOCK] = block
+            else:
+                scale = np.abs(block).max(axis=1) / 127.0 + 1e-12
+                data[lo:lo + cls.BLOCK] = np.rint(block / scale[:, None])
+                scales[lo:lo + cls.BLOCK] = scale
+        return cls(data, scales, vectors, rows)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self) -> str:
+        return self.data.dtype.name
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def retain(self, keep) -> "EmbeddingMatrix":
+        """A matrix of just the rows where ``keep`` is True, as already quantized."""
+        keep = np.asarray(keep, dtype=bool)
+        return EmbeddingMatrix(
+            self.data[keep],
+            None if self.scales is None else self.scales[keep],
+            self.source,
+            None if self.source_rows is None else self.source_rows[keep],
+        )
+
+    def __getitem__(self, rows):
+        """Dequantized float32 rows."""
+        block = np.asarray(self.data[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None] if block.ndim == 2 else self.scales[rows]
+        return block
+
+    def scores(self, qvec, rows=None):
+        """Approximate cosine of ``qvec`` (unit float32) with every row, or with ``rows``.
+
+        ``qvec`` may also be a ``(queries, dim)`` batch; the result is then ``(queries, rows)``.
+        """
+        if self.data.dtype == np.float32:
+            data = self.data if rows is None else self.data[rows]
+            return (data @ qvec.T).T
+        q = np.atleast_2d(qvec)
+        n = len(self.data) if rows is None else len(rows)
+        out = np.empty((len(q), n), dtype=np.float32)
+        for lo in range(0, n, self.BLOCK):
+            sel = slice(lo, lo + self.BLOCK) if rows is None else rows[lo:lo + self.BLOCK]
+            out[:, lo:lo + self.BLOCK] = (self.data[sel].astype(np.float32) @ q.T).T
+            if self.scales is not None:
+                out[:, lo:lo + self.BLOCK] *= self.scales[sel]
+        return out if qvec.ndim == 2 else out[0]
+
+    def rerank(self, qvec, rows, k: int):
+        """Best ``k`` of the candidate ``rows``, re-scored at full precision, best first."""
+        if self.source is None or self.data.dtype == np.float32:
+            sims = self.scores(qvec, rows)
+        else:
+            vecs = np.asarray(self.source[self.source_rows[rows]], dtype=np.float32)
+            sims = (vecs @ qvec) / (np.linalg.norm(vecs, axis=1) + 1e-9)
+        top = top_k_indices(sims, k)
+        return rows[top], sims[top]
+
+
+# ===== Approximate nearest neighbours =====
+class IVFIndex:
+    """Inverted-file ANN index over unit-normalised embedding rows.
+
+    Spherical k-means splits the rows into ``~4*sqrt(N)`` lists around unit
+    centroids. A query scores the centroids, then scans only the rows of the
+    ``nprobe`` closest lists, so more probes trade latency for recall (see
+    bench_ann.py). Lists are keyed by embedding key: rows added later join
+    their nearest existing centroid, and the centroids are retrained once the
+    corpus has doubled since they were fit.
+    """
+
+    VERSION = 1
+    # "auto" mode switches from brute force to the index at this many rows
+    MIN_ROWS = 20_000
+    REBUILD_GROWTH = 2.0
+    TRAIN_PER_LIST = 32
+    BLOCK = 8192
+
+    def __init__(self, directory: Path, nprobe: int = 16):
+        self.directory = Path(directory)
+        self.nprobe = nprobe
+        self.centroids = None
+        self.keys: List[str] = []
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.trained_n = 0
+        self._order = None
+        self._offsets = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    # ``matrix`` below is an EmbeddingMatrix: indexing yields float32 rows, ``scores`` scans it quantized
+    def _nearest(self, matrix, rows=None):
+        """Nearest centroid of each row (all rows by default), scored in blocks."""
+        n = matrix.shape[0] if rows is None else len(rows)
+        out = np.empty(n, dtype=np.int32)
+        ct = self.centroids.T
+        for lo in range(0, n, self.BLOCK):
+            sel = slice(lo, lo + self.BLOCK) if rows is None else rows[lo:lo + self.BLOCK]
+            out[lo:lo + self.BLOCK] = np.argmax(np.asarray(matrix[sel], dtype=np.float32) @ ct, axis=1)
+        return out
+
+    def build(self, matrix, keys: List[str], n_lists: Optional[int] = None, iters: int = 8, seed: int = 0):
+        n = matrix.shape[0]
+        n_lists = max(1, min(n, n_lists or int(round(4 * np.sqrt(n)))))
+        rng = np.random.default_rng(seed)
+        train = np.asarray(matrix[np.sort(rng.choice(n, min(n, n_lists * self.TRAIN_PER_LIST), replace=False))],
+                           dtype=np.float32)
+        self.centroids = train[rng.choice(len(train), n_lists, replace=False)].copy()
+        for _ in range(iters):
+            labels = self._nearest(train)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, train)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            # Re-seed empty lists from random training rows
+            sums[empty] = train[rng.choice(len(train), int(empty.sum()))]
+            norms[empty] = 1.0
+            self.centroids = (sums / norms[:, None]).astype(np.float32)
+        self.keys = list(keys)
+        self.assign = self._nearest(matrix)
+        self.trained_n = n
+        self._index_lists()
+
+    def sync(self, matrix, keys: List[str]) -> bool:
+        """Match the lists to ``keys`` (the rows of ``matrix``); True if the centroids were retrained."""
+        if self.centroids is None or self.centroids.shape[1] != matrix.shape[1] or (
+            len(keys) > self.REBUILD_GROWTH * self.trained_n
+        ):
+            self.build(matrix, keys)
+            return True
+        if keys == self.keys:
+            return False
+        known = dict(zip(self.keys, self.assign.tolist()))
+        assign = np.fromiter((known.get(k, -1) for k in keys), dtype=np.int32, count=len(keys))
+        new = np.flatnonzero(assign < 0)
+        if len(new):
+            assign[new] = self._nearest(matrix, new)
+        self.keys, self.assign = list(keys), assign
+        self._index_lists()
+        return False
+
+    def _index_lists(self):
+        self._order = np.argsort(self.assign, kind="stable").astype(np.int64)
+        self._offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.assign, minlength=len(self.centroids)), out=self._offsets[1:])
+        self._dirty = True
+
+    def search(self, matrix, qvec, k: int, nprobe: Optional[int] = None, allowed=None):
+        """Rows and cosine scores of (approximately) the ``k`` nearest rows; ``qvec`` must be unit length.
+
+        ``allowed`` (a boolean row mask) drops rows from the probed lists before they are scored.
+        """
+        probe = top_k_indices(self.centroids @ qvec, nprobe or self.nprobe)
+        rows = np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe.tolist()])
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        if not len(rows):
+            return rows, np.zeros(0, dtype=np.float32)
+        rows.sort()  # sequential gathers from the (possibly memory-mapped) matrix
+        sims = matrix.scores(qvec, rows)
+        top = top_k_indices(sims, k)
+        return rows[top], sims[top]
+
+    def save(self):
+        if not self._dirty or self.centroids is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"ivf-{os.urandom(6).hex()}"
+        out = self.directory / name
+        out.mkdir()
+        np.save(out / "centroids.npy", self.centroids)
+        np.save(out / "assign.npy", self.assign)
+        (out / "keys.txt").write_text("\n".join(self.keys), encoding="utf-8")
+        meta = {"version": self.VERSION, "dir": name, "rows": len(self.keys), "trained_n": self.trained_n}
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.directory / "meta.json")
+        import shutil
+        for child in self.directory.iterdir():
+            if child.is_dir() and child.name != name:
+                shutil.rmtree(child, ignore_errors=True)
+        self._dirty = False
+
+    def load(self) -> bool:
+        try:
+            meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+            if meta.get("version") != self.VERSION:
+                return False
+            src = self.directory / meta["dir"]
+            centroids = np.load(src / "centroids.npy")
+            assign = np.load(src / "assign.npy")
+            keys = (src / "keys.txt").read_text(encoding="utf-8").split("\n") if meta["rows"] else []
+        except Exception:
+            return False
+        if len(keys) != len(assign):
+            return False
+        self.centroids, self.assign, self.keys = centroids, assign, keys
+        self.trained_n = meta["trained_n"]
+        self._index_lists()
+        self._dirty = False
+        return True
+
+
+# ===== Incremental TF-IDF =====
+class IncrementalTfidfIndex:
+    """Hashed TF-IDF index that grows by appending instead of refitting.
+
+    Term counts come from a stateless ``HashingVectorizer``, so adding
+    documents never changes existing rows. Rows live in CSR segments, one per
+    append, so a segment's size follows its rows rather than the hash space;
+    document frequencies are a running count of column hits, and IDF is
+    applied at query time. Each row's norm is
+    computed with the IDF current when it was added, and a background pass
+    re-normalises all rows (and merges segments) once the corpus has drifted.
+    Segments are saved as separate files, so a save only writes what changed.
+    """
+
+    VERSION = 3
+    N_FEATURES = 1 << 20
+    # Re-normalise once the corpus size moved this much since the last pass
+    RENORM_DRIFT = 0.1
+    MAX_SEGMENTS = 16
+
+    def __init__(self, directory: Path, params: Dict[str, Any]):
+        self.directory = Path(directory)
+        self.params = params
+        self._hv = HashingVectorizer(
+            n_features=self.N_FEATURES, alternate_sign=False, norm=None, dtype=np.float32, **params
+        )
+        self.keys: List[str] = []
+        # Each segment: {"name", "matrix" (CSR counts), "norms", "keys", "norms_dirty"},
+        # plus "terms" once searched (see _term_view)
+        self._segments: List[Dict[str, Any]] = []
+        self.df = np.zeros(self.N_FEATURES, dtype=np.int64)
+        self._idf: Optional[np.ndarray] = None
+        self._norm_n = 0  # corpus size the current norms were computed for
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._renorm_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    # ---------- updates ----------
+    def idf(self) -> np.ndarray:
+        with self._lock:
+            if self._idf is None:
+                n = len(self.keys)
+                # Same smoothing as sklearn's TfidfVectorizer
+                self._idf = (np.log((1.0 + n) / (1.0 + self.df)) + 1.0).astype(np.float32)
+            return self._idf
+
+    @staticmethod
+    def _row_norms(counts, idf: np.ndarray) -> np.ndarray:
+        weighted = counts.multiply(idf[np.newaxis, :]) if counts.shape[0] else counts
+        return np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel()).astype(np.float32)
+
+    def append(self, keys: List[str], texts: List[str]):
+        if not keys:
+            return
+        counts = self._hv.transform(texts).tocsr()
+        counts.sum_duplicates()
+        with self._lock:
+            self.df += np.bincount(counts.indices, minlength=self.N_FEATURES)
+            self.keys.extend(keys)
+            self._idf = None
+            self._segments.append({
+                "name": None,
+                "matrix": counts,
+                "norms": self._row_norms(counts, self.idf()),
+                "keys": list(keys),
+                "norms_dirty": True,
+            })
+            if not self._norm_n:
+                self._norm_n = len(self.keys)
+            self._dirty = True
+
+    def retain(self, keep: np.ndarray):
+        """Drop the rows where ``keep`` is False, preserving order."""
+        with self._lock:
+            segments, offset = [], 0
+            for seg in self._segments:
+                n = seg["matrix"].shape[0]
+                part = keep[offset:offset + n]
+                offset += n
+                if part.all():
+                    segments.append(seg)
+                    continue
+                gone = seg["matrix"][~part]
+                self.df -= np.bincount(gone.indices, minlength=self.N_FEATURES)
+                if not part.any():
+                    continue
+                segments.append({
+                    "name": None,
+                    "matrix": seg["matrix"][part],
+                    "norms": seg["norms"][part],
+                    "keys": [k for k, kept in zip(seg["keys"], part) if kept],
+                    "norms_dirty": True,
+                })
+            self._segments = segments
+            self.keys = [k for seg in segments for k in seg["keys"]]
+            self._idf = None
+            self._dirty = True
+
+    def sync(self, keys: List[str], texts_for) -> Tuple[int, int]:
+        """Make the rows match ``keys``; ``texts_for(rows)`` supplies text for new ones.
+
+        Rows only ever disappear or get appended (as in ``DocumentTable``), so
+        one pass keeps every surviving row and vectorizes only the rest.
+        Returns ``(added, removed)``.
+        """
+        with self._lock:
+            if self.keys == keys:
+                return 0, 0
+            keep = np.zeros(len(self.keys), dtype=bool)
+            j = 0
+            for i, key in enumerate(self.keys):
+                if j < len(keys) and key == keys[j]:
+                    keep[i] = True
+                    j += 1
+            removed = int(len(keep) - keep.sum())
+            if removed:
+                self.retain(keep)
+            new_rows = list(range(j, len(keys)))
+            self.append([keys[r] for r in new_rows], texts_for(new_rows) if new_rows else [])
+            return len(new_rows), removed
+
+    # ---------- scoring ----------
+    @staticmethod
+    def _term_view(seg: Dict[str, Any]):
+        """``(terms, counts by term)``: a column-major copy of a segment over just the terms it contains.
+
+        Built on first search and kept with the (immutable) segment; a query
+        then reads only its own terms' postings instead of every row.
+        """
+        view = seg.get("terms")
+        if view is None:
+            from scipy import sparse
+            m = seg["matrix"]
+            used = np.bincount(m.indices, minlength=m.shape[1]) > 0
+            terms = np.flatnonzero(used)
+            local = (np.cumsum(used, dtype=np.int32) - 1)[m.indices]
+            by_term = sparse.csr_matrix((m.data, local, m.indptr), shape=(m.shape[0], len(terms))).tocsc()
+            view = seg["terms"] = (terms, by_term)
+        return view
+
+    def scores(self, query: str) -> np.ndarray:
+        """Cosine similarity of ``query`` to every row, in row order."""
+        return self.scores_many([query])[0]
+
+    def scores_many(self, queries: List[str], rows=None) -> np.ndarray:
+        """Cosine similarity of each query to every row: one sparse product per segment.
+
+        Returns a dense ``(len(queries), rows)`` array, so callers batch long query lists.
+        With ``rows`` (sorted row numbers) only those rows are scored, in that order.
+        """
+        q = self._hv.transform(queries).tocsr()
+        q.sum_duplicates()
+        with self._lock:
+            segments = list(self._segments)
+            idf = self.idf()
+        total = sum(s["matrix"].shape[0] for s in segments)
+        out = np.zeros((len(queries), total if rows is None else len(rows)), dtype=np.float32)
+        if not q.nnz or not out.shape[1]:
+            return out
+        cols = np.unique(q.indices)
+        qw = q[:, cols].multiply(idf[cols]).tocsr()
+        qnorm = np.sqrt(np.asarray(qw.multiply(qw).sum(axis=1)).ravel())
+        w = qw.multiply(idf[cols]).T.tocsr()
+        offset = pos = 0
+        for seg in segments:
+            n = seg["matrix"].shape[0]
+            terms, by_term = self._term_view(seg)
+            at = np.minimum(np.searchsorted(terms, cols), max(len(terms) - 1, 0))
+            present = np.flatnonzero(terms[at] == cols) if len(terms) else at[:0]
+            sub, norms = by_term[:, at[present]], seg["norms"]
+            if rows is not None:
+                local = rows[(rows >= offset) & (rows < offset + n)] - offset
+                sub, norms = sub.tocsr()[local], norms[local]
+            dots = (sub @ w[present]).toarray().T
+            out[:, pos:pos + dots.shape[1]] = dots / (np.maximum(norms, 1e-12) * np.maximum(qnorm, 1e-12)[:, None])
+            offset += n
+            pos += dots.shape[1]
+        return out
+
+    # ---------- background re-normalisation ----------
+    def maybe_renormalise(self):
+        with self._lock:
+            if self._renorm_thread is not None and self._renorm_thread.is_alive():
+                return
+            n = len(self.keys)
+            drift = abs(n - self._norm_n) > self.RENORM_DRIFT * max(self._norm_n, 1)
+            if not (drift or len(self._segments) > self.MAX_SEGMENTS) or not n:
+                return
+            self._renorm_thread = threading.Thread(target=self._renormalise, name="tfidf-renorm", daemon=True)
+            self._renorm_thread.start()
+
+    def _renormalise(self):
+        from scipy import sparse
+        with self._lock:
+            snapshot = list(self._segments)
+            idf = self.idf()
+            n = len(self.keys)
+        try:
+            merged = sparse.vstack([s["matrix"] for s in snapshot], format="csr")
+            norms = self._row_norms(merged, idf)
+        except Exception as e:
+            print(f"⚠️  TF-IDF re-normalisation failed: {e}")
+            return
+        with self._lock:
+            # Appends made meanwhile sit after the snapshot and keep their own norms
+            if len(self._segments) < len(snapshot) or any(
+                a is not b for a, b in zip(self._segments, snapshot)
+            ):
+                return
+            rest = self._segments[len(snapshot):]
+            self._segments = [{
+                "name": None,
+                "matrix": merged,
+                "norms": norms,
+                "keys": [k for s in snapshot for k in s["keys"]],
+                "norms_dirty": True,
+            }] + rest
+            self._norm_n = n
+            self._dirty = True
+
+    # ---------- persistence ----------
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for seg in self._segments:
+                if seg["name"] is None:
+                    seg["name"] = f"seg-{os.urandom(6).hex()}"
+                    seg_dir = self.directory / seg["name"]
+                    seg_dir.mkdir()
+                    m = seg["matrix"]
+                    np.save(seg_dir / "data.npy", np.asarray(m.data, dtype=np.float32))
+                    # scipy keeps mmapped index arrays only when both share one dtype
+                    np.save(seg_dir / "indices.npy", np.asarray(m.indices, dtype=m.indptr.dtype))
+                    np.save(seg_dir / "indptr.npy", np.asarray(m.indptr))
+                    (seg_dir / "keys.txt").write_text("\n".join(seg["keys"]), encoding="utf-8")
+                if seg["norms_dirty"]:
+                    np.save(self.directory / seg["name"] / "norms.npy", seg["norms"])
+                    seg["norms_dirty"] = False
+            meta = {
+                "version": self.VERSION,
+                "params": self.params,
+                "n_features": self.N_FEATURES,
+                "norm_n": self._norm_n,
+                "segments": [[seg["name"], seg["matrix"].shape[0]] for seg in self._segments],
+            }
+            tmp = self.directory / "meta.json.tmp"
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, self.directory / "meta.json")
+            live = {seg["name"] for seg in self._segments}
+            import shutil
+            for child in self.directory.iterdir():
+                if child.is_dir() and child.name not in live:
+                    shutil.rmtree(child, ignore_errors=True)
+                elif child.is_file() and child.name != "meta.json":
+                    child.unlink()  # files of the previous (pre-segment) sidecar layout
+            self._dirty = False
+
+    def load(self) -> bool:
+        from scipy import sparse
+        try:
+            meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+        except Exception:
+            return False
+        if (
+            meta.get("version") != self.VERSION
+            or meta.get("n_features") != self.N_FEATURES
+            or meta.get("params") != json.loads(json.dumps(self.params))
+        ):
+            return False
+        try:
+            segments = []
+            for name, rows in meta["segments"]:
+                seg_dir = self.directory / name
+                arrays = {a: np.load(seg_dir / f"{a}.npy", mmap_mode="r") for a in ("data", "indices", "indptr")}
+                keys = (seg_dir / "keys.txt").read_text(encoding="utf-8").split("\n") if rows else []
+                segments.append({
+                    "name": name,
+                    "matrix": sparse.csr_matrix(
+                        (arrays["data"], arrays["indices"], arrays["indptr"]), shape=(rows, self.N_FEATURES)
+                    ),
+                    "norms": np.load(seg_dir / "norms.npy"),
+                    "keys": keys,
+                    "norms_dirty": False,
+                })
+        except Exception as e:
+            print(f"⚠️  Failed to load TF-IDF index: {e}")
+            return False
+        with self._lock:
+            self._segments = segments
+            self.keys = [k for seg in segments for k in seg["keys"]]
+            self.df = np.zeros(self.N_FEATURES, dtype=np.int64)
+            for seg in segments:
+                self.df += np.bincount(seg["matrix"].indices, minlength=self.N_FEATURES)
+            self._idf = None
+            self._norm_n = meta.get("norm_n", len(self.keys))
+            self._dirty = False
+        return True
+
+
+# ===== Ranking =====
+# Reciprocal-rank fusion constant: damps the weight of the very top ranks (Cormack et al. use 60)
+RRF_K = 60
+# Candidates each engine contributes to fusion; deeper ranks add almost nothing at RRF_K=60
+FUSION_DEPTH = 100
+
+
+def top_k_indices(scores, k: int):
+    """Indices of the ``k`` largest scores, best first: argpartition, then a sort of just those.
+
+    A 2-D ``scores`` is ranked row by row (one row per query).
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1)
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Fuse best-first row rankings: ``(rows, scores)`` with score = sum of 1 / (k + rank).
+
+    Ranks are comparable across engines where raw scores are not (cosine,
+    TF-IDF and BM25 live on different scales), so no calibration is needed.
+    Only rows that appear in some ranking are scored.
+    """
+    rows = np.concatenate(rankings)
+    weights = np.concatenate([1.0 / (k + 1 + np.arange(len(r))) for r in rankings])
+    fused_rows, inverse = np.unique(rows, return_inverse=True)
+    return fused_rows, np.bincount(inverse, weights=weights, minlength=len(fused_rows))
+
+
+# ===== BM25 inverted index =====
+class BM25Index:
+    """Inverted index with BM25 scoring and MaxScore top-k that needs only NumPy.
+
+    Postings are compact arrays: a frozen *base* (CSR over term ids with
+    int32 doc numbers and uint16 term frequencies, memory-mapped once saved)
+    plus an in-memory *tail* for documents appended since. Doc numbers grow
+    in insertion order, so every posting list is sorted and a document's row
+    is its rank among live doc numbers. Deletes flip a live flag and adjust
+    the statistics; the tail is folded into a fresh base (dropping dead
+    documents) once it outgrows a quarter of the base or deletes pile up.
+
+    Saving appends: the tail's postings, document lengths and deleted doc
+    numbers go to raw append-only logs beside the base, so a save costs the
+    documents changed since the last one. The per-term statistics (df and
+    score bounds) are checkpointed only once replaying the log written since
+    the previous checkpoint would cost more than rewriting them; loading
+    replays that log on top of the checkpoint.
+    """
+
+    VERSION = 2
+    K1 = 1.2
+    B = 0.75
+    TOKEN = re.compile(r"(?u)\b[A-Za-z][A-Za-z0-9_\-]{2,}\b")
+    # Fold the tail into the base past this share of postings (or of dead docs)
+    COMPACT_RATIO = 0.25
+    # Checkpoint term statistics once the log to replay outgrows this share of the vocabulary
+    CHECKPOINT_RATIO = 1.0
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.term_ids: Dict[str, int] = {}
+        self.term_names: List[str] = []
+        self.keys: List[str] = []  # live documents' keys, in row order
+        self._doc_keys: List[str] = []  # per doc number, dead ones included
+        self.doc_len = array("i")
+        self.alive = bytearray()
+        self.df = array("i")
+        self.max_tf = array("H")
+        self.min_len = array("i")
+        self.n_live = 0
+        self.total_len = 0
+        self._base_name: Optional[str] = None
+        self._set_base(
+            np.zeros(1, np.int64), np.zeros(0, np.int32), np.zeros(0, np.uint16),
+            np.zeros(1, np.int64), np.zeros(0, np.int32),
+        )
+        self._tail: Dict[int, Tuple[array, array]] = {}
+        self._tail_fwd: List[array] = []
+        self._tail_fwd_tf: List[array] = []  # term frequencies, parallel to _tail_fwd
+        self._tail_postings = 0
+        self._dead_docs = array("i")  # doc numbers deleted since the base was built
+        self._saved_terms = 0
+        self._saved_docs = 0
+        self._saved_tail = 0  # tail postings in the log, in doc order
+        self._saved_dead = 0
+        self._checkpoint: Optional[Dict[str, Any]] = None
+        self._dirty = False
+        self._rows = None
+
+    def __len__(self) -> int:
+        return self.n_live
+
+    def _set_base(self, ptr, docs, tf, fptr, fterms):
+        self._b_ptr, self._b_docs, self._b_tf = ptr, docs, tf
+        self._b_fptr, self._b_fterms = fptr, fterms
+        self._base_docs = len(fptr) - 1
+
+    # ---------- updates ----------
+    def _term_id(self, term: str) -> int:
+        tid = self.term_ids.get(term)
+        if tid is None:
+            tid = self.term_ids[term] = len(self.term_names)
+            self.term_names.append(term)
+            self.df.append(0)
+            self.max_tf.append(0)
+            self.min_len.append(2 ** 31 - 1)
+        return tid
+
+    def append(self, keys: List[str], texts: List[str]):
+        for key, text in zip(keys, texts):
+            counts: Dict[int, int] = defaultdict(int)
+            for token in self.TOKEN.findall(text.lower()):
+                counts[self._term_id(token)] += 1
+            doc = len(self._doc_keys)
+            length = sum(counts.values())
+            fwd = array("i", counts.keys())
+            fwd_tf = array("H", (min(tf, 65535) for tf in counts.values()))
+            for tid, tf in zip(fwd, fwd_tf):
+                posting = self._tail.get(tid)
+                if posting is None:
+                    posting = self._tail[tid] = (array("i"), array("H"))
+                posting[0].append(doc)
+                posting[1].append(tf)
+                self.df[tid] += 1
+                if tf > self.max_tf[tid]:
+                    self.max_tf[tid] = tf
+                if length < self.min_len[tid]:
+                    self.min_len[tid] = length
+            self._tail_postings += len(fwd)
+            self._tail_fwd.append(fwd)
+            self._tail_fwd_tf.append(fwd_tf)
+            self._doc_keys.append(key)
+            self.keys.append(key)
+            self.doc_len.append(length)
+            self.alive.append(1)
+            self.n_live += 1
+            self.total_len += length
+        if keys:
+            self._rows = None
+            self._dirty = True
+
+    def _forward(self, doc: int) -> np.ndarray:
+        if doc < self._base_docs:
+            return np.asarray(self._b_fterms[self._b_fptr[doc]:self._b_fptr[doc + 1]])
+        return np.frombuffer(self._tail_fwd[doc - self._base_docs], dtype=np.int32)
+
+    def retain(self, keep: np.ndarray):
+        """Drop the live rows where ``keep`` is False."""
+        live = np.flatnonzero(np.frombuffer(self.alive, dtype=np.uint8))
+        df = np.frombuffer(self.df, dtype=np.int32)
+        for doc in live[~keep].tolist():
+            self.alive[doc] = 0
+            np.subtract.at(df, self._forward(doc), 1)
+            self.total_len -= self.doc_len[doc]
+            self.n_live -= 1
+            self._dead_docs.append(doc)
+        self.keys = [k for k, kept in zip(self.keys, keep) if kept]
+        self._rows = None
+        self._dirty = True
+
+    def sync(self, keys: List[str], texts_for) -> Tuple[int, int]:
+        """Make the live rows match ``keys`` (see ``IncrementalTfidfIndex.sync``)."""
+        if self.keys == keys:
+            return 0, 0
+        keep = np.zeros(len(self.keys), dtype=bool)
+        j = 0
+        for i, key in enumerate(self.keys):
+            if j < len(keys) and key == keys[j]:
+                keep[i] = True
+                j += 1
+        removed = int(len(keep) - keep.sum())
+        if removed:
+            self.retain(keep)
+        new_rows = list(range(j, len(keys)))
+        if new_rows:
+            self.append([keys[r] for r in new_rows], texts_for(new_rows))
+        self.maybe_compact()
+        return len(new_rows), removed
+
+    def maybe_compact(self):
+        total = len(self._b_docs) + self._tail_postings
+        if total and (
+            self._tail_postings > self.COMPACT_RATIO * max(len(self._b_docs), 1)
+            and self._tail_postings > 50_000
+            or len(self._dead_docs) > self.COMPACT_RATIO * max(len(self._doc_keys), 1)
+        ):
+            self.compact()
+
+    def compact(self):
+        """Fold the tail into a new base, renumbering live documents and dropping dead ones."""
+        n_terms = len(self.term_names)
+        b_terms = np.repeat(np.arange(len(self._b_ptr) - 1, dtype=np.int32), np.diff(self._b_ptr))
+        parts_t, parts_d, parts_f = [b_terms], [np.asarray(self._b_docs)], [np.asarray(self._b_tf)]
+        for tid, (docs, tfs) in self._tail.items():
+            parts_t.append(np.full(len(docs), tid, dtype=np.int32))
+            parts_d.append(np.frombuffer(docs, dtype=np.int32))
+            parts_f.append(np.frombuffer(tfs, dtype=np.uint16))
+        terms, docs, tfs = np.concatenate(parts_t), np.concatenate(parts_d), np.concatenate(parts_f)
+        alive = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        live = alive[docs]
+        terms, docs, tfs = terms[live], docs[live], tfs[live]
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        docs = remap[docs].astype(np.int32)
+        order = np.lexsort((docs, terms))
+        ptr = np.zeros(n_terms + 1, np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=ptr[1:])
+        fwd = np.lexsort((terms, docs))
+        n_docs = int(alive.sum())
+        fptr = np.zeros(n_docs + 1, np.int64)
+        np.cumsum(np.bincount(docs, minlength=n_docs), out=fptr[1:])
+        self._set_base(ptr, docs[order], tfs[order], fptr, terms[fwd])
+        self._base_name = None
+        self._tail, self._tail_fwd, self._tail_fwd_tf, self._tail_postings = {}, [], [], 0
+        self._doc_keys = list(self.keys)
+        self.doc_len = array("i", np.frombuffer(self.doc_len, dtype=np.int32)[alive].tobytes())
+        self.alive = bytearray(b"\x01" * n_docs)
+        self._dead_docs = array("i")
+        self._saved_docs = self._saved_tail = self._saved_dead = 0
+        self._checkpoint = None
+        # Exact bounds again (deletes only ever loosen them)
+        max_tf = np.zeros(n_terms, np.uint16)
+        np.maximum.at(max_tf, terms, tfs)
+        min_len = np.full(n_terms, 2 ** 31 - 1, np.int32)
+        np.minimum.at(min_len, terms, np.frombuffer(self.doc_len, dtype=np.int32)[docs])
+        self.max_tf, self.min_len = array("H", max_tf.tobytes()), array("i", min_len.tobytes())
+        self._rows = None
+        self._dirty = True
+
+    # ---------- scoring ----------
+    def _postings(self, tid: int) -> Tuple[np.ndarray, np.ndarray]:
+        if tid < len(self._b_ptr) - 1:
+            lo, hi = self._b_ptr[tid], self._b_ptr[tid + 1]
+            docs, tfs = np.asarray(self._b_docs[lo:hi]), np.asarray(self._b_tf[lo:hi])
+        else:
+            docs, tfs = np.zeros(0, np.int32), np.zeros(0, np.uint16)
+        tail = self._tail.get(tid)
+        if tail is not None:
+            docs = np.concatenate([docs, np.frombuffer(tail[0], dtype=np.int32)])
+            tfs = np.concatenate([tfs, np.frombuffer(tail[1], dtype=np.uint16)])
+        return docs, tfs
+
+    def term_stats(self, query: str) -> Tuple[int, int, Dict[str, int]]:
+        """``(live docs, total length, {query term: df})``: what a shard contributes to global statistics."""
+        df = {}
+        for token in set(self.TOKEN.findall(query.lower())):
+            tid = self.term_ids.get(token)
+            df[token] = int(self.df[tid]) if tid is not None else 0
+        return self.n_live, self.total_len, df
+
+    def top_k(self, query: str, k: int = 10, allowed=None, stats=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and BM25 scores of the best ``k`` documents, best first.
+
+        ``allowed`` (a boolean mask over rows) keeps other documents out of
+        the candidate set; term upper bounds stay valid, so pruning still holds.
+        ``stats`` overrides this index's own ``term_stats`` with corpus-wide
+        ones, which makes scores from several shards directly comparable.
+
+        MaxScore: terms are visited by falling score upper bound. Once the
+        bounds of the terms left cannot lift an unseen document past the
+        current k-th best, remaining (long, low-IDF) posting lists are only
+        probed for the candidates already held, and hopeless candidates are
+        dropped as the bound shrinks.
+        """
+        empty = (np.zeros(0, np.int64), np.zeros(0, np.float32))
+        if not self.n_live or k <= 0:
+            return empty
+        n, total_len, global_df = stats if stats is not None else (self.n_live, self.total_len, None)
+        qtf: Dict[int, int] = defaultdict(int)
+        for token in self.TOKEN.findall(query.lower()):
+            tid = self.term_ids.get(token)
+            if tid is not None and self.df[tid] > 0:
+                qtf[tid] += 1
+        if not qtf:
+            return empty
+        avgdl = total_len / n
+        k1, b = self.K1, self.B
+        tids = np.fromiter(qtf.keys(), dtype=np.int64)
+        weight = np.fromiter(qtf.values(), dtype=np.float64)
+        if global_df is None:
+            df = np.frombuffer(self.df, dtype=np.int32)[tids].astype(np.float64)
+        else:
+            df = np.array([global_df[self.term_names[t]] for t in tids.tolist()], dtype=np.float64)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)) * weight
+        mtf = np.frombuffer(self.max_tf, dtype=np.uint16)[tids].astype(np.float64)
+        mlen = np.frombuffer(self.min_len, dtype=np.int32)[tids].astype(np.float64)
+        ub = idf * mtf * (k1 + 1) / (mtf + k1 * (1 - b + b * mlen / avgdl))
+        order = np.argsort(-ub)
+        remaining = float(ub.sum())
+        dl = np.frombuffer(self.doc_len, dtype=np.int32)
+        alive = np.frombuffer(self.alive, dtype=np.uint8)
+        eligible = alive.astype(bool)
+        if allowed is not None:
+            eligible[np.flatnonzero(eligible)] = allowed
+        cand = np.zeros(0, np.int32)
+        score = np.zeros(0, np.float64)
+        for j in order.tolist():
+            theta = float(np.partition(score, -k)[-k]) if len(score) >= k else 0.0
+            docs, tfs = self._postings(int(tids[j]))
+            if remaining > theta:
+                # Unseen documents can still make the top k: merge the whole list
+                keep = eligible[docs]
+                docs, tfs = docs[keep], tfs[keep].astype(np.float64)
+                s = idf[j] * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * dl[docs] / avgdl))
+                merged, inverse = np.unique(np.concatenate([cand, docs]), return_inverse=True)
+                score = np.bincount(inverse, weights=np.concatenate([score, s]), minlength=len(merged))
+                cand = merged.astype(np.int32)
+            elif len(docs) and len(cand):
+                # Probe only: binary-search the candidates in this sorted list
+                pos = np.minimum(np.searchsorted(docs, cand), len(docs) - 1)
+                hit = docs[pos] == cand
+                tf = tfs[pos[hit]].astype(np.float64)
+                score[hit] += idf[j] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl[cand[hit]] / avgdl))
+            # Clamped: float drift below zero would drop candidates tied with the k-th best
+            remaining = max(remaining - float(ub[j]), 0.0)
+            if len(score) > k:
+                theta = float(np.partition(score, -k)[-k])
+                viable = score + remaining >= theta
+                cand, score = cand[viable], score[viable]
+        if not len(cand):
+            return empty
+        top = top_k_indices(score, k)
+        if self._rows is None:
+            self._rows = np.cumsum(alive, dtype=np.int64) - 1
+        return self._rows[cand[top]], score[top].astype(np.float32)
+
+    # ---------- persistence ----------
+    @staticmethod
+    def _append_raw(path: Path, arr: np.ndarray, count: int):
+        """Append ``arr`` after the first ``count`` items of ``path``, dropping anything an unfinished save left."""
+        with open(path, "a+b") as fh:
+            fh.truncate(count * arr.itemsize)
+            fh.write(arr.tobytes())
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self._base_name is None:
+            name = f"base-{os.urandom(6).hex()}"
+            base_dir = self.directory / name
+            base_dir.mkdir()
+            for arr_name, arr in (
+                ("ptr", self._b_ptr), ("docs", self._b_docs), ("tf", self._b_tf),
+                ("fptr", self._b_fptr), ("fterms", self._b_fterms),
+            ):
+                np.save(base_dir / f"{arr_name}.npy", np.asarray(arr))
+            (base_dir / "doc_keys.txt").write_text("", encoding="utf-8")
+            self._base_name = name
+            self._saved_docs = self._saved_tail = self._saved_dead = 0
+            self._checkpoint = None
+        base_dir = self.directory / self._base_name
+        # Terms and doc keys are append-only between compactions; meta records how many lines count
+        with open(self.directory / "vocab.txt", "a" if self._saved_terms else "w", encoding="utf-8") as fh:
+            fh.writelines(t + "\n" for t in self.term_names[self._saved_terms:])
+        with open(base_dir / "doc_keys.txt", "a", encoding="utf-8") as fh:
+            fh.writelines(k + "\n" for k in self._doc_keys[self._saved_docs:])
+        # Only the documents and deletes since the last save go to the logs
+        new_docs = range(max(self._saved_docs, self._base_docs), len(self._doc_keys))
+        fwd = [self._tail_fwd[d - self._base_docs] for d in new_docs]
+        fwd_tf = [self._tail_fwd_tf[d - self._base_docs] for d in new_docs]
+        tail_docs = np.repeat(np.arange(new_docs.start, new_docs.stop, dtype=np.int32), [len(f) for f in fwd])
+        n_tail = self._saved_tail + len(tail_docs)
+        self._append_raw(base_dir / "tail_docs.bin", tail_docs, self._saved_tail)
+        self._append_raw(base_dir / "tail_terms.bin", np.frombuffer(b"".join(fwd), dtype=np.int32), self._saved_tail)
+        self._append_raw(base_dir / "tail_tf.bin", np.frombuffer(b"".join(fwd_tf), dtype=np.uint16), self._saved_tail)
+        self._append_raw(
+            base_dir / "doc_len.bin", np.frombuffer(self.doc_len, dtype=np.int32)[self._saved_docs:], self._saved_docs
+        )
+        self._append_raw(
+            base_dir / "dead.bin", np.frombuffer(self._dead_docs, dtype=np.int32)[self._saved_dead:], self._saved_dead
+        )
+        cp = self._checkpoint
+        log = (n_tail - cp["tail"]) + (len(self._dead_docs) - cp["dead"]) if cp else 0
+        if cp is None or log > self.CHECKPOINT_RATIO * max(len(self.term_names), 1):
+            cp = {
+                "name": f"stats-{os.urandom(6).hex()}",
+                "terms": len(self.term_names),
+                "docs": len(self._doc_keys),
+                "tail": n_tail,
+                "dead": len(self._dead_docs),
+                "total_len": self.total_len,
+            }
+            (self.directory / cp["name"]).mkdir()
+            for arr_name, arr in (
+                ("df", np.frombuffer(self.df, dtype=np.int32)),
+                ("max_tf", np.frombuffer(self.max_tf, dtype=np.uint16)),
+                ("min_len", np.frombuffer(self.min_len, dtype=np.int32)),
+            ):
+                np.save(self.directory / cp["name"] / f"{arr_name}.npy", arr)
+        meta = {
+            "version": self.VERSION,
+            "base": self._base_name,
+            "n_terms": len(self.term_names),
+            "n_docs": len(self._doc_keys),
+            "n_tail": n_tail,
+            "n_dead": len(self._dead_docs),
+            "checkpoint": cp,
+        }
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.directory / "meta.json")
+        import shutil
+        for child in self.directory.iterdir():
+            if child.is_dir() and child.name not in (self._base_name, cp["name"]):
+                shutil.rmtree(child, ignore_errors=True)
+        self._saved_terms = len(self.term_names)
+        self._saved_docs = len(self._doc_keys)
+        self._saved_tail = n_tail
+        self._saved_dead = len(self._dead_docs)
+        self._checkpoint = cp
+        self._dirty = False
+
+    def load(self) -> bool:
+        try:
+            meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+            if meta.get("version") != self.VERSION:
+                return False
+            cp = meta["checkpoint"]
+            base_dir, cp_dir = self.directory / meta["base"], self.directory / cp["name"]
+            base = [np.load(base_dir / f"{a}.npy", mmap_mode="r") for a in ("ptr", "docs", "tf", "fptr", "fterms")]
+            stats = {a: np.load(cp_dir / f"{a}.npy") for a in ("df", "max_tf", "min_len")}
+            n_docs, n_tail, n_dead = meta["n_docs"], meta["n_tail"], meta["n_dead"]
+            logs = {
+                name: np.fromfile(base_dir / f"{name}.bin", dtype=dtype, count=count)
+                for name, dtype, count in (
+                    ("tail_docs", np.int32, n_tail), ("tail_terms", np.int32, n_tail), ("tail_tf", np.uint16, n_tail),
+                    ("doc_len", np.int32, n_docs), ("dead", np.int32, n_dead),
+                )
+            }
+            with open(self.directory / "vocab.txt", encoding="utf-8") as fh:
+                terms = [line.rstrip("\n") for _, line in zip(range(meta["n_terms"]), fh)]
+            with open(base_dir / "doc_keys.txt", encoding="utf-8") as fh:
+                doc_keys = [line.rstrip("\n") for _, line in zip(range(n_docs), fh)]
+            if len(terms) != meta["n_terms"] or len(doc_keys) != n_docs:
+                return False
+            if any(len(logs[name]) != count for name, count in (("tail_docs", n_tail), ("doc_len", n_docs), ("dead", n_dead))):
+                return False
+        except Exception:
+            return False
+        self._set_base(*base)
+        self._base_name = meta["base"]
+        self.term_names = terms
+        self.term_ids = {t: i for i, t in enumerate(terms)}
+        self._doc_keys = doc_keys
+        self.doc_len = array("i", logs["doc_len"].tobytes())
+        t_terms, t_docs, t_tfs = logs["tail_terms"], logs["tail_docs"], logs["tail_tf"]
+        self._tail = {}
+        self._tail_fwd = [array("i") for _ in range(n_docs - self._base_docs)]
+        self._tail_fwd_tf = [array("H") for _ in range(n_docs - self._base_docs)]
+        for tid, doc, tf in zip(t_terms.tolist(), t_docs.tolist(), t_tfs.tolist()):
+            posting = self._tail.get(tid)
+            if posting is None:
+                posting = self._tail[tid] = (array("i"), array("H"))
+            posting[0].append(doc)
+            posting[1].append(tf)
+            self._tail_fwd[doc - self._base_docs].append(tid)
+            self._tail_fwd_tf[doc - self._base_docs].append(tf)
+        self._tail_postings = n_tail
+        # Term statistics: the checkpoint, then the documents appended and deleted after it
+        n_terms = len(terms)
+        df = np.zeros(n_terms, np.int32)
+        max_tf = np.zeros(n_terms, np.uint16)
+        min_len = np.full(n_terms, 2 ** 31 - 1, np.int32)
+        for arr, saved in ((df, stats["df"]), (max_tf, stats["max_tf"]), (min_len, stats["min_len"])):
+            arr[:len(saved)] = saved
+        dl = logs["doc_len"]
+        after = slice(int(np.searchsorted(t_docs, cp["docs"])), None)
+        np.add.at(df, t_terms[after], 1)
+        np.maximum.at(max_tf, t_terms[after], t_tfs[after])
+        np.minimum.at(min_len, t_terms[after], dl[t_docs[after]])
+        total_len = cp["total_len"] + int(dl[cp["docs"]:].sum())
+        for doc in logs["dead"][cp["dead"]:].tolist():
+            np.subtract.at(df, self._forward(doc), 1)
+            total_len -= int(dl[doc])
+        self.df, self.max_tf, self.min_len = array("i", df.tobytes()), array("H", max_tf.tobytes()), array("i", min_len.tobytes())
+        self._dead_docs = array("i", logs["dead"].tobytes())
+        alive = np.ones(n_docs, dtype=np.uint8)
+        alive[logs["dead"]] = 0
+        self.alive = bytearray(alive.tobytes())
+        self.keys = [k for k, a in zip(doc_keys, alive.tolist()) if a]
+        self.n_live = len(self.keys)
+        self.total_len = total_len
+        # Trailing lines past the recorded counts come from a save that did not finish
+        for path, count in ((self.directory / "vocab.txt", len(terms)), (base_dir / "doc_keys.txt", len(doc_keys))):
+            with open(path, encoding="utf-8") as fh:
+                extra = sum(1 for _ in fh) - count
+            if extra:
+                lines = path.read_text(encoding="utf-8").split("\n")[:count]
+                path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+        self._saved_terms, self._saved_docs = len(terms), len(doc_keys)
+        self._saved_tail, self._saved_dead = n_tail, n_dead
+        self._checkpoint = cp
+        self._rows = None
+        self._dirty = False
+        return True
+
+
+# ===== Sharded search =====
+def _shard_worker(conn, directory: str):
+    """Owns one BM25 shard; answers sync/stats/search/save requests from the parent."""
+    index = BM25Index(Path(directory))
+    index.load()
+    conn.send(("ok", index.keys))
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        op = msg[0]
+        if op == "close":
+            conn.send(("ok", None))
+            break
+        try:
+            if op == "sync":
+                _op, keys, start, texts = msg
+                result = index.sync(keys, lambda rows: [texts[r - start] for r in rows])
+            elif op == "stats":
+                result = [index.term_stats(q) for q in msg[1]]
+            elif op == "search":
+                _op, queries, stats, k, allowed = msg
+                result = [index.top_k(q, k, allowed=allowed, stats=st) for q, st in zip(queries, stats)]
+            elif op == "save":
+                result = index.save()
+            else:
+                raise ValueError(f"unknown request: {op}")
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class ShardedBM25:
+    """BM25 split by content hash across worker processes, one index shard each.
+
+    Queries fan out to every shard at once. A first round collects each
+    shard's document count, length and query-term dfs; the second scores
+    with the summed (corpus-wide) statistics, so shard scores are directly
+    comparable and a global argpartition over the shard top-k lists yields
+    the exact global top-k. Shards persist under ``<directory>/n<shards>``.
+    A shard that dies or fails a request raises ``RuntimeError``.
+    """
+
+    # Documents sent per sync round, bounding the size of one IPC message
+    SYNC_BATCH = 2000
+
+    def __init__(self, directory: Path, shards: int):
+        ctx = _worker_context()
+        self.directory = Path(directory) / f"n{shards}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._procs, self._conns = [], []
+        for i in range(shards):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=_shard_worker, args=(child, str(self.directory / f"shard-{i}")), daemon=True
+            )
+            proc.start()
+            child.close()
+            self._procs.append(proc)
+            self._conns.append(parent)
+        # Parent-side mirror of each shard's keys and the table rows they stand for
+        self._keys: List[List[str]] = [self._recv(conn) for conn in self._conns]
+        self._rows: List[np.ndarray] = [np.zeros(0, dtype=np.int64) for _ in self._conns]
+
+    def __len__(self) -> int:
+        return sum(len(keys) for keys in self._keys)
+
+    @staticmethod
+    def _recv(conn):
+        try:
+            status, payload = conn.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"search shard died ({type(e).__name__})") from e
+        if status != "ok":
+            raise RuntimeError(f"search shard failed: {payload}")
+        return payload
+
+    def _call(self, messages: List[Optional[tuple]]) -> list:
+        """Send each shard its message (None: skip), then gather replies; shards work in parallel."""
+        for conn, msg in zip(self._conns, messages):
+            if msg is not None:
+                try:
+                    conn.send(msg)
+                except OSError as e:
+                    raise RuntimeError(f"search shard died ({type(e).__name__})") from e
+        return [self._recv(conn) if msg is not None else None for conn, msg in zip(self._conns, messages)]
+
+    def sync(self, keys: List[str], texts_for) -> Tuple[int, int]:
+        """Route ``keys`` (table row order) to their shards and sync each; see ``BM25Index.sync``."""
+        n = len(self._conns)
+        parts: List[List[str]] = [[] for _ in range(n)]
+        rows: List[List[int]] = [[] for _ in range(n)]
+        for row, h in enumerate(keys):
+            i = int(h[:8], 16) % n if h else 0
+            parts[i].append(h)
+            rows[i].append(row)
+        added = removed = 0
+        pos: Dict[int, int] = {}
+        for i in range(n):
+            old, new = self._keys[i], parts[i]
+            if old == new:
+                continue
+            j = 0
+            for key in old:
+                if j < len(new) and key == new[j]:
+                    j += 1
+            removed += len(old) - j
+            added += len(new) - j
+            pos[i] = j
+        # Unchanged shards are skipped; large additions go over in rounds of SYNC_BATCH docs,
+        # each a valid sync whose key list extends the previous one
+        pending = list(pos)
+        while pending:
+            messages: List[Optional[tuple]] = [None] * n
+            for i in pending:
+                stop = min(len(parts[i]), pos[i] + self.SYNC_BATCH)
+                messages[i] = ("sync", parts[i][:stop], pos[i], texts_for(rows[i][pos[i]:stop]))
+                pos[i] = stop
+            self._call(messages)
+            pending = [i for i in pending if pos[i] < len(parts[i])]
+        self._keys = parts
+        self._rows = [np.asarray(r, dtype=np.int64) for r in rows]
+        return added, removed
+
+    def top_k_many(self, queries: List[str], k: int, mask=None) -> List[np.ndarray]:
+        """Rows (table order) of the best ``k`` documents for each query; ``mask`` limits the rows."""
+        local = self._call([("stats", queries)] * len(self._conns))
+        stats = []
+        for per_shard in zip(*local):
+            df: Dict[str, int] = defaultdict(int)
+            for _n, _len, shard_df in per_shard:
+                for term, count in shard_df.items():
+                    df[term] += count
+            stats.append((sum(s[0] for s in per_shard), sum(s[1] for s in per_shard), df))
+        if not any(st[0] for st in stats):
+            return [np.zeros(0, dtype=np.int64) for _ in queries]
+        replies = self._call([
+            ("search", queries, stats, k, None if mask is None else mask[rows]) for rows in self._rows
+        ])
+        out = []
+        for q in range(len(queries)):
+            rows = np.concatenate([shard_rows[res[q][0]] for shard_rows, res in zip(self._rows, replies)])
+            scores = np.concatenate([res[q][1] for res in replies])
+            out.append(rows[top_k_indices(scores, k)])
+        return out
+
+    def save(self):
+        self._call([("save",)] * len(self._conns))
+
+    def close(self):
+        for conn, proc in zip(self._conns, self._procs):
+            try:
+                conn.send(("close",))
+                conn.recv()
+            except (EOFError, OSError):
+                pass
+            conn.close()
+            proc.join(5)
+            if proc.is_alive():
+                proc.kill()
+                proc.join(1)
+        self._conns, self._procs = [], []
+
+
+# ===== Passage index =====
 @dataclass
+class Passage:
+    """A window of a document's text that matched a query."""
+
+    document: Any  # KGDocument
+    start: int  # char offsets into the document's full text
+    end: int
+    score: float
+    terms: List[str]  # query terms found in the window
+    matches: List[Tuple[str, int]]  # (term, char offset of its first occurrence)
+    text: str
+
+    def snippet(self, width: int = 160) -> str:
+        """``width`` chars of the window around its first match, whitespace collapsed."""
+        first = min((off for _t, off in self.matches), default=self.start) - self.start
+        lo = max(0, first - width // 3)
+        return " ".join(self.text[lo:lo + width].split())
+
+
+class PassageIndex:
+    """BM25 over fixed-size, overlapping windows of every document's full text.
+
+    The document indexes only see text prefixes; this one covers whole
+    bodies, so matches deep inside long documents are found and located.
+    Passages are keyed ``<content hash>@<start offset>`` and stored in doc
+    row order, which is all that is needed to map a passage back to its
+    document and to sync with the document table.
+    """
+
+    WINDOW = 1200
+    # Shared by consecutive windows, so a phrase across a boundary lands whole in one
+    OVERLAP = 200
+
+    def __init__(self, directory: Path):
+        self.bm25 = BM25Index(directory)
+        self.doc_keys: List[str] = []
+        self._bounds = np.zeros(1, dtype=np.int64)  # passages of doc i: bounds[i]:bounds[i + 1]
+        self._starts = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.doc_keys)
+
+    @classmethod
+    def windows(cls, text: str) -> List[Tuple[int, str]]:
+        step = cls.WINDOW - cls.OVERLAP
+        return [(s, text[s:s + cls.WINDOW]) for s in range(0, max(1, len(text) - cls.OVERLAP), step)]
+
+    def _reindex(self):
+        doc_keys, bounds, starts = [], [], []
+        for i, key in enumerate(self.bm25.keys):
+            h, start = key.rsplit("@", 1)
+            if not doc_keys or doc_keys[-1] != h:
+                doc_keys.append(h)
+                bounds.append(i)
+            starts.append(int(start))
+        bounds.append(len(self.bm25.keys))
+        self.doc_keys = doc_keys
+        self._bounds = np.asarray(bounds, dtype=np.int64)
+        self._starts = np.asarray(starts, dtype=np.int64)
+
+    def load(self) -> bool:
+        if not self.bm25.load():
+            return False
+        self._reindex()
+        return True
+
+    def sync(self, doc_keys: List[str], text_of) -> Tuple[int, int]:
+        """Match the indexed documents to ``doc_keys``; ``text_of(row)`` supplies new bodies."""
+        if doc_keys == self.doc_keys:
+            return 0, 0
+        keep = np.zeros(len(self.bm25.keys), dtype=bool)
+        j = 0
+        for i, h in enumerate(self.doc_keys):
+            if j < len(doc_keys) and h == doc_keys[j]:
+                keep[self._bounds[i]:self._bounds[i + 1]] = True
+                j += 1
+        removed = len(self.doc_keys) - j
+        if removed:
+            self.bm25.retain(keep)
+        # One body at a time, so a full rebuild never holds the corpus in memory
+        for row in range(j, len(doc_keys)):
+            wins = self.windows(text_of(row))
+            self.bm25.append([f"{doc_keys[row]}@{s}" for s, _w in wins], [w for _s, w in wins])
+        self.bm25.maybe_compact()
+        self._reindex()
+        return len(doc_keys) - j, removed
+
+    def search(self, query: str, k: int, doc_mask=None) -> List[Tuple[int, int, float]]:
+        """``(doc row, start offset, score)`` of the best ``k`` passages; ``doc_mask`` limits the documents."""
+        allowed = None if doc_mask is None else np.repeat(np.asarray(doc_mask, dtype=bool), np.diff(self._bounds))
+        rows, scores = self.bm25.top_k(query, k, allowed=allowed)
+        doc_rows = np.searchsorted(self._bounds, rows, side="right") - 1
+        return list(zip(doc_rows.tolist(), self._starts[rows].tolist(), scores.tolist()))
+
+    def save(self):
+        self.bm25.save()
+
+
+# ===== Search filters =====
+@dataclass(frozen=True)
+class SearchFilter:
+    """Restricts a search to matching documents.
+
+    The knowledge graph compiles a filter into a row mask once per index
+    generation and applies it before any scoring, so top-k is exact within
+    the subset and a narrow filter only scans its own rows. Path globs and
+    extensions match a document's source paths (chunk ``#partN`` suffixes
+    dropped, aliases included).
+    """
+
+    categories: Tuple[str, ...] = ()
+    path_glob: Optional[str] = None
+    extensions: Tuple[str, ...] = ()
+    min_quality: Optional[float] = None
+
+    @classmethod
+    def build(cls, category=None, path_glob=None, extension=None, min_quality=None) -> Optional["SearchFilter"]:
+        """Filter from keyword arguments (strings or lists of them); None when nothing is restricted."""
+        def _tuple(value) -> Tuple[str, ...]:
+            if not value:
+                return ()
+            return (value,) if isinstance(value, str) else tuple(value)
+
+        exts = tuple(sorted({e.lower() if e.startswith(".") else "." + e.lower() for e in _tuple(extension)}))
+        flt = cls(tuple(sorted(set(_tuple(category)))), path_glob or None, exts, min_quality)
+        return flt if flt != cls() else None
+
+    def matches_path(self, path: str) -> bool:
+        if self.extensions and Path(path).suffix.lower() not in self.extensions:
+            return False
+        return self.path_glob is None or fnmatch.fnmatch(path, self.path_glob)
+
+
+# ``category:knowledge path:cpux/code/* ext:.py quality:0.8`` tokens in a search string
+_FILTER_TOKEN = re.compile(r"(?<!\S)(category|path|ext|quality):(\S+)")
+
+
+def parse_search_filters(text: str) -> Tuple[str, Dict[str, Any]]:
+    """Split ``key:value`` filter tokens off a search string: (query, semantic_search kwargs)."""
+    opts: Dict[str, Any] = {}
+    for key, value in _FILTER_TOKEN.findall(text):
+        if key == "category":
+            opts.setdefault("category", []).append(value)
+        elif key == "path":
+            opts["path_glob"] = value
+        elif key == "ext":
+            opts.setdefault("extension", []).extend(v for v in value.split(",") if v)
+        else:
+            try:
+                opts["min_quality"] = float(value)
+            except ValueError:
+                continue
+    return " ".join(_FILTER_TOKEN.sub(" ", text).split()), opts
+
+
+# ===== Query result cache =====
+class QueryCache:
+    """LRU of search results, each tagged with the index generation it was computed at.
+
+    The knowledge graph bumps its generation on every change that can alter a
+    result (ingest, removal, re-scoring, a rebuilt embedding matrix), so an
+    entry from an older generation is simply a miss; nothing is invalidated
+    explicitly.
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self._entries: "OrderedDict[tuple, Tuple[int, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalise(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def get(self, key: tuple, generation: int):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, generation: int, value):
+        if self.capacity <= 0:
+            return
+        self._entries[key] = (generation, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "capacity": self.capacity,
+        }
+
+
+# ===== Knowledge Graph =====
 class KGDocument:
-    file_path: str
-    name: str
-    category: str
-    content: str
-    full_content: str
-    quality_score: float
-    domain_concepts: List[str]
+    """Lightweight view of one row of a DocumentTable (a document or chunk).
+
+    Views are positional: they stay valid until rows are dropped from the table.
+    ``full_content`` is held only until the row is persisted and afterwards
+    read back on demand from the DocumentStore's bounded text cache.
+    """
 
+    __slots__ = ("_table", "_row")
 
-class EnhancedKnowledgeGraph:
-    """Dependency-light KG with TF-IDF search, optional embeddings, concept tags, and persistence."""
+    def __init__(self, table: "DocumentTable", row: int):
+        self._table = table
+        self._row = row
 
-    def __init__(self, path: str):
+    @property
+    def file_path(self) -> str:
+        return self._table.file_paths[self._row]
+
+    @property
+    def name(self) -> str:
+        return self._table.names[self._row]
+
+    @property
+    def category(self) -> str:
+        return self._table.category_names[self._table.category_ids[self._row]]
+
+    @property
+    def content(self) -> str:
+        return self._table.contents[self._row]
+
+    @property
+    def quality_score(self) -> float:
+        return self._table.quality[self._row]
+
+    @property
+    def domain_concepts(self) -> List[str]:
+        return self._table.concepts_of(self._row)
+
+    @property
+    def doc_id(self) -> Optional[int]:
+        doc_id = self._table.doc_ids[self._row]
+        return None if doc_id < 0 else doc_id
+
+    @property
+    def full_content(self) -> str:
+        return self._table.text_of(self._row)
+
+    @property
+    def source_paths(self) -> List[str]:
+        return self._table.sources_of(self._row)
+
+    def __repr__(self) -> str:
+        return f"KGDocument(file_path={self.file_path!r}, category={self.category!r}, doc_id={self.doc_id!r})"
+
+
+class DocumentTable:
+    """Columnar, interned document metadata.
+
+    Categories and concepts are interned to integer ids; quality scores are a
+    float32 column and concept lists are stored CSR-style (``concept_indptr`` /
+    ``concept_ids``). Columns are stdlib ``array``s so they can be viewed as
+    NumPy arrays without copying when NumPy is available. Iterating or indexing
+    yields KGDocument views.
+    """
+
+    def __init__(self, store: Optional["DocumentStore"] = None):
+        self.store = store
+        self.file_paths: List[str] = []
+        self.names: List[str] = []
+        self.contents: List[str] = []
+        # Bodies not yet persisted (None once the store owns them)
+        self.pending_text: List[Optional[str]] = []
+        self.category_ids = array("i")
+        self.quality = array("f")
+        self.doc_ids = array("q")  # -1 until persisted
+        # Normalised-content hash per row, and further source paths sharing that body
+        self.content_hashes: List[str] = []
+        self.aliases: List[Optional[List[str]]] = []
+        self.hash_rows: Dict[str, int] = {}
+        self.concept_indptr = array("q", [0])
+        self.concept_ids = array("i")
+        self.category_names: List[str] = []
+        self.concept_names: List[str] = []
+        self._category_lookup: Dict[str, int] = {}
+        self._concept_lookup: Dict[str, int] = {}
+
+    # ----- sequence protocol -----
+    def __len__(self) -> int:
+        return len(self.file_paths)
+
+    def __iter__(self):
+        return (KGDocument(self, i) for i in range(len(self.file_paths)))
+
+    def __getitem__(self, row: int) -> KGDocument:
+        if row < 0:
+            row += len(self.file_paths)
+        if not 0 <= row < len(self.file_paths):
+            raise IndexError(row)
+        return KGDocument(self, row)
+
+    # ----- interning -----
+    def intern_category(self, name: str) -> int:
+        cid = self._category_lookup.get(name)
+        if cid is None:
+            cid = self._category_lookup[name] = len(self.category_names)
+            self.category_names.append(name)
+        return cid
+
+    def intern_concept(self, name: str) -> int:
+        cid = self._concept_lookup.get(name)
+        if cid is None:
+            cid = self._concept_lookup[name] = len(self.concept_names)
+            self.concept_names.append(sys.intern(name))
+        return cid
+
+    # ----- rows -----
+    def add(
+        self,
+        file_path: str,
+        name: str,
+        category: str,
+        content: str,
+        full_content: Optional[str] = None,
+        quality_score: float = 0.8,
+        domain_concepts: Optional[List[str]] = None,
+        doc_id: Optional[int] = None,
+        content_hash: str = "",
+        aliases: Optional[List[str]] = None,
+    ) -> KGDocument:
+        if content_hash:
+            self.hash_rows.setdefault(content_hash, len(self.file_paths))
+        self.content_hashes.append(content_hash)
+        self.aliases.append(aliases or None)
+        self.file_paths.append(file_path)
+        self.names.append(name)
+        self.contents.append(content)
+        self.pending_text.append(full_content)
+        self.category_ids.append(self.intern_category(category))
+        self.quality.append(quality_score)
+        self.doc_ids.append(-1 if doc_id is None else doc_id)
+        self.concept_ids.extend(self.intern_concept(c) for c in (domain_concepts or []))
+        self.concept_indptr.append(len(self.concept_ids))
+        return KGDocument(self, len(self.file_paths) - 1)
+
+    def sources_of(self, row: int) -> List[str]:
+        """Every path this row's body was ingested from (primary first)."""
+        return [self.file_paths[row]] + (self.aliases[row] or [])
+
+    def concepts_of(self, row: int) -> List[str]:
+        lo, hi = self.concept_indptr[row], self.concept_indptr[row + 1]
+        return [self.concept_names[c] for c in self.concept_ids[lo:hi]]
+
+    def text_of(self, row: int) -> str:
+        text = self.pending_text[row]
+        if text is not None:
+            return text
+        doc_id = self.doc_ids[row]
+        if self.store is not None and doc_id >= 0:
+            return self.store.get_text(doc_id)
+        return self.contents[row]
+
+    def retain(self, keep: List[bool]):
+        """Keep only rows whose flag is true (row positions shift; views go stale)."""
+        rows = [i for i, k in enumerate(keep) if k]
+        if len(rows) == len(self.file_paths):
+            return
+        self.file_paths = [self.file_paths[i] for i in rows]
+        self.names = [self.names[i] for i in rows]
+        self.contents = [self.contents[i] for i in rows]
+        self.pending_text = [self.pending_text[i] for i in rows]
+        self.category_ids = array("i", (self.category_ids[i] for i in rows))
+        self.quality = array("f", (self.quality[i] for i in rows))
+        self.doc_ids = array("q", (self.doc_ids[i] for i in rows))
+        self.content_hashes = [self.content_hashes[i] for i in rows]
+        self.aliases = [self.aliases[i] for i in rows]
+        self.hash_rows = {}
+        for row, h in enumerate(self.content_hashes):
+            if h:
+                self.hash_rows.setdefault(h, row)
+        indptr, ids = array("q", [0]), array("i")
+        for i in rows:
+            ids.extend(self.concept_ids[self.concept_indptr[i] : self.concept_indptr[i + 1]])
+            indptr.append(len(ids))
+        self.concept_indptr, self.concept_ids = indptr, ids
+
+    # ----- vectorised helpers -----
+    def category_mask(self, category: str):
+        """Boolean NumPy mask of rows in ``category``."""
+        cid = self._category_lookup.get(category, -1)
+        return np.frombuffer(self.category_ids, dtype=np.int32) == cid
+
+    def concept_degrees(self):
+        """Per-row count of other rows sharing each concept (the relationship degree)."""
+        n = len(self.file_paths)
+        ids = np.frombuffer(self.concept_ids, dtype=np.int32)
+        indptr = np.frombuffer(self.concept_indptr, dtype=np.int64)
+        if not len(ids):
+            return np.zeros(n, dtype=np.int64)
+        shared = np.bincount(ids, minlength=len(self.concept_names))[ids] - 1
+        cumulative = np.concatenate(([0], np.cumsum(shared)))
+        return cumulative[indptr[1:]] - cumulative[indptr[:-1]]
+
+
+class DocumentStore:
+    """SQLite-backed document store with append-only saves.
+
+    Every save is one transaction that inserts new documents, deletes dropped
+    ones and patches changed scores/manifest rows, so its cost follows the
+    amount of change and a crash mid-save leaves the previous state intact.
+    Freed pages are reclaimed by a background incremental vacuum.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_path TEXT NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            content TEXT NOT NULL,
+            full_content TEXT NOT NULL,
+            quality_score REAL NOT NULL,
+            domain_concepts TEXT NOT NULL,
+            content_hash TEXT NOT NULL DEFAULT '',
+            aliases TEXT
+        );
+        CREATE TABLE IF NOT EXISTS manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha1 TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    # Start a background vacuum once this share of the file is free pages
+    COMPACT_FREE_RATIO = 0.25
+
+    def __init__(self, path: Path, text_cache_mb: int = 64):
+        self.path = Path(path)
+        self._conn = self._connect()
+        self._compactor: Optional[threading.Thread] = None
+        # Bounded LRU of full_content bodies, keyed by doc id (budget counted in chars)
+        self._text_lru: "OrderedDict[int, str]" = OrderedDict()
+        self._text_budget = text_cache_mb * 1024 * 1024
+        self._text_used = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # only takes effect on a fresh file
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        # Stores created before deduplication lack the hash/alias columns
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+        if "content_hash" not in columns:
+            conn.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT NOT NULL DEFAULT ''")
+        if "aliases" not in columns:
+            conn.execute("ALTER TABLE documents ADD COLUMN aliases TEXT")
+        return conn
+
+    def load_documents(self, table: DocumentTable) -> DocumentTable:
+        rows = self._conn.execute(
+            "SELECT id, file_path, name, category, content, quality_score, domain_concepts, content_hash, aliases "
+            "FROM documents ORDER BY id"
+        )
+        for doc_id, fp, name, cat, content, score, concepts, chash, aliases in rows:
+            table.add(
+                file_path=fp,
+                name=name,
+                category=cat,
+                content=content,
+                quality_score=score,
+                domain_concepts=json.loads(concepts),
+                doc_id=doc_id,
+                content_hash=chash,
+                aliases=json.loads(aliases) if aliases else None,
+            )
+        return table
+
+    def get_text(self, doc_id: int) -> str:
+        text = self._text_lru.get(doc_id)
+        if text is not None:
+            self._text_lru.move_to_end(doc_id)
+            return text
+        row = self._conn.execute("SELECT full_content FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        text = row[0] if row else ""
+        self._remember(doc_id, text)
+        return text
+
+    def get_prefixes(self, doc_ids: List[int], n: int) -> Dict[int, str]:
+        """Batch-read the first ``n`` chars of many bodies, bypassing the LRU."""
+        out: Dict[int, str] = {}
+        for i in range(0, len(doc_ids), 500):
+            batch = doc_ids[i : i + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT id, substr(full_content, 1, ?) FROM documents WHERE id IN ({marks})", (n, *batch)
+            )
+            out.update(rows)
+        return out
+
+    def _remember(self, doc_id: int, text: str):
+        if len(text) > self._text_budget:
+            return
+        old = self._text_lru.pop(doc_id, None)
+        if old is not None:
+            self._text_used -= len(old)
+        self._text_lru[doc_id] = text
+        self._text_used += len(text)
+        while self._text_used > self._text_budget:
+            _, evicted = self._text_lru.popitem(last=False)
+            self._text_used -= len(evicted)
+
+    def _forget(self, doc_id: int):
+        old = self._text_lru.pop(doc_id, None)
+        if old is not None:
+            self._text_used -= len(old)
+
+    def load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn.execute("SELECT path, size, mtime_ns, sha1 FROM manifest")
+        return {p: {"size": size, "mtime_ns": mtime, "sha1": sha1} for p, size, mtime, sha1 in rows}
+
+    def load_meta(self, key: str, default: Any = None) -> Any:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def commit(
+        self,
+        table: DocumentTable,
+        deleted_ids: set,
+        score_updates: Dict[int, float],
+        source_updates: set,
+        manifest: Dict[str, Dict[str, Any]],
+        manifest_keys: set,
+        manifest_removed: set,
+        meta: Dict[str, Any],
+    ):
+        """Apply one save as a single transaction; assigns ``doc_id`` to new rows on success."""
+        assigned: List[Tuple[int, int]] = []
+        with self._conn:
+            if deleted_ids:
+                self._conn.executemany("DELETE FROM documents WHERE id = ?", [(i,) for i in deleted_ids])
+                for i in deleted_ids:
+                    self._forget(i)
+            for row in range(len(table)):
+                if table.doc_ids[row] >= 0:
+                    continue
+                d = table[row]
+                aliases = table.aliases[row]
+                cur = self._conn.execute(
+                    "INSERT INTO documents (file_path, name, category, content, full_content, quality_score, domain_concepts, content_hash, aliases) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        d.file_path, d.name, d.category, d.content, d.full_content, d.quality_score,
+                        json.dumps(d.domain_concepts), table.content_hashes[row], json.dumps(aliases) if aliases else None,
+                    ),
+                )
+                assigned.append((row, cur.lastrowid))
+            if source_updates:
+                rows = [r for r in range(len(table)) if table.doc_ids[r] in source_updates]
+                self._conn.executemany(
+                    "UPDATE documents SET file_path = ?, name = ?, content_hash = ?, aliases = ? WHERE id = ?",
+                    [
+                        (
+                            table.file_paths[r], table.names[r], table.content_hashes[r],
+                            json.dumps(table.aliases[r]) if table.aliases[r] else None, table.doc_ids[r],
+                        )
+                        for r in rows
+                    ],
+                )
+            if score_updates:
+                self._conn.executemany(
+                    "UPDATE documents SET quality_score = ? WHERE id = ?",
+                    [(score, doc_id) for doc_id, score in score_updates.items()],
+                )
+            if manifest_removed:
+                self._conn.executemany("DELETE FROM manifest WHERE path = ?", [(k,) for k in manifest_removed])
+            upserts = [(k, manifest[k]["size"], manifest[k]["mtime_ns"], manifest[k]["sha1"]) for k in manifest_keys if k in manifest]
+            if upserts:
+                self._conn.executemany("INSERT OR REPLACE INTO manifest (path, size, mtime_ns, sha1) VALUES (?, ?, ?, ?)", upserts)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in meta.items()],
+            )
+        for row, doc_id in assigned:
+            # Persisted: hand the body over to the bounded cache instead of the table
+            text, table.pending_text[row] = table.pending_text[row], None
+            table.doc_ids[row] = doc_id
+            if text is not None:
+                self._remember(doc_id, text)
+        if deleted_ids or manifest_removed:
+            self.maybe_compact()
+        return len(assigned)
+
+    def maybe_compact(self):
+        """Reclaim free pages on a background connection when enough have accumulated."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        total = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        if not total or free / total < self.COMPACT_FREE_RATIO:
+            return
+
+        def _run():
+            try:
+                conn = sqlite3.connect(str(self.path), timeout=30)
+                # Frees one page per step; executescript runs it to completion
+                conn.executescript("PRAGMA incremental_vacuum;")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+            except Exception as e:
+                print(f"⚠️  Store compaction failed: {e}")
+
+        self._compactor = threading.Thread(target=_run, name="qa-store-compactor", daemon=True)
+        self._compactor.start()
+
+
+def _synchronized(method):
+    """Run a graph method under the graph's re-entrant lock."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class EnhancedKnowledgeGraph:
+    """Dependency-light KG with BM25/TF-IDF search, optional embeddings, concept tags, and persistence."""
+
+    def __init__(
+        self,
+        path: str,
+        text_cache_mb: int = 64,
+        workers: Optional[int] = None,
+        extract_timeout: float = 120.0,
+        extract_max_mb: int = 1024,
+        chunk_size: int = 8000,
+        chunk_overlap: int = 400,
+        engines: str = "auto",
+        ann: str = "auto",
+        ann_nprobe: int = 16,
+        embed_dtype: str = "int8",
+        embed_rerank: bool = True,
+        query_cache_size: int = 512,
+        shards: int = 0,
+    ):
         self.knowledge_base_path = Path(path)
         self.knowledge_base_path.mkdir(parents=True, exist_ok=True)
-
-        self.documents: List[KGDocument] = []
+        # Public methods hold this; a KnowledgeWatcher applies changes from its own thread
+        self.lock = threading.RLock()
+        # Extraction processes for PDF/DOCX/PPTX ingestion and their per-file budget
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.extract_timeout = extract_timeout
+        self.extract_max_mb = extract_max_mb
+        # Documents are split into boundary-aligned chunks of this many chars
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+        self.documents = DocumentTable()
         self.relationships: List[Dict[str, Any]] = []
         self.stats: Dict[str, Any] = {}
 
-        # Index state
-        self._vectorizer: Optional[TfidfVectorizer] = None
-        self._tfidf_matrix = None
-        self._corpus: List[str] = []
+        # Lexical engines: "auto" is BM25 with NumPy plus TF-IDF with scikit-learn
+        if engines == "auto":
+            self.engines = {e for e, ok in (("bm25", HAVE_NUMPY), ("tfidf", HAVE_SKLEARN)) if ok}
+        else:
+            self.engines = {e.strip() for e in engines.split(",") if e.strip()}
+            unknown = self.engines - {"bm25", "tfidf"}
+            if unknown:
+                raise ValueError(f"unknown search engines: {', '.join(sorted(unknown))}")
+        # Embedding search: "auto" switches to the IVF index past IVFIndex.MIN_ROWS rows
+        if ann not in ("auto", "ivf", "off"):
+            raise ValueError(f"unknown ANN mode: {ann}")
+        self.ann = ann
+        self.ann_nprobe = ann_nprobe
+        # In-RAM embedding precision; quantized hits are re-scored from the on-disk float16 cache
+        if embed_dtype not in EmbeddingMatrix.DTYPES:
+            raise ValueError(f"unknown embedding dtype: {embed_dtype}")
+        self.embed_dtype = embed_dtype
+        self.embed_rerank = embed_rerank
+
+        # Index state; ``generation`` moves on every change that can alter a search result
+        self.generation = 0
+        self.query_cache = QueryCache(query_cache_size)
+        self._filter_masks: Dict[SearchFilter, Tuple[int, Any]] = {}
+        # (generation, lower-cased snippets, NUL-joined snippets, start of each in it)
+        self._fuzzy: Optional[Tuple[int, List[str], str, List[int]]] = None
+        self._tfidf: Optional[IncrementalTfidfIndex] = None
+        self._bm25: Optional[BM25Index] = None
+        # BM25 split across this many worker processes (0: in-process index)
+        self.shards = shards
+        self._shards: Optional[ShardedBM25] = None
+        self._passages: Optional[PassageIndex] = None
 
         self._st_model: Optional[SentenceTransformer] = None
-        self._embed_matrix = None
-
-        self._index_file = self.knowledge_base_path / ".qa_index.pkl"
+        self._embed_matrix: Optional[EmbeddingMatrix] = None
+        self._embed_keys: List[str] = []  # embedding cache key of each matrix row
+        self._embed_cache: Optional[EmbeddingCache] = None
+        self._ann: Optional[IVFIndex] = None
+
+        # Ingest manifest: source path -> {size, mtime_ns, sha1}; lets restarts skip unchanged files
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        # Files whose extraction blew its budget: path -> {size, mtime_ns, reason}
+        self._quarantine: Dict[str, Dict[str, Any]] = {}
+
+        # Pending changes since the last save; save_memory writes only these
+        self._deleted_ids: set = set()
+        self._dirty_scores: Dict[int, float] = {}
+        self._dirty_sources: set = set()  # doc ids whose path/aliases/hash changed
+        self._manifest_dirty: set = set()
+        self._manifest_removed: set = set()
+        # Chars of not-yet-saved bodies; ingest flushes to the store past the text cache budget
+        self._pending_chars = 0
+        self._flush_chars = text_cache_mb * 1024 * 1024
+
+        self._index_file = self.knowledge_base_path / ".qa_index.pkl"  # legacy whole-corpus pickle
+        self._store = DocumentStore(self.knowledge_base_path / ".qa_store.sqlite", text_cache_mb=text_cache_mb)
+        self.documents.store = self._store
+        self._tfidf_dir = self.knowledge_base_path / ".qa_tfidf"
+        self._bm25_dir = self.knowledge_base_path / ".qa_bm25"
+        self._shards_dir = self.knowledge_base_path / ".qa_shards"
+        self._passages_dir = self.knowledge_base_path / ".qa_passages"
+        self._ann_dir = self.knowledge_base_path / ".qa_ann"
+        # Extracted PDF/DOCX/PPTX text, shared with document_converter.py
+        self._text_cache = TextCache(self.knowledge_base_path / TextCache.DIRNAME)
+        self._text_cache.sweep()
         self._load_index()
         print("🔧 Knowledge graph ready →", self.knowledge_base_path)
 
     # ---------- persistence ----------
     def _load_index(self):
         try:
-            if self._index_file.exists():
-                import pickle
-                data = pickle.loads(self._index_file.read_bytes())
-                self.documents = [KGDocument(**d) for d in data.get("documents", [])]
-                self.stats = data.get("stats", {})
-                # We do not load matrices to keep file small; we can rebuild quickly
+            self._store.load_documents(self.documents)
+            self.stats = self._store.load_meta("stats", {})
+            self._manifest = self._store.load_manifest()
+            self._quarantine = self._store.load_meta("quarantine", {})
+            if self.documents:
                 print(f"💾 Loaded KG metadata ({len(self.documents)} docs)")
+                if self._dedupe_loaded():
+                    self.save_memory()
+            elif self._index_file.exists():
+                self._migrate_legacy_index()
         except Exception as e:
             print(f"⚠️  Failed to load KG index: {e}")
 
+    def _dedupe_loaded(self) -> int:
+        """Hash rows saved before deduplication and fold duplicate bodies together."""
+        table = self.documents
+        first: Dict[str, int] = {}
+        keep = [True] * len(table)
+        for row in range(len(table)):
+            h = table.content_hashes[row]
+            if not h:
+                h = table.content_hashes[row] = _content_hash(table.text_of(row))
+                self._dirty_sources.add(table.doc_ids[row])
+            if h not in first:
+                first[h] = row
+                continue
+            target = first[h]
+            table.aliases[target] = (table.aliases[target] or []) + table.sources_of(row)
+            self._dirty_sources.add(table.doc_ids[target])
+            self._deleted_ids.add(table.doc_ids[row])
+            keep[row] = False
+        merged = keep.count(False)
+        table.retain(keep)
+        table.hash_rows = {h: r for r, h in enumerate(table.content_hashes)}
+        if merged:
+            print(f"🧬 Merged {merged} duplicate documents")
+        return merged or len(self._dirty_sources)
+
+    def _migrate_legacy_index(self):
+        """One-time import of a pre-store ``.qa_index.pkl`` into the document store."""
+        import pickle
+        data = pickle.loads(self._index_file.read_bytes())
+        for d in data.get("documents", []):
+            self._add_document(
+                d["file_path"], d["name"], d["category"], d["full_content"],
+                quality_score=d["quality_score"], domain_concepts=d["domain_concepts"],
+            )
+        self.stats = data.get("stats", {})
+        self._manifest = data.get("manifest", {})
+        self._manifest_dirty = set(self._manifest)
+        self.save_memory()
+        self._index_file.rename(self._index_file.with_name(self._index_file.name + ".migrated"))
+        print(f"💾 Migrated legacy KG index ({len(self.documents)} docs)")
+
+    @_synchronized
     def save_memory(self):
         try:
-            import pickle
-            blob = {
-                "documents": [d.__dict__ for d in self.documents],
-                "stats": self.stats,
-                "saved_at": datetime.now().isoformat(),
-            }
-            self._index_file.write_bytes(pickle.dumps(blob))
-            print(f"💾 Saved KG ({len(self.documents)} docs) → {self._index_file}")
+            new_docs = self._commit_pending()
+            print(f"💾 Saved KG ({len(self.documents)} docs, {new_docs} new) → {self._store.path}")
         except Exception as e:
             print(f"⚠️  Failed to save KG: {e}")
+        self._save_sidecars()
+
+    def _commit_pending(self) -> int:
+        """Write pending document, manifest and metadata changes; returns the new-row count."""
+        new_docs = self._store.commit(
+            table=self.documents,
+            deleted_ids=self._deleted_ids,
+            score_updates=self._dirty_scores,
+            source_updates=self._dirty_sources,
+            manifest=self._manifest,
+            manifest_keys=self._manifest_dirty,
+            manifest_removed=self._manifest_removed,
+            meta={"stats": self.stats, "quarantine": self._quarantine, "saved_at": datetime.now().isoformat()},
+        )
+        self._deleted_ids = set()
+        self._dirty_scores = {}
+        self._dirty_sources = set()
+        self._manifest_dirty = set()
+        self._manifest_removed = set()
+        self._pending_chars = 0
+        return new_docs
+
+    def _save_sidecars(self):
+        if self._tfidf is not None:
+            try:
+                self._tfidf.save()
+            except Exception as e:
+                print(f"⚠️  Failed to save TF-IDF index: {e}")
+        if self._bm25 is not None:
+            try:
+                self._bm25.save()
+            except Exception as e:
+                print(f"⚠️  Failed to save BM25 index: {e}")
+        if self._shards is not None:
+            try:
+                self._shards.save()
+            except Exception as e:
+                print(f"⚠️  Failed to save BM25 shards: {e}")
+        if self._passages is not None:
+            try:
+                self._passages.save()
+            except Exception as e:
+                print(f"⚠️  Failed to save passage index: {e}")
+        if self._ann is not None:
+            try:
+                self._ann.save()
+            except Exception as e:
+                print(f"⚠️  Failed to save ANN index: {e}")
 
     # ---------- ingestion ----------
-    def ingest_document(self, file_path: Path, category: str):
-        try:
-            text = ""
-            suf = file_path.suffix.lower()
-            if suf in {".txt", ".md", ".rst", ".rxt", ".rtf", ".py", ".js", ".ts", ".tsx", ".json", ".c", ".cpp", ".rs", ".go", ".java", ".cs"}:
-                text = file_path.read_text(encoding="utf-8", errors="ignore")
-            elif suf == ".docx":
-                try:
-                    import docx  # python-docx
-                    doc = docx.Document(file_path)
-                    text = "\n".join(p.text for p in doc.paragraphs)
-                except Exception:
-                    text = f"Document: {file_path.name}"
-            elif suf == ".pdf":
-                text = extract_text_from_pdf(str(file_path))
-
-            if not text.strip():
-                return
-
-            # Chunk very large files for better indexing and search recall
-            CHUNK_THRESHOLD = 50_000
-            CHUNK_SIZE = 8_000
-            if len(text) > CHUNK_THRESHOLD:
-                parts = [text[i : i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
-                for idx, part in enumerate(parts, start=1):
-                    name = f"{file_path.name}#part{idx}"
-                    doc = KGDocument(
-                        file_path=f"{str(file_path)}#part{idx}",
-                        name=name,
-                        category=category,
-                        content=part[:2000],
-                        full_content=part,
-                        quality_score=0.8,
-                        domain_concepts=self._extract_concepts(part),
-                    )
-                    self.documents.append(doc)
-                print(
-                    f"📥 Ingested {file_path.name} → {category} as {len(parts)} chunks ({len(text)} chars)"
-                )
-            else:
-                doc = KGDocument(
-                    file_path=str(file_path),
-                    name=file_path.name,
-                    category=category,
-                    content=text[:2000],
-                    full_content=text,
-                    quality_score=0.8,
-                    domain_concepts=self._extract_concepts(text),
-                )
-                self.documents.append(doc)
-                print(f"📥 Ingested {file_path.name} → {category} ({len(text)} chars)")
-        except Exception as e:
-            print(f"⚠️  Error ingesting {getattr(file_path, 'name', '<unknown>')}: {e}")
+    @_synchronized
+    def ingest_document(self, file_path: Path, category: str) -> int:
+        """Extract, chunk and append a file. Returns the number of documents added."""
+        file_path = Path(file_path)
+        # Closing the source generator shuts its extractor down, so it must outlive the chunks
+        with contextlib.closing(self._chunk_sources([file_path], workers=1)) as sources:
+            try:
+                return self._ingest_chunks(file_path, category, next(sources))
+            except ExtractionError as e:
+                self._drop_sources({str(file_path)})
+                print(f"⚠️  Error ingesting {file_path.name}: {e}")
+                return 0
+
+    def _ingest_chunks(self, file_path: Path, category: str, chunks) -> int:
+        """Append a file's chunks as they arrive. Returns the number of documents added.
+
+        A file that fits in one chunk keeps its plain path; larger files become
+        ``path#partN`` documents. Pending bodies are flushed to the store once
+        they exceed the text cache budget, so ingest memory stays bounded.
+        """
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            return 0
+        second = next(chunks, None)
+        if second is None:
+            if not self._add_document(str(file_path), file_path.name, category, first):
+                print(f"♻️  {file_path.name} duplicates an indexed document; recorded as extra source")
+                return 0
+            print(f"📥 Ingested {file_path.name} → {category} ({len(first)} chars)")
+            return 1
+        added = parts = chars = 0
+        for part in itertools.chain((first, second), chunks):
+            parts += 1
+            chars += len(part)
+            added += self._add_document(
+                f"{str(file_path)}#part{parts}", f"{file_path.name}#part{parts}", category, part
+            )
+            if self._pending_chars > self._flush_chars:
+                self._commit_pending()
+        dupes = f", {parts - added} duplicate" if added < parts else ""
+        print(f"📥 Ingested {file_path.name} → {category} as {parts} chunks ({chars} chars{dupes})")
+        return added
 
+    @_synchronized
     def ingest_text(self, text: str, category: str = "vision", name: str = "seed.txt"):
         if not text:
             return
-        doc = KGDocument(
-            file_path=f"<virtual>/{name}",
+        chunks = chunk_text(text, self.chunk_size, self.chunk_overlap)
+        if len(chunks) == 1:
+            if self._add_document(f"<virtual>/{name}", name, category, text, quality_score=0.85):
+                print(f"🌱 Seeded virtual document: {name}")
+            return
+        added = 0
+        for idx, chunk in enumerate(chunks, start=1):
+            added += self._add_document(
+                f"<virtual>/{name}#part{idx}", f"{name}#part{idx}", category, chunk, quality_score=0.85
+            )
+        if added:
+            print(f"🌱 Seeded virtual document: {name} ({len(chunks)} chunks)")
+
+    def _add_document(
+        self,
+        file_path: str,
+        name: str,
+        category: str,
+        text: str,
+        quality_score: float = 0.8,
+        domain_concepts: Optional[List[str]] = None,
+    ) -> bool:
+        """Append a body unless an identical one is indexed; then just record the extra source.
+
+        Returns True when a new row was added.
+        """
+        table = self.documents
+        h = _content_hash(text)
+        row = table.hash_rows.get(h)
+        if row is not None:
+            if file_path not in table.sources_of(row):
+                table.aliases[row] = (table.aliases[row] or []) + [file_path]
+                if table.doc_ids[row] >= 0:
+                    self._dirty_sources.add(table.doc_ids[row])
+                # Path-glob and extension filters match aliases too
+                self.generation += 1
+            return False
+        table.add(
+            file_path=file_path,
             name=name,
             category=category,
             content=text[:2000],
             full_content=text,
-            quality_score=0.85,
-            domain_concepts=self._extract_concepts(text),
+            quality_score=quality_score,
+            domain_concepts=self._extract_concepts(text) if domain_concepts is None else domain_concepts,
+            content_hash=h,
         )
-        self.documents.append(doc)
-        print(f"🌱 Seeded virtual document: {name}")
-
-    def ingest_path_recursive(self, root: Path, category: str = "documentation", max_bytes: int = 5_000_000):
-        exts = {".txt", ".md", ".rst", ".rxt", ".rtf", ".py", ".js", ".ts", ".tsx", ".json", ".docx", ".pdf"}
+        self._pending_chars += len(text)
+        self.generation += 1
+        return True
+
+    @_synchronized
+    def ingest_path_recursive(
+        self,
+        root: Path,
+        category: str = "documentation",
+        max_bytes: int = INGEST_MAX_BYTES,
+        workers: Optional[int] = None,
+        exclude: Optional[List[Path]] = None,
+        only: Optional[List[str]] = None,
+    ):
+        """Bring everything under ``root`` up to date with the ingest manifest.
+
+        Unchanged files (same size and mtime, or same content hash) are skipped,
+        modified files replace their previous documents and files that vanished
+        from ``root`` are dropped. The walk prunes build, VCS and ignored
+        directories and skips minified assets (see ``walk_ingestable``).
+        PDF/DOCX/PPTX extraction runs on ``workers``
+        processes (default: the graph's setting); results are merged in path
+        order. ``exclude`` names roots kept up to date by their own walk: they
+        are neither descended into nor pruned from the manifest here. ``only``
+        restricts the update to those files and directories under ``root``
+        (say, the paths a watcher saw change). Returns the number of files
+        ingested or removed.
+        """
+        exts = INGEST_EXTS
         if not root.exists():
             return 0
-        count = 0
-        for fp in root.rglob("*.*"):
-            if fp.suffix.lower() in exts:
+        seen: Dict[str, Tuple[Path, os.stat_result]] = {}
+        skipped: Dict[str, int] = {}
+        # document_converter.py's .txt copies of sources we ingest directly
+        converted = self._text_cache.converted_outputs()
+
+        def known(path: str, st: os.stat_result) -> bool:
+            # Ingested before and untouched since: no need to sniff it again
+            entry = self._manifest.get(_canonical_path(path))
+            return entry is not None and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+
+        for path, st in walk_ingestable(root, exts, max_bytes, skipped, exclude=exclude, known=known, only=only):
+            source = converted.get(os.path.abspath(path))
+            if source and os.path.exists(source):
+                skipped["converted copy"] = skipped.get("converted copy", 0) + 1
+                continue
+            # Canonical keys keep "cpux/x.pdf", "./cpux/x.pdf" and "/abs/cpux/x.pdf" as one file
+            key = _canonical_path(path)
+            seen[key] = (Path(key), st)
+
+        changed: List[Tuple[Path, os.stat_result, str]] = []
+        quarantined = 0
+        no_extractor: Dict[str, int] = {}
+        for key, (fp, st) in seen.items():
+            suffix = fp.suffix.lower()
+            if not extractor_available(suffix):
+                # Neither quarantined nor recorded: picked up once the package is installed
+                no_extractor[suffix] = no_extractor.get(suffix, 0) + 1
+                continue
+            held = self._quarantine.get(key)
+            if held and held["size"] == st.st_size and held["mtime_ns"] == st.st_mtime_ns:
+                # Skipped until the file changes
+                quarantined += 1
+                continue
+            entry = self._manifest.get(key)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                continue
+            try:
+                digest = _file_sha1(fp)
+            except OSError:
+                continue
+            if entry and entry["sha1"] == digest:
+                # Touched but not modified: refresh the stat key only
+                entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+                self._manifest_dirty.add(key)
+                continue
+            changed.append((fp, st, digest))
+
+        def owned(key: str) -> bool:
+            if only is not None and not any(_is_under(key, Path(p)) for p in only):
+                return False
+            return _is_under(key, root) and not any(_is_under(key, x) for x in exclude or ())
+
+        removed = [k for k in self._manifest if k not in seen and owned(k)]
+        stale = {str(fp) for fp, _st, _d in changed} | set(removed)
+        if stale:
+            self._drop_sources(stale)
+        for key in removed:
+            del self._manifest[key]
+            self._manifest_dirty.discard(key)
+            self._manifest_removed.add(key)
+        for key in [k for k in self._quarantine if k not in seen and owned(k)]:
+            del self._quarantine[key]
+
+        changed.sort(key=lambda c: str(c[0]))
+        paths, digests = [fp for fp, _st, _d in changed], [d for _fp, _st, d in changed]
+        with contextlib.closing(self._chunk_sources(paths, workers, digests)) as sources:
+            for (fp, st, digest), chunks in zip(changed, sources):
                 try:
-                    if fp.stat().st_size <= max_bytes:
-                        self.ingest_document(fp, category=category)
-                        count += 1
-                except Exception:
+                    self._ingest_chunks(fp, category, chunks)
+                except ExtractionError as e:
+                    # Chunks that arrived before the failure must not linger
+                    self._drop_sources({str(fp)})
+                    self._quarantine[str(fp)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "reason": str(e)}
+                    print(f"🚫 Quarantined {fp.name}: {e}")
                     continue
-        return count
+                self._quarantine.pop(str(fp), None)
+                # Recorded even when nothing was extracted so empty files are not retried
+                self._manifest[str(fp)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": digest}
+                self._manifest_dirty.add(str(fp))
+                self._manifest_removed.discard(str(fp))
+
+        if removed:
+            print(f"🗑️  Dropped {len(removed)} deleted files under {root}")
+        if quarantined:
+            print(f"🚫 Skipped {quarantined} quarantined files under {root}")
+        for suffix, n in sorted(no_extractor.items()):
+            print(f"⚠️  Skipped {n} {suffix} files under {root}: {EXTRACTOR_MODULES[suffix]} is not installed")
+        if skipped:
+            reasons = ", ".join(f"{n} {why}" for why, n in sorted(skipped.items()))
+            print(f"🙈 Skipped {sum(skipped.values())} files under {root} ({reasons})")
+        unchanged = len(seen) - len(changed) - quarantined - sum(no_extractor.values())
+        if unchanged:
+            print(f"⏭️  Skipped {unchanged} unchanged files under {root}")
+        return len(changed) + len(removed)
+
+    def _chunk_sources(
+        self,
+        paths: List[Path],
+        workers: Optional[int] = None,
+        digests: Optional[List[Optional[str]]] = None,
+    ):
+        """Yield one chunk iterator per path, in order.
+
+        PDF/DOCX/PPTX extraction runs in isolated worker processes under the graph's
+        per-file time and memory budget and streams chunks back as pages are
+        read; their text goes through the shared ``TextCache``, so a document
+        is only ever extracted once. ``digests`` (parallel to ``paths``) saves
+        rehashing files the caller already hashed. Plain-text files are
+        chunked inline block by block. A chunk
+        iterator raises ``ExtractionError`` when its file fails, and must be
+        consumed before the next one is requested.
+        """
+        workers = self.workers if workers is None else workers
+        heavy = [i for i, p in enumerate(paths) if p.suffix.lower() in BINARY_EXTS]
+        if not heavy:
+            for p in paths:
+                yield self._safe_chunks(p)
+            return
+        extractor = IsolatedExtractor(
+            workers=min(workers, len(heavy)), timeout=self.extract_timeout, max_mb=self.extract_max_mb
+        )
+        events = extractor.run(
+            [str(paths[i]) for i in heavy],
+            self.chunk_size,
+            self.chunk_overlap,
+            cache_dir=str(self._text_cache.directory),
+            digests=[digests[i] for i in heavy] if digests else None,
+        )
+        total = len(paths)
+        step = max(1, total // 20)
+        heavy_idx = 0
+        try:
+            for done, p in enumerate(paths, start=1):
+                if p.suffix.lower() in BINARY_EXTS:
+                    yield self._worker_chunks(events, heavy_idx)
+                    heavy_idx += 1
+                else:
+                    yield self._safe_chunks(p)
+                if len(heavy) > 1 and (done % step == 0 or done == total):
+                    print(f"⏳ Extracted {done}/{total} files ({len(heavy)} on {extractor.workers} workers)")
+        finally:
+            events.close()
+
+    @staticmethod
+    def _worker_chunks(events, idx: int):
+        for i, kind, payload in events:
+            if i < idx:
+                continue  # leftovers of a file whose iterator was abandoned
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                return
+            else:
+                raise ExtractionError(payload)
+
+    def _safe_chunks(self, path: Path):
+        try:
+            yield from iter_document_chunks(str(path), self.chunk_size, self.chunk_overlap)
+        except Exception as e:
+            print(f"⚠️  Error extracting {path.name}: {e}")
+
+    def prefetch(self, paths: List[Path]) -> int:
+        """Extract PDF/DOCX/PPTX ``paths`` into the text cache without holding the lock.
+
+        Lets a background caller do the slow part of an ingest while searches
+        keep running; files that fail are quarantined right away so the ingest
+        that follows does not spend their budget a second time. Returns the
+        number of files that failed.
+        """
+        paths = [Path(p) for p in paths]
+        paths = [p for p in paths if p.suffix.lower() in BINARY_EXTS and extractor_available(p.suffix)]
+        if not paths:
+            return 0
+        extractor = IsolatedExtractor(
+            workers=min(self.workers, len(paths)), timeout=self.extract_timeout, max_mb=self.extract_max_mb
+        )
+        failed: Dict[str, str] = {}
+        for idx, kind, payload in extractor.run(
+            [str(p) for p in paths], self.chunk_size, self.chunk_overlap, cache_dir=str(self._text_cache.directory)
+        ):
+            if kind == "failed":
+                failed[_canonical_path(paths[idx])] = payload
+        if failed:
+            with self.lock:
+                for key, reason in failed.items():
+                    try:
+                        st = os.stat(key)
+                    except OSError:
+                        continue
+                    self._quarantine[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "reason": reason}
+                    print(f"🚫 Quarantined {Path(key).name}: {reason}")
+        return len(failed)
+
+    @_synchronized
+    def quarantined(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self._quarantine)
+
+    @_synchronized
+    def clear_quarantine(self):
+        self._quarantine = {}
+
+    def _drop_sources(self, sources: set):
+        """Remove every document (and chunk) that was ingested from one of ``sources``."""
+        table = self.documents
+        keep = [True] * len(table)
+        for row, fp in enumerate(table.file_paths):
+            if table.aliases[row] is None and _source_of(fp) not in sources:
+                continue
+            paths = table.sources_of(row)
+            remaining = [p for p in paths if _source_of(p) not in sources]
+            if len(remaining) == len(paths):
+                continue
+            doc_id = table.doc_ids[row]
+            if remaining:
+                # Body still reachable from another source: promote it instead of dropping
+                table.file_paths[row] = remaining[0]
+                table.names[row] = Path(remaining[0]).name
+                table.aliases[row] = remaining[1:] or None
+                if doc_id >= 0:
+                    self._dirty_sources.add(doc_id)
+                continue
+            keep[row] = False
+            if doc_id >= 0:
+                self._deleted_ids.add(doc_id)
+                self._dirty_scores.pop(doc_id, None)
+                self._dirty_sources.discard(doc_id)
+        before = len(table)
+        table.retain(keep)
+        self.generation += 1
+        if len(table) != before and self._embed_matrix is not None:
+            # Row positions shifted: drop the same rows from the embedding matrix (the indexes sync by key).
+            # Rows appended since it was built come last, so the matrix covers a prefix of ``keep``.
+            mask = np.asarray(keep[:len(self._embed_matrix)], dtype=bool)
+            self._embed_matrix = self._embed_matrix.retain(mask)
+            self._embed_keys = [k for k, kept in zip(self._embed_keys, mask) if kept]
+            if self._ann is not None:
+                self._ann.sync(self._embed_matrix, self._embed_keys)
 
     # ---------- indexing & search ----------
+    _TFIDF_PARAMS = {
+        "lowercase": True,
+        "ngram_range": (1, 2),
+        "token_pattern": r"(?u)\b[A-Za-z][A-Za-z0-9_\-]{2,}\b",
+    }
+
     def _ensure_tfidf(self):
-        if not HAVE_SKLEARN:
-            self._try_install_core()
-        if not HAVE_SKLEARN:
+        """Bring the TF-IDF index in line with the documents, vectorizing only new rows."""
+        if not HAVE_SKLEARN or "tfidf" not in self.engines:
             return
-        self._corpus = [d.full_content[:10000] for d in self.documents]
-        self._vectorizer = TfidfVectorizer(
-            lowercase=True,
-            ngram_range=(1, 2),
-            max_features=20000,
-            token_pattern=r"(?u)\b[A-Za-z][A-Za-z0-9_\-]{2,}\b",
+        if self._tfidf is None:
+            self._tfidf = IncrementalTfidfIndex(self._tfidf_dir, self._TFIDF_PARAMS)
+            if self._tfidf.load():
+                print(f"💾 Loaded TF-IDF index for {len(self._tfidf)} docs")
+        added, removed = self._tfidf.sync(
+            self.documents.content_hashes, lambda rows: self._text_prefixes(10000, rows)
         )
-        self._tfidf_matrix = self._vectorizer.fit_transform(self._corpus) if self._corpus else None
-        if self._tfidf_matrix is not None:
-            print(f"🧭 Built TF-IDF index for {len(self._corpus)} docs")
+        if added or removed:
+            print(f"🧭 Updated TF-IDF index: +{added} / -{removed} docs ({len(self._tfidf)} total)")
+        self._tfidf.maybe_renormalise()
 
-    def _ensure_embed(self):
-        if not HAVE_ST:
+    def _ensure_bm25(self):
+        """Bring the BM25 inverted index in line with the documents, tokenizing only new rows."""
+        if not HAVE_NUMPY or "bm25" not in self.engines:
             return
-        if self._st_model is None:
+        if self.shards > 0:
             try:
-                self._st_model = SentenceTransformer("all-MiniLM-L6-v2")
+                if self._shards is None:
+                    self._shards = ShardedBM25(self._shards_dir, self.shards)
+                    print(f"🧩 Started {self.shards} BM25 search shards ({len(self._shards)} docs)")
+                added, removed = self._shards.sync(
+                    self.documents.content_hashes, lambda rows: self._text_prefixes(10000, rows)
+                )
+                if added or removed:
+                    print(f"🧭 Updated BM25 shards: +{added} / -{removed} docs ({len(self._shards)} total)")
+                return
+            except RuntimeError as e:
+                self._drop_shards(e)
+        if self._bm25 is None:
+            self._bm25 = BM25Index(self._bm25_dir)
+            if self._bm25.load():
+                print(f"💾 Loaded BM25 index for {len(self._bm25)} docs")
+        added, removed = self._bm25.sync(
+            self.documents.content_hashes, lambda rows: self._text_prefixes(10000, rows)
+        )
+        if added or removed:
+            print(f"🧭 Updated BM25 index: +{added} / -{removed} docs ({len(self._bm25)} total)")
+
+    def _ensure_passages(self):
+        """Bring the passage index in line with the documents, windowing only new bodies."""
+        if not HAVE_NUMPY:
+            return
+        if self._passages is None:
+            self._passages = PassageIndex(self._passages_dir)
+            if self._passages.load():
+                print(f"💾 Loaded passage index for {len(self._passages)} docs")
+        added, removed = self._passages.sync(self.documents.content_hashes, self.documents.text_of)
+        if added or removed:
+            print(
+                f"🧭 Updated passage index: +{added} / -{removed} docs "
+                f"({len(self._passages.bm25)} passages over {len(self._passages)} docs)"
+            )
+
+    def _text_prefixes(self, n: int, rows: Optional[List[int]] = None) -> List[str]:
+        """Index text for ``rows`` (default: every document), batch-read from the store for persisted ones."""
+        table = self.documents
+        rows = range(len(table)) if rows is None else rows
+        stored = self._store.get_prefixes(
+            [table.doc_ids[r] for r in rows if table.pending_text[r] is None and table.doc_ids[r] >= 0], n
+        )
+        out = []
+        for r in rows:
+            text = table.pending_text[r]
+            out.append(text[:n] if text is not None else stored.get(table.doc_ids[r], table.contents[r])[:n])
+        return out
+
+    _EMBED_MODEL = "all-MiniLM-L6-v2"
+    EMBED_RERANK_FACTOR = 4
+
+    def _embed_model(self):
+        """The sentence-transformer, loaded on first use; None when unavailable."""
+        if HAVE_ST and self._st_model is None:
+            try:
+                self._st_model = SentenceTransformer(self._EMBED_MODEL)
             except Exception:
                 self._st_model = None
-                return
-        texts = [d.full_content[:2000] for d in self.documents]
-        if texts:
-            self._embed_matrix = self._st_model.encode(texts, show_progress_bar=False)
-            print(f"🧠 Built embedding index for {len(texts)} docs")
+        return self._st_model
+
+    def _uncached_bodies(self) -> Tuple[List[str], Dict[str, str]]:
+        """Embedding key of every document, and the bodies (by key) the cache has never seen."""
+        if self._embed_cache is None:
+            self._embed_cache = EmbeddingCache(self.knowledge_base_path / ".qa_embed", self._EMBED_MODEL)
+        texts = self._text_prefixes(2000)
+        keys = [hashlib.sha1(t.encode("utf-8", "surrogatepass")).hexdigest() for t in texts]
+        # Deduplicated within the batch too
+        pending: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k not in self._embed_cache and k not in pending:
+                pending[k] = t
+        return keys, pending
+
+    def prefetch_embeddings(self) -> int:
+        """Encode the bodies the embedding cache lacks without holding the lock.
+
+        The lock is only taken to read the bodies and to append the vectors,
+        so searches keep running while the model works; the ``build_index``
+        that follows finds every vector cached. Returns the number encoded.
+        """
+        model = self._embed_model()
+        if model is None:
+            return 0
+        with self.lock:
+            _keys, pending = self._uncached_bodies()
+        if not pending:
+            return 0
+        vecs = np.asarray(model.encode(list(pending.values()), show_progress_bar=False))
+        with self.lock:
+            cache = self._embed_cache
+            # Another caller may have encoded some of them meanwhile
+            fresh = [i for i, k in enumerate(pending) if k not in cache]
+            keys = list(pending)
+            cache.append([keys[i] for i in fresh], vecs[fresh])
+        print(f"🧠 Encoded {len(fresh)} new docs in the background")
+        return len(fresh)
 
+    def _ensure_embed(self):
+        if self._embed_model() is None:
+            return
+        keys, pending = self._uncached_bodies()
+        if not keys:
+            return
+        cache = self._embed_cache
+        if pending:
+            vecs = self._st_model.encode(list(pending.values()), show_progress_bar=False)
+            cache.append(list(pending.keys()), vecs)
+            print(f"🧠 Encoded {len(pending)} new docs ({len(keys) - len(pending)} cached)")
+        live = set(keys)
+        if len(cache) - len(live) > max(256, len(live) // 4):
+            cache.compact(live)
+        # Normalised once here so a query is a single matrix-vector product
+        self._embed_matrix = EmbeddingMatrix.build(cache.matrix(), cache.rows(keys), self.embed_dtype)
+        self._embed_keys = keys
+        self.generation += 1
+        print(
+            f"🧠 Built embedding index for {len(keys)} docs "
+            f"({self._embed_matrix.dtype}, {self._embed_matrix.nbytes / 2**20:.1f} MB)"
+        )
+        self._ensure_ann(keys)
+
+    def _ensure_ann(self, keys: List[str]):
+        if self.ann == "off" or (self.ann == "auto" and len(keys) < IVFIndex.MIN_ROWS):
+            self._ann = None
+            return
+        if self._ann is None:
+            self._ann = IVFIndex(self._ann_dir, nprobe=self.ann_nprobe)
+            self._ann.load()
+        t0 = time.time()
+        if self._ann.sync(self._embed_matrix, keys):
+            print(f"🧭 Trained ANN index: {len(self._ann.centroids)} lists over {len(keys)} docs in {time.time() - t0:.1f}s")
+
+    @_synchronized
     def build_index(self):
         if not self.documents:
             return
         self._ensure_tfidf()
+        self._ensure_bm25()
+        self._ensure_passages()
         self._ensure_embed()
 
-    def semantic_search(self, query: str, limit: int = 10):
+    @_synchronized
+    def semantic_search(
+        self,
+        query: str,
+        limit: int = 10,
+        category=None,
+        path_glob: Optional[str] = None,
+        extension=None,
+        min_quality: Optional[float] = None,
+    ):
+        """Best ``limit`` documents for ``query``, optionally restricted (see ``SearchFilter``)."""
         if not self.documents:
             return []
-        if self._tfidf_matrix is None and self._embed_matrix is None:
-            self.build_index()
+        flt = SearchFilter.build(category, path_glob, extension, min_quality)
+        results = self._cached_search([query], limit, flt)[0]
+        print(f"✅ Found {len(results)} relevant documents for: '{query}'")
+        return results
+
+    @_synchronized
+    def semantic_search_many(
+        self,
+        queries: List[str],
+        limit: int = 10,
+        category=None,
+        path_glob: Optional[str] = None,
+        extension=None,
+        min_quality: Optional[float] = None,
+    ) -> List[list]:
+        """``semantic_search`` for a batch: one encode call and one sparse product per engine.
+
+        Returns the result list of each query, in order. Meant for evaluation
+        runs and query files with thousands of entries.
+        """
+        if not self.documents:
+            return [[] for _ in queries]
+        flt = SearchFilter.build(category, path_glob, extension, min_quality)
+        hits = self.query_cache.hits
+        results = self._cached_search(queries, limit, flt)
+        print(f"✅ Answered {len(queries)} queries ({self.query_cache.hits - hits} from cache)")
+        return results
 
-        scored: List[Tuple[int, float]] = []
+    @_synchronized
+    def close(self):
+        """Stop background workers (search shards); the graph stays usable in-process."""
+        if self._shards is not None:
+            self._shards.close()
+            self._shards = None
+            self.shards = 0
+
+    def _drop_shards(self, error: Exception):
+        """Tear down the search shards after one failed; BM25 carries on in-process."""
+        print(f"⚠️  BM25 search shards failed ({error}); searching in-process from now on")
+        if self._shards is not None:
+            self._shards.close()
+        self._shards = None
+        self.shards = 0
+
+    @_synchronized
+    def search_passages(
+        self,
+        query: str,
+        limit: int = 5,
+        category=None,
+        path_glob: Optional[str] = None,
+        extension=None,
+        min_quality: Optional[float] = None,
+    ) -> List[Passage]:
+        """Best ``limit`` passages for ``query`` across full document bodies, with offsets and matched terms."""
+        if not self.documents or not HAVE_NUMPY:
+            return []
+        self._ensure_passages()
+        mask = self._filter_mask(SearchFilter.build(category, path_glob, extension, min_quality))
+        terms = list(dict.fromkeys(BM25Index.TOKEN.findall(query.lower())))
+        out: List[Passage] = []
+        taken: Dict[int, List[int]] = defaultdict(list)
+        # Neighbouring windows share OVERLAP chars, so one match can top two of them; keep the better
+        for row, start, score in self._passages.search(query, 2 * limit, mask):
+            if len(out) == limit:
+                break
+            if any(abs(start - other) < PassageIndex.WINDOW for other in taken[row]):
+                continue
+            taken[row].append(start)
+            text = self.documents.text_of(row)[start:start + PassageIndex.WINDOW]
+            low = text.lower()
+            matches = []
+            for term in terms:
+                m = re.search(rf"(?<![A-Za-z0-9_\-]){re.escape(term)}(?![A-Za-z0-9_\-])", low)
+                if m:
+                    matches.append((term, start + m.start()))
+            out.append(Passage(
+                document=self.documents[row],
+                start=start,
+                end=start + len(text),
+                score=score,
+                terms=[t for t, _off in matches],
+                matches=matches,
+                text=text,
+            ))
+        return out
+
+    def _filter_mask(self, flt: Optional[SearchFilter]):
+        """Row mask of ``flt``, computed once per index generation (None: every row)."""
+        if flt is None:
+            return None
+        cached = self._filter_masks.get(flt)
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        table = self.documents
+        n = len(table)
+        if HAVE_NUMPY:
+            mask = np.ones(n, dtype=bool)
+            if flt.categories:
+                mask &= np.logical_or.reduce([table.category_mask(c) for c in flt.categories])
+            if flt.min_quality is not None:
+                mask &= np.frombuffer(table.quality, dtype=np.float32) >= flt.min_quality
+            candidates = np.flatnonzero(mask).tolist()
+        else:
+            mask = [
+                (not flt.categories or table.category_names[table.category_ids[r]] in flt.categories)
+                and (flt.min_quality is None or table.quality[r] >= flt.min_quality)
+                for r in range(n)
+            ]
+            candidates = [r for r in range(n) if mask[r]]
+        if flt.extensions or flt.path_glob:
+            for row in candidates:
+                if not any(flt.matches_path(_source_of(p)) for p in table.sources_of(row)):
+                    mask[row] = False
+        if len(self._filter_masks) >= 32:
+            self._filter_masks.clear()
+        self._filter_masks[flt] = (self.generation, mask)
+        return mask
+
+    def _cached_search(self, queries: List[str], limit: int, flt: Optional[SearchFilter] = None) -> List[list]:
+        keys = [(QueryCache.normalise(q), limit, flt) for q in queries]
+        found = [self.query_cache.get(key, self.generation) for key in keys]
+        # Identical (normalised) queries among the misses are searched once
+        todo: Dict[tuple, str] = {}
+        for key, query, rows in zip(keys, queries, found):
+            if rows is None:
+                todo.setdefault(key, query)
+        if todo:
+            fresh = dict(zip(todo, self._search_rows_many(list(todo.values()), limit, self._filter_mask(flt))))
+            for key, rows in fresh.items():
+                self.query_cache.put(key, self.generation, rows)
+            found = [rows if rows is not None else fresh[key] for key, rows in zip(keys, found)]
+        return [[self.documents[i] for i in rows] for rows in found]
+
+    # Queries scored per dense (queries x documents) block
+    SEARCH_BATCH = 64
+
+    def _search_rows_many(self, queries: List[str], limit: int, mask=None) -> List[Tuple[int, ...]]:
+        """Rows of the best ``limit`` documents for each query, best first; only rows in ``mask`` if given."""
+        # Cheap when nothing changed; otherwise they index only new rows
+        self._ensure_tfidf()
+        self._ensure_bm25()
+        if not any(e is not None and len(e) for e in (self._tfidf, self._bm25, self._shards)) and self._embed_matrix is None:
+            self.build_index()
 
-        # Embedding similarity if available
-        if self._embed_matrix is not None and self._st_model is not None:
+        n = len(self.documents)
+        depth = max(limit, FUSION_DEPTH)
+        rankings: List[list] = [[] for _ in queries]
+        subset = None
+        if mask is not None:
+            if not any(mask):
+                return [() for _ in queries]
+            if HAVE_NUMPY:
+                subset = np.flatnonzero(mask)
+
+        # Embedding similarity if available. Matrix rows are a prefix of the table: rows
+        # ingested since the last encode have no vector yet and are ranked by the other engines
+        mat = self._embed_matrix
+        qvecs = None
+        if mat is not None and self._st_model is not None and 0 < len(mat) <= n:
             try:
-                qvec = self._st_model.encode([query], show_progress_bar=False)[0]
-                import numpy as _np
-                sims = (self._embed_matrix @ qvec) / (
-                    _np.linalg.norm(self._embed_matrix, axis=1) * (float(_np.linalg.norm(qvec)) + 1e-9)
-                )
-                for i, s in enumerate(sims.tolist()):
-                    scored.append((i, float(s)))
-            except Exception:
-                pass
+                qvecs = np.asarray(self._st_model.encode(queries, show_progress_bar=False), dtype=np.float32)
+            except Exception as e:
+                print(f"⚠️  Query encoding failed, ranking without embeddings: {e}")
+        if qvecs is not None:
+            qvecs /= np.linalg.norm(qvecs, axis=1, keepdims=True) + 1e-9
+            embedded = subset if subset is None or len(mat) == n else subset[subset < len(mat)]
+            # Quantized scores pick a wider candidate list; full-precision re-scoring orders it
+            wide = depth * self.EMBED_RERANK_FACTOR if self.embed_rerank and mat.dtype != "float32" else depth
+            # A narrow filter scans its own rows; the IVF lists only pay off on a large subset
+            if self._ann is not None and len(self._ann) == n and (subset is None or len(subset) > IVFIndex.MIN_ROWS):
+                candidates = [self._ann.search(mat, qvec, wide, allowed=mask)[0] for qvec in qvecs]
+            elif embedded is not None and not len(embedded):
+                candidates = []
+            else:
+                candidates = []
+                for lo in range(0, len(queries), self.SEARCH_BATCH):
+                    top = top_k_indices(mat.scores(qvecs[lo:lo + self.SEARCH_BATCH], embedded), wide)
+                    candidates.extend(top if embedded is None else embedded[top])
+            for ranking, qvec, rows in zip(rankings, qvecs, candidates):
+                if wide != depth:
+                    rows, _sims = mat.rerank(qvec, rows, depth)
+                ranking.append(rows)
 
         # TF-IDF similarity
-        if self._tfidf_matrix is not None and self._vectorizer is not None:
+        if self._tfidf is not None and len(self._tfidf) == n:
             try:
-                qv = self._vectorizer.transform([query])
-                sims = cosine_similarity(qv, self._tfidf_matrix)[0]
-                for i, s in enumerate(sims.tolist()):
-                    scored.append((i, float(s)))
+                for lo in range(0, len(queries), self.SEARCH_BATCH):
+                    sims = self._tfidf.scores_many(queries[lo:lo + self.SEARCH_BATCH], subset)
+                    tops = top_k_indices(sims, depth)
+                    for ranking, row_sims, top in zip(rankings[lo:], sims, tops):
+                        top = top[row_sims[top] > 0]
+                        ranking.append(top if subset is None else subset[top])
             except Exception:
                 pass
 
-        # Fallback: fuzzy ratio on snippet
-        if not scored:
-            q = query.lower()
-            for i, d in enumerate(self.documents):
-                snippet = d.content.lower()
-                if HAVE_RAPIDFUZZ:
-                    score = fuzz.partial_ratio(q, snippet) / 100.0
-                else:
-                    score = sum(w in snippet for w in q.split()) / max(1, len(q.split()))
-                scored.append((i, float(score)))
-
-        # Aggregate by max score per doc
-        best: Dict[int, float] = {}
-        for i, s in scored:
-            best[i] = max(best.get(i, 0.0), s)
+        # BM25 top-k fanned out over the shards, or straight from the in-process inverted index
+        if self._shards is not None and len(self._shards) == n:
+            try:
+                for ranking, rows in zip(rankings, self._shards.top_k_many(queries, depth, mask)):
+                    ranking.append(rows)
+            except RuntimeError as e:
+                self._drop_shards(e)
+                self._ensure_bm25()
+        if self._bm25 is not None and len(self._bm25) == n:
+            for ranking, query in zip(rankings, queries):
+                ranking.append(self._bm25.top_k(query, depth, allowed=mask)[0])
+
+        return [
+            self._fuse(ranking, limit) if ranking else self._fallback_rows(query, limit, mask)
+            for ranking, query in zip(rankings, queries)
+        ]
 
-        order = sorted(best.items(), key=lambda x: -x[1])[:limit]
-        results = [self.documents[i] for (i, _s) in order]
-        print(f"✅ Found {len(results)} relevant documents for: '{query}'")
-        return results
+    @staticmethod
+    def _fuse(ranking: list, limit: int) -> Tuple[int, ...]:
+        rows, fused = reciprocal_rank_fusion(ranking)
+        return tuple(rows[top_k_indices(fused, limit)].tolist())
+
+    # Snippets fuzzy-scored per batch; the score cutoff rises to the running k-th best between batches
+    FUZZY_BLOCK = 2048
+
+    def _fuzzy_snippets(self) -> Tuple[List[str], str, List[int]]:
+        """Lower-cased snippets, joined for substring scans; rebuilt once per generation."""
+        if self._fuzzy is None or self._fuzzy[0] != self.generation:
+            snippets = [c.lower() for c in self.documents.contents]
+            starts, pos = [], 0
+            for snippet in snippets:
+                starts.append(pos)
+                pos += len(snippet) + 1
+            self._fuzzy = (self.generation, snippets, "\0".join(snippets), starts)
+        return self._fuzzy[1:]
+
+    def _fallback_rows(self, query: str, limit: int, mask=None) -> Tuple[int, ...]:
+        """Fuzzy ratio on snippets, for when no index is available.
+
+        A snippet containing the query verbatim is a perfect hit, so one
+        substring scan over the joined snippets answers the query outright
+        once ``limit`` of them turn up. Otherwise rapidfuzz scores the rest in
+        multi-threaded batches, skipping any snippet that cannot beat the
+        current ``limit``-th best. Ties go to the earlier row, as before.
+        """
+        snippets, joined, starts = self._fuzzy_snippets()
+        q = query.lower()
+        rows = [r for r in range(len(snippets)) if mask is None or mask[r]]
+        if not HAVE_RAPIDFUZZ:
+            words = q.split()
+            scores = {r: sum(w in snippets[r] for w in words) / max(1, len(words)) for r in rows}
+            return tuple(heapq.nlargest(limit, rows, key=scores.__getitem__))
+
+        if q and "\0" not in q:
+            perfect = []
+            i = joined.find(q)
+            while i >= 0 and len(perfect) < limit:
+                r = bisect.bisect_right(starts, i) - 1
+                if mask is None or mask[r]:
+                    perfect.append(r)
+                i = joined.find(q, starts[r + 1]) if r + 1 < len(starts) else -1
+            if len(perfect) == limit:
+                return tuple(perfect)
+
+        if not HAVE_NUMPY:  # cdist hands back numpy arrays
+            hits = process.extract(q, [snippets[r] for r in rows], scorer=fuzz.partial_ratio, limit=limit)
+            return tuple(rows[i] for _snippet, _score, i in hits)
+        best_rows, best = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cutoff = 0.0
+        for lo in range(0, len(rows), self.FUZZY_BLOCK):
+            block = rows[lo : lo + self.FUZZY_BLOCK]
+            choices = snippets[lo : lo + len(block)] if mask is None else [snippets[r] for r in block]
+            scores = process.cdist([q], choices, scorer=fuzz.partial_ratio, score_cutoff=cutoff, workers=-1)[0]
+            # Stable, and the held rows precede the block: ties keep the earlier row
+            cand = np.concatenate([best_rows, np.asarray(block, dtype=np.int64)])
+            merged = np.concatenate([best, scores])
+            top = np.argsort(-merged, kind="stable")[:limit]
+            best_rows, best = cand[top], merged[top]
+            if len(best) == limit:
+                cutoff = float(best[-1])
+                if cutoff >= 100:
+                    break
+        return tuple(best_rows.tolist())
 
     # ---------- relationships & centrality ----------
     def build_relationships(self):
-        if not self.documents:
-            return
+        """Pair up documents sharing a concept.
+
+        The concept columns are copied under the lock and the pairs built
+        outside it, so searches are not held up by a large corpus.
+        """
+        with self.lock:
+            table = self.documents
+            if not table:
+                return
+            indptr = array("q", table.concept_indptr)
+            concept_ids = array("i", table.concept_ids)
+            paths = list(table.file_paths)
+            names = list(table.concept_names)
         print("🔗 Building relationships by concept overlap…")
-        concepts_to_docs: Dict[str, List[int]] = defaultdict(list)
-        for i, d in enumerate(self.documents):
-            for c in d.domain_concepts:
+        concepts_to_docs: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(paths)):
+            for c in concept_ids[indptr[i] : indptr[i + 1]]:
                 concepts_to_docs[c].append(i)
         rels: List[Dict[str, Any]] = []
         for c, idxs in concepts_to_docs.items():
@@ -342,21 +3967,42 @@ class EnhancedKnowledgeGraph:
             for a in range(len(idxs) - 1):
                 for b in range(a + 1, len(idxs)):
                     rels.append({
-                        "source": self.documents[idxs[a]].file_path,
-                        "target": self.documents[idxs[b]].file_path,
+                        "source": paths[idxs[a]],
+                        "target": paths[idxs[b]],
                         "type": "shares_concepts",
-                        "concept": c,
+                        "concept": names[c],
                     })
         self.relationships = rels
 
+    @_synchronized
     def calculate_centrality(self):
+        table = self.documents
+        if not table:
+            return
+        if HAVE_NUMPY:
+            # Degree straight from the concept CSR columns: same count build_relationships yields per row
+            deg = table.concept_degrees()
+            scores = (0.7 + 0.05 * np.minimum(6, deg)).astype(np.float32)
+            quality = np.frombuffer(table.quality, dtype=np.float32)
+            changed = np.flatnonzero(scores != quality)
+            quality[changed] = scores[changed]
+            if len(changed):
+                self.generation += 1
+            doc_ids = np.frombuffer(table.doc_ids, dtype=np.int64)
+            for row in changed[doc_ids[changed] >= 0].tolist():
+                self._dirty_scores[int(doc_ids[row])] = float(scores[row])
+            return
         degrees: Dict[str, int] = defaultdict(int)
         for r in self.relationships:
             degrees[r["source"]] += 1
             degrees[r["target"]] += 1
-        for d in self.documents:
-            deg = degrees.get(d.file_path, 0)
-            d.quality_score = 0.7 + 0.05 * min(6, deg)
+        for row, fp in enumerate(table.file_paths):
+            score = array("f", [0.7 + 0.05 * min(6, degrees.get(fp, 0))])[0]
+            if score != table.quality[row]:
+                table.quality[row] = score
+                self.generation += 1
+                if table.doc_ids[row] >= 0:
+                    self._dirty_scores[table.doc_ids[row]] = score
 
     # ---------- helpers ----------
     def _extract_concepts(self, text: str) -> List[str]:
@@ -385,19 +4031,165 @@ class EnhancedKnowledgeGraph:
         tags = set([w.title() for w in caps if 3 < len(w) < 28] + [w.title() for w in words if w.lower() in hot])
         return sorted(list(tags))[:12]
 
-    def _try_install_core(self):
-        global HAVE_NUMPY, HAVE_SKLEARN, HAVE_RAPIDFUZZ
-        try:
-            print("⚙️  Installing core deps (numpy, scikit-learn, rapidfuzz)…")
-            os.system("pip install --quiet numpy scikit-learn rapidfuzz pdfminer.six python-docx jinja2")
-            import numpy as _np  # noqa: F401
-            from sklearn.feature_extraction.text import TfidfVectorizer as _TV  # noqa: F401
-            from rapidfuzz import fuzz as _f  # noqa: F401
-            HAVE_NUMPY = True
-            HAVE_SKLEARN = True
-            HAVE_RAPIDFUZZ = True
-        except Exception:
-            pass
+
+# ===== Watch mode =====
+class KnowledgeWatcher:
+    """Keeps the knowledge graph in sync with directories while the REPL runs.
+
+    Uses watchdog (inotify on Linux) when it is installed and otherwise polls
+    the directories with the pruned walker. A burst of changes is debounced,
+    then only the changed paths are re-synced through the ingest manifest.
+    PDF/DOCX/PPTX text is extracted into the text cache and new bodies are
+    encoded before the graph lock is taken, and the index steps that follow
+    each take it briefly, so searches are not stuck behind a rebuild.
+    """
+
+    # Apply even while changes keep arriving, at least this often (seconds)
+    MAX_DELAY = 30.0
+    # Polling waits this many times as long as its last walk took, so a large tree is walked less often
+    POLL_COST_FACTOR = 10
+
+    def __init__(self, kg: EnhancedKnowledgeGraph, debounce: float = 2.0, poll_interval: float = 2.0):
+        self.kg = kg
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.roots: Dict[str, str] = {}  # absolute root -> ingest category
+        self.backend = "watchdog" if HAVE_WATCHDOG else "polling"
+        self._cond = threading.Condition()
+        self._pending: Dict[str, set] = {}
+        self._first_event = self._last_event = 0.0
+        self._snapshots: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, root: Path, category: str = "knowledge"):
+        key = os.path.abspath(root)
+        if key in self.roots:
+            return
+        self.roots[key] = category
+        if self.backend == "polling":
+            self._snapshots[key] = self._snapshot(key)
+        elif self._observer is not None:
+            self._observer.schedule(self._handler(), key, recursive=True)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        if self.backend == "watchdog":
+            self._observer = Observer()
+            for root in self.roots:
+                self._observer.schedule(self._handler(), root, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+        self._thread = threading.Thread(target=self._loop, name="kg-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(2)
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join(self.kg.extract_timeout + 5)
+            self._thread = None
+
+    # ---------- change detection ----------
+    def _handler(self):
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+                    if path:
+                        watcher._note(os.fsdecode(path), event.is_directory)
+
+        return _Handler()
+
+    def _note(self, path: str, is_dir: bool = False):
+        parts = Path(path).parts
+        if any(p.startswith(".qa_") or p in PRUNE_DIRS for p in parts):
+            return  # our own sidecars, or directories ingest never reads
+        if not is_dir and os.path.splitext(path)[1].lower() not in INGEST_EXTS:
+            return
+        roots = [r for r in self.roots if _is_under(path, Path(r))]
+        if not roots:
+            return
+        now = time.monotonic()
+        with self._cond:
+            if not self._pending:
+                self._first_event = now
+            self._last_event = now
+            self._pending.setdefault(max(roots, key=len), set()).add(path)
+            self._cond.notify_all()
+
+    def _snapshot(self, root: str) -> Dict[str, Tuple[int, int]]:
+        return {
+            path: (st.st_size, st.st_mtime_ns)
+            for path, st in walk_ingestable(Path(root), INGEST_EXTS, INGEST_MAX_BYTES, sniff=False)
+        }
+
+    def _poll(self):
+        for root in list(self.roots):
+            before = self._snapshots.get(root, {})
+            after = self._snapshot(root)
+            self._snapshots[root] = after
+            for path in set(before) | set(after):
+                if before.get(path) != after.get(path):
+                    self._note(path)
+
+    # ---------- applying changes ----------
+    def _loop(self):
+        next_poll = 0.0
+        while not self._stop.is_set():
+            if self.backend == "polling" and time.monotonic() >= next_poll:
+                t0 = time.monotonic()
+                self._poll()
+                took = time.monotonic() - t0
+                next_poll = time.monotonic() + max(self.poll_interval, self.POLL_COST_FACTOR * took)
+            with self._cond:
+                now = time.monotonic()
+                if not self._pending:
+                    self._cond.wait(self.poll_interval)
+                    continue
+                quiet = now - self._last_event
+                if quiet < self.debounce and now - self._first_event < self.MAX_DELAY:
+                    self._cond.wait(self.debounce - quiet)
+                    continue
+                pending, self._pending = self._pending, {}
+            try:
+                self._apply(pending)
+            except Exception as e:
+                print(f"⚠️  Watch update failed: {e}")
+
+    def _apply(self, pending: Dict[str, set]):
+        changed = [p for paths in pending.values() for p in paths if os.path.isfile(p)]
+        self.kg.prefetch([Path(p) for p in changed])
+        count = 0
+        with self.kg.lock:
+            for root in sorted(pending):
+                # A watched root nested in this one is applied (and pruned) on its own
+                nested = [Path(r) for r in self.roots if r != root and _is_under(r, Path(root))]
+                count += self.kg.ingest_path_recursive(
+                    Path(root), category=self.roots[root], exclude=nested, only=sorted(pending[root])
+                ) or 0
+        if not count:
+            return
+        # Each step takes the lock on its own, so commands run in between
+        self.kg.prefetch_embeddings()
+        self.kg.build_index()
+        self.kg.build_relationships()
+        self.kg.calculate_centrality()
+        self.kg.save_memory()
+        print(f"👁️  Watch: applied {count} file changes under {', '.join(sorted(pending))}")
 
 
 # ===== Document/NLP utilities =====
@@ -509,8 +4301,8 @@ class NLPEngine:
         intent = self.parse_intent(text)
         it = intent["intent"]
         if it == "locate":
-            q = intent["query"]
-            hits = self.kg.semantic_search(q, limit=10)
+            q, filters = parse_search_filters(intent["query"])
+            hits = self.kg.semantic_search(q, limit=10, **filters)
             lines = [f"- {Path(d.file_path).name} | {d.category} | ⭐ {d.quality_score:.2f}" for d in hits]
             return ("\n".join(lines) or "(no results)", [])
         if it in {"understand", "explain"}:
@@ -1213,25 +5005,13 @@ class QuantumArchitect:
             category="blueprint",
             name=f"blueprint_{blueprint.id}.json",
         )
-        # Also ingest each artifact's content virtually (lightweight, ensures searchability)
+        # Also ingest each artifact's content virtually; ingest_text chunks large ones
         for a in blueprint.artifacts:
-            # For large artifacts, chunk to improve retrieval quality
-            content = a.content
-            CHUNK_SIZE = 6_000
-            if len(content) > CHUNK_SIZE:
-                chunks = [content[i : i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE)]
-                for idx, chunk in enumerate(chunks, start=1):
-                    self.kg.ingest_text(
-                        text=chunk,
-                        category="artifact",
-                        name=f"{(a.file_path or a.name)}#part{idx}",
-                    )
-            else:
-                self.kg.ingest_text(
-                    text=content,
-                    category="artifact",
-                    name=a.file_path or a.name,
-                )
+            self.kg.ingest_text(
+                text=a.content,
+                category="artifact",
+                name=a.file_path or a.name,
+            )
         self.kg.build_index()
         self.kg.build_relationships()
         self.kg.calculate_centrality()
@@ -1352,12 +5132,13 @@ kubectl apply -f kubernetes/
 
 # ===== Commander (CLI) =====
 class QuantumCommanderV4:
-    def __init__(self, knowledge_base_path: str = "cpux"):
+    def __init__(self, knowledge_base_path: str = "cpux", **kg_options: Any):
         self.knowledge_base_path = Path(knowledge_base_path)
         # Always use enhanced KG to avoid missing dependency issues
-        self.kg = EnhancedKnowledgeGraph(str(self.knowledge_base_path))
+        self.kg = EnhancedKnowledgeGraph(str(self.knowledge_base_path), **kg_options)
         self.architect = QuantumArchitect(self.kg)
         self.digester = DocumentDigester(self.kg)
+        self.watcher = KnowledgeWatcher(self.kg)
         print("\n" + "🔱" * 23)
         print("⚔️  QUANTUM COMMANDER V4.0 INITIALIZED")
         print("   THE ULTIMATE EXECUTIONER")
@@ -1372,8 +5153,9 @@ class QuantumCommanderV4:
         total += self.kg.ingest_path_recursive(self.knowledge_base_path, category="knowledge") or 0
         # Repo docs
         total += self.kg.ingest_path_recursive(Path("docs"), category="docs") or 0
-        # Whole repository (light)
-        total += self.kg.ingest_path_recursive(Path("."), category="repo") or 0
+        # Whole repository (light); the roots above keep their own manifest entries
+        walked = [self.knowledge_base_path, Path("docs")]
+        total += self.kg.ingest_path_recursive(Path("."), category="repo", exclude=walked) or 0
         if total:
             self.kg.build_index()
             self.kg.build_relationships()
@@ -1381,6 +5163,33 @@ class QuantumCommanderV4:
             self.kg.save_memory()
         print(f"🗃️  Initial gather done: {total} files")
 
+    def start_watch(self, path: Optional[Path] = None):
+        path = Path(path) if path else self.knowledge_base_path
+        if not path.is_dir():
+            print(f"❌ Not a directory: {path}")
+            return
+        self.watcher.add(path, "knowledge" if path == self.knowledge_base_path else "gather")
+        self.watcher.start()
+        print(f"👁️  Watching {path} ({self.watcher.backend}); changes are indexed in the background")
+
+    def batch_search(self, query_file: Path, limit: int = 10) -> Path:
+        """Answer every non-blank line of ``query_file``; results go to ``<file>.results.jsonl``."""
+        queries = [line.strip() for line in query_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+        out = query_file.with_name(query_file.name + ".results.jsonl")
+        started = time.perf_counter()
+        results = self.kg.semantic_search_many(queries, limit=limit)
+        with open(out, "w", encoding="utf-8") as fh:
+            for query, docs in zip(queries, results):
+                hits = [{"file_path": d.file_path, "name": d.name, "category": d.category} for d in docs]
+                fh.write(json.dumps({"query": query, "results": hits}) + "\n")
+        print(f"📝 {len(queries)} queries in {time.perf_counter() - started:.2f}s → {out}")
+        return out
+
+    def stop_watch(self):
+        if self.watcher.running:
+            self.watcher.stop()
+            print("👁️  Watch stopped")
+
     async def interactive_session(self):
         print("\n" + "=" * 70)
         print("⚔️  QUANTUM COMMANDER READY")
@@ -1388,6 +5197,7 @@ class QuantumCommanderV4:
         print("=" * 70)
 
         while True:
+            locked = False
             try:
                 user_input = input("\n⚔️  > ").strip()
                 if not user_input:
@@ -1398,9 +5208,26 @@ class QuantumCommanderV4:
 
                 if command == "exit":
                     print("\n👋 Shutting down…")
+                    self.stop_watch()
                     self.kg.save_memory()
+                    self.kg.close()
                     break
 
+                if command == "watch":
+                    if args.strip() == "stop":
+                        self.stop_watch()
+                    elif args.strip() == "status":
+                        state = "running" if self.watcher.running else "stopped"
+                        roots = ", ".join(self.watcher.roots) or "nothing"
+                        print(f"👁️  Watch {state} ({self.watcher.backend}) on {roots}")
+                    else:
+                        self.start_watch(Path(args) if args else None)
+                    continue
+
+                # Commands see a stable graph; the watcher applies changes between them
+                self.kg.lock.acquire()
+                locked = True
+
                 if command == "help":
                     self._print_help()
                     continue
@@ -1415,16 +5242,48 @@ class QuantumCommanderV4:
                     print(f"✅ Gathered {count} files from {path}")
                     continue
 
+                if command == "quarantine":
+                    if args.strip() == "clear":
+                        self.kg.clear_quarantine()
+                        self.kg.save_memory()
+                        print("✅ Quarantine cleared; files will be retried on the next gather")
+                        continue
+                    held = self.kg.quarantined()
+                    if not held:
+                        print("🚫 No quarantined files.")
+                    for path, info in held.items():
+                        print(f"   🚫 {path} — {info['reason']}")
+                    continue
+
+                if command == "cache":
+                    if args.strip() == "clear":
+                        self.kg.query_cache.clear()
+                        print("✅ Query cache cleared")
+                        continue
+                    st = self.kg.query_cache.stats()
+                    print(
+                        f"🗃️  Query cache: {st['hits']} hits / {st['misses']} misses "
+                        f"({st['hit_rate']:.0%}), {st['size']}/{st['capacity']} entries, generation {self.kg.generation}"
+                    )
+                    continue
+
                 if command == "search":
-                    if not args:
-                        print("Usage: search <query>")
+                    query, filters = parse_search_filters(args)
+                    if not query:
+                        print("Usage: search <query> [category:<name>] [path:<glob>] [ext:<.py,.md>] [quality:<min>]")
                         continue
-                    results = self.kg.semantic_search(args, limit=10)
+                    results = self.kg.semantic_search(query, limit=10, **filters)
                     for i, d in enumerate(results, 1):
                         print(f"\n{i}. {Path(d.file_path).name}")
                         print(f"   📂 {d.category} | ⭐ {d.quality_score:.2f}")
                         if d.domain_concepts:
                             print(f"   💡 {', '.join(d.domain_concepts[:5])}")
+                    passages = self.kg.search_passages(query, limit=3, **filters)
+                    if passages:
+                        print("\n📍 Best passages:")
+                    for p in passages:
+                        print(f"   {Path(p.document.file_path).name} [{p.start}:{p.end}] — {', '.join(p.terms)}")
+                        print(f"      …{p.snippet()}…")
                     continue
 
                 if command == "digest":
@@ -1454,8 +5313,18 @@ class QuantumCommanderV4:
                                     else:
                                         summaries.append(self.digester.summarize(text, fp.name))
                     else:
-                        # Query digest from KG
-                        docs = self.kg.semantic_search(args, limit=8)
+                        # Query digest from KG: the matching passages, not whole bodies
+                        by_doc: Dict[str, List[Passage]] = {}
+                        for psg in self.kg.search_passages(args, limit=24):
+                            by_doc.setdefault(psg.document.file_path, []).append(psg)
+                        for psgs in list(by_doc.values())[:8]:
+                            d = psgs[0].document
+                            text = "\n\n".join(p.text for p in sorted(psgs, key=lambda p: p.start))
+                            if any(tok in d.name.lower() for tok in [".py", ".ts", ".js", ".go", ".rs", ".java"]):
+                                summaries.append(self.digester.summarize_code(text, d.name))
+                            else:
+                                summaries.append(self.digester.summarize(text, d.name))
+                        docs = [] if by_doc else self.kg.semantic_search(args, limit=8)
                         for d in docs:
                             # Heuristic: if looks like code, use code summary
                             looks_code = any(tok in d.name.lower() for tok in [".py", ".ts", ".js", ".go", ".rs", ".java"]) or "def " in d.full_content or "class " in d.full_content
@@ -1543,12 +5412,20 @@ class QuantumCommanderV4:
 
             except KeyboardInterrupt:
                 print("\n\n👋 Interrupted. Shutting down…")
+                if locked:
+                    self.kg.lock.release()
+                    locked = False
+                self.stop_watch()
                 self.kg.save_memory()
+                self.kg.close()
                 break
             except Exception as e:
                 print(f"❌ Error: {e}")
                 import traceback
                 traceback.print_exc()
+            finally:
+                if locked:
+                    self.kg.lock.release()
 
     def _print_help(self):
         print("\n" + "=" * 70)
@@ -1561,9 +5438,12 @@ class QuantumCommanderV4:
         print("  export <blueprint_id>   → Export blueprint summary to JSON")
         print("\n🔍 KNOWLEDGE:")
         print("  gather [path]           → Ingest knowledge recursively and reindex")
-        print("  search <query>          → Semantic search across knowledge")
+        print("  search <query> [filters]→ Semantic search; filters: category: path: ext: quality:")
         print("  digest <path|query>     → Summarize code/docs and ingest digest")
         print("  nlp <instruction>       → Natural language interface (locate/understand/describe/create)")
+        print("  quarantine [clear]      → List (or release) files whose extraction blew its budget")
+        print("  watch [path|stop|status]→ Index changes under path (default: knowledge dir) as they happen")
+        print("  cache [clear]           → Show (or reset) query result cache hit/miss statistics")
         print("\n🧬 GROWTH:")
         print("  mutate [seed]           → Generate a mutated vision based on knowledge")
         print("  autopilot <n> [seed]    → Run n mutation+execute rounds")
@@ -1629,9 +5509,117 @@ async def main():
         default=None,
         help="Optional seed text to guarantee non-empty KG",
     )
+    parser.add_argument(
+        "--text-cache-mb",
+        type=int,
+        default=64,
+        help="Budget for document bodies kept in memory (the rest stay on disk)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used for PDF/DOCX/PPTX extraction (default: CPU count)",
+    )
+    parser.add_argument(
+        "--extract-timeout",
+        type=float,
+        default=120.0,
+        help="Seconds a single PDF/DOCX/PPTX extraction may take before it is quarantined",
+    )
+    parser.add_argument(
+        "--extract-max-mb",
+        type=int,
+        default=1024,
+        help="Memory budget (RSS) for a single PDF/DOCX/PPTX extraction",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=8000,
+        help="Target size in chars of the chunks documents are split into",
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=400,
+        help="Chars each chunk repeats from the end of the previous one",
+    )
+    parser.add_argument(
+        "--engines",
+        default="auto",
+        help="Lexical search engines, comma-separated from bm25,tfidf (default: whatever is installed)",
+    )
+    parser.add_argument(
+        "--ann",
+        choices=("auto", "ivf", "off"),
+        default="auto",
+        help="Approximate embedding search: auto uses the IVF index on large corpora",
+    )
+    parser.add_argument(
+        "--ann-nprobe",
+        type=int,
+        default=16,
+        help="IVF lists scanned per query; higher is slower with better recall (see bench_ann.py)",
+    )
+    parser.add_argument(
+        "--embed-dtype",
+        choices=EmbeddingMatrix.DTYPES,
+        default="int8",
+        help="In-memory embedding precision: int8 quarters and float16 halves float32's footprint",
+    )
+    parser.add_argument(
+        "--no-embed-rerank",
+        action="store_true",
+        help="Skip re-scoring quantized embedding hits at full precision",
+    )
+    parser.add_argument(
+        "--query-cache",
+        type=int,
+        default=512,
+        help="Search results kept for repeated queries (0 disables the cache)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Split the BM25 index across this many search processes (0: single process)",
+    )
+    parser.add_argument(
+        "--batch-search",
+        metavar="FILE",
+        default=None,
+        help="Answer every query in FILE (one per line) in one batch, write FILE.results.jsonl and exit",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=10,
+        help="Results per query for --batch-search",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep the knowledge path indexed as files are added, changed or removed",
+    )
     args = parser.parse_args()
 
-    commander = QuantumCommanderV4(args.knowledge_path)
+    commander = QuantumCommanderV4(
+        args.knowledge_path,
+        text_cache_mb=args.text_cache_mb,
+        workers=args.workers,
+        extract_timeout=args.extract_timeout,
+        extract_max_mb=args.extract_max_mb,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        engines=args.engines,
+        ann=args.ann,
+        ann_nprobe=args.ann_nprobe,
+        embed_dtype=args.embed_dtype,
+        embed_rerank=not args.no_embed_rerank,
+        query_cache_size=args.query_cache,
+        shards=args.shards,
+    )
 
     # Ensure at least one seed document to avoid empty KG
     if not commander.kg.documents and args.seed:
@@ -1639,6 +5627,14 @@ async def main():
         commander.kg.build_index()
         commander.kg.save_memory()
 
+    if args.batch_search:
+        commander.batch_search(Path(args.batch_search), limit=args.limit)
+        commander.kg.close()
+        return
+
+    if args.watch:
+        commander.start_watch()
+
     await commander.interactive_session()
 
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+ANN BENCHMARK for AI Commander
+Recall versus latency of the IVF embedding index against brute force
+
+Builds the same IVFIndex the commander uses over synthetic clustered unit
+vectors (shaped like sentence embeddings) and reports, for each nprobe,
+recall@k against exact search and the mean query time. Use it to pick
+--ann-nprobe for a corpus size, and --dtype to see what float16 or int8
+storage (re-ranked at full precision, as the commander does) costs in recall.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from ai_commander_core import EmbeddingMatrix, IVFIndex, top_k_indices
+
+def make_corpus(rows, dim, topics, seed):
+    """Unit vectors scattered around random topic directions"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((topics, dim)).astype(np.float32)
+    labels = rng.integers(0, topics, rows)
+    mat = centres[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat
+
+def make_queries(mat, count, seed):
+    """Perturbed corpus rows, so every query has real near neighbours"""
+    rng = np.random.default_rng(seed + 1)
+    q = mat[rng.choice(len(mat), count, replace=False)] + 0.3 * rng.standard_normal((count, mat.shape[1])).astype(np.float32) / np.sqrt(mat.shape[1])
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+def run(rows, dim, queries, k, nprobes, seed, dtype="float32", rerank=4):
+    print(f"📐 {rows} rows × {dim} dims, {queries} queries, recall@{k}")
+    mat = make_corpus(rows, dim, max(16, rows // 500), seed)
+    qs = make_queries(mat, queries, seed)
+
+    t0 = time.perf_counter()
+    exact = [top_k_indices(mat @ q, k) for q in qs]
+    brute_ms = (time.perf_counter() - t0) * 1000 / queries
+    print(f"   brute force: {brute_ms:.2f} ms/query (float32, {mat.nbytes / 2**20:.0f} MB)")
+
+    emb = EmbeddingMatrix.build(mat, dtype=dtype)
+    wide = k * rerank if dtype != "float32" else k
+    t0 = time.perf_counter()
+    found = [emb.rerank(q, top_k_indices(emb.scores(q), wide), k)[0] for q in qs]
+    ms = (time.perf_counter() - t0) * 1000 / queries
+    recall = np.mean([len(np.intersect1d(f, e)) / k for f, e in zip(found, exact)])
+    print(f"   brute force: {ms:.2f} ms/query ({dtype}, {emb.nbytes / 2**20:.0f} MB), recall {recall:.3f}")
+
+    index = IVFIndex(".", nprobe=nprobes[0])
+    t0 = time.perf_counter()
+    index.build(emb, [str(i) for i in range(rows)], seed=seed)
+    print(f"   IVF build: {len(index.centroids)} lists in {time.perf_counter() - t0:.1f}s\n")
+
+    print(f"   {'nprobe':>6}  {'recall':>7}  {'ms/query':>9}  {'speedup':>7}")
+    for nprobe in nprobes:
+        t0 = time.perf_counter()
+        found = []
+        for q in qs:
+            hits = index.search(emb, q, wide, nprobe=nprobe)[0]
+            found.append(emb.rerank(q, hits, k)[0] if wide != k else hits)
+        ms = (time.perf_counter() - t0) * 1000 / queries
+        recall = np.mean([len(np.intersect1d(f, e)) / k for f, e in zip(found, exact)])
+        print(f"   {nprobe:>6}  {recall:>7.3f}  {ms:>9.2f}  {brute_ms / ms:>6.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark recall and latency of the IVF embedding index")
+    parser.add_argument("--rows", type=int, default=200_000, help="Corpus size (default: 200000)")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension (default: 384, all-MiniLM-L6-v2)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries to average over")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64], help="nprobe values to sweep")
+    parser.add_argument("--dtype", choices=EmbeddingMatrix.DTYPES, default="float32", help="Embedding storage precision")
+    parser.add_argument("--rerank", type=int, default=4, help="Candidates re-scored per hit for quantized storage")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("🚀 ANN BENCHMARK FOR AI COMMANDER")
+    run(args.rows, args.dim, args.queries, args.k, args.nprobe, args.seed, args.dtype, args.rerank)
@@ -1,106 +1,200 @@
 #!/usr/bin/env python3
 """
 QUICK DOCUMENT CONVERTER for AI Commander
-Converts Word/PDF to clean text for proper learning
+Converts Word/PDF/PowerPoint to clean text for proper learning
+
+Runs as a batch: documents are converted concurrently in a process pool and a
+progress journal records every finished file, so an interrupted run resumes
+where it stopped (pass --restart to start over).
 """
 
 import os
 import sys
+import json
+import shutil
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Same extractors and text cache as the commander, so each document is extracted once
+from ai_commander_core import TextCache
+
+CPUX_PATH = Path("cpux")
+_text_cache = None
+# One JSON line per finished document; the ".qa_" prefix keeps it out of the commander's walk
+JOURNAL_PATH = CPUX_PATH / ".qa_convert_journal.jsonl"
+DOC_EXTS = ['.docx', '.pdf', '.pptx']
+CATEGORIES = ['ai_framework', 'blockchain', 'ui_ux', 'design', 'code', 'apps']
+
+def text_cache():
+    """The shared text cache under cpux/, opened on first use (after any chdir by the caller)"""
+    global _text_cache
+    if _text_cache is None:
+        _text_cache = TextCache(CPUX_PATH / TextCache.DIRNAME)
+    return _text_cache
+
+def cached_text_file(doc_path):
+    """Path of the extracted text of a document, extracting it only on a cache miss.
 
-try:
-    from docx2txt import process as docx2txt_process
-    import PyPDF2
-except ImportError:
-    print("Installing required packages...")
-    os.system("pip install docx2txt PyPDF2")
-    from docx2txt import process as docx2txt_process
-    import PyPDF2
-
-def convert_docx_to_text(docx_path):
-    """Convert Word document to clean text"""
+    Raises ExtractionError when the extractor is missing or fails, so the
+    document is journaled as an error (and retried) rather than as empty.
+    """
+    return text_cache().ensure(str(doc_path))
+
+def copy_normalised(src, dst):
+    """Stream src to dst with whitespace runs collapsed to single spaces; returns chars written"""
+    written = 0
+    with open(src, encoding='utf-8') as fin, open(dst, 'w', encoding='utf-8') as fout:
+        for line in fin:
+            words = line.split()
+            if words:
+                text = ' '.join(words)
+                fout.write(' ' + text if written else text)
+                written += len(text) + (1 if written else 0)
+    return written
+
+def save_text_copy(doc_file, text_file):
+    """Copy a document's cached text to text_file; False if there was nothing meaningful.
+
+    The cache entry is written page by page as the document is extracted, and
+    the copy is streamed, so no document is ever held in memory whole. Word
+    text is flattened to whitespace-normalised prose, as it always has been.
+    """
+    cached = cached_text_file(doc_file)
+    if cached.stat().st_size <= 100:  # Only save if we got meaningful content
+        return False
+    if Path(doc_file).suffix.lower() == '.docx':
+        if copy_normalised(cached, text_file) <= 100:
+            text_file.unlink()
+            return False
+        return True
+    shutil.copyfile(cached, text_file)
+    return True
+
+def _convert_job(doc_file, text_file):
+    """Pool worker: convert one document and report the outcome"""
     try:
-        text = docx2txt_process(docx_path)
-        # Clean up extra whitespace
-        text = ' '.join(text.split())
-        return text
+        saved = save_text_copy(Path(doc_file), Path(text_file))
+        return {"status": "ok" if saved else "empty"}
     except Exception as e:
-        print(f"Error converting {docx_path}: {e}")
-        return ""
+        return {"status": "error", "error": f"{type(e).__name__}: {e}"}
 
-def convert_pdf_to_text(pdf_path):
-    """Convert PDF to clean text"""
+def find_documents():
+    """(document, text output, label) for every document the converter handles"""
+    jobs = []
+    # Root documents go to cpux/documentation
+    for doc_file in sorted(Path(".").glob("*.*")):
+        if doc_file.suffix.lower() in DOC_EXTS:
+            text_file = CPUX_PATH / "documentation" / f"{doc_file.stem}.txt"
+            jobs.append((doc_file, text_file, doc_file.name))
+    # Files in cpux subdirectories are converted in place
+    for category in CATEGORIES:
+        category_path = CPUX_PATH / category
+        if category_path.exists():
+            for doc_file in sorted(category_path.glob("*.*")):
+                if doc_file.suffix.lower() in DOC_EXTS:
+                    text_file = category_path / f"{doc_file.stem}.txt"
+                    jobs.append((doc_file, text_file, f"{category}/{doc_file.name}"))
+    return jobs
+
+def load_journal():
+    """Latest journal entry per document; a torn last line from a crash is ignored"""
+    entries = {}
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        print(f"Error converting {pdf_path}: {e}")
-        return ""
+        with open(JOURNAL_PATH, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[entry["source"]] = entry
+                except (ValueError, KeyError):
+                    continue
+    except OSError:
+        pass
+    return entries
+
+def _already_done(entry, doc_file, text_file):
+    if not entry or entry.get("status") not in ("ok", "empty"):
+        return False
+    st = doc_file.stat()
+    if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        return False
+    return entry["status"] == "empty" or text_file.exists()
 
-def convert_all_documents():
-    """Convert all documents in current directory"""
-    cpux_path = Path("cpux")
+def convert_all_documents(workers=None, resume=True):
+    """Convert all documents in current directory, several at a time"""
+    jobs = find_documents()
+    journal = load_journal() if resume else {}
+    if not resume:
+        JOURNAL_PATH.unlink(missing_ok=True)
+        # Otherwise texts extracted by an older or broken extractor would come straight back
+        text_cache().clear()
+    todo = [
+        (doc_file, text_file, label)
+        for doc_file, text_file, label in jobs
+        if not _already_done(journal.get(os.path.abspath(doc_file)), doc_file, text_file)
+    ]
+    if len(todo) < len(jobs):
+        print(f"⏭️  Resuming: {len(jobs) - len(todo)} of {len(jobs)} documents already converted")
+    if not todo:
+        return 0
+
+    for _doc_file, text_file, _label in todo:
+        text_file.parent.mkdir(parents=True, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+    print(f"📄 Converting {len(todo)} documents on {workers} workers...")
     converted_count = 0
-    
-    # Convert root documents
-    for doc_file in Path(".").glob("*.*"):
-        if doc_file.suffix.lower() in ['.docx', '.pdf']:
-            print(f"📄 Converting: {doc_file.name}")
-            
-            if doc_file.suffix.lower() == '.docx':
-                content = convert_docx_to_text(doc_file)
-                category = "documentation"
-            else:  # PDF
-                content = convert_pdf_to_text(doc_file)
-                category = "documentation"
-            
-            if content and len(content) > 100:  # Only save if we got meaningful content
-                # Save to appropriate cpux category
-                category_path = cpux_path / category
-                category_path.mkdir(exist_ok=True)
-                
-                text_file = category_path / f"{doc_file.stem}.txt"
-                with open(text_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                print(f"   ✅ Saved: {text_file.name} ({len(content)} chars)")
+    CPUX_PATH.mkdir(parents=True, exist_ok=True)
+    with open(JOURNAL_PATH, 'a+', encoding='utf-8') as journal_file, ProcessPoolExecutor(max_workers=workers) as pool:
+        # Terminate a line torn by an earlier crash so it cannot swallow the next entry
+        if journal_file.tell() > 0:
+            journal_file.seek(journal_file.tell() - 1)
+            if journal_file.read(1) != "\n":
+                journal_file.write("\n")
+        futures = {
+            pool.submit(_convert_job, str(doc_file), str(text_file)): (doc_file, text_file, label)
+            for doc_file, text_file, label in todo
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            doc_file, text_file, label = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # the worker process itself died
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            if result["status"] == "ok":
+                # Lets the commander skip this copy while the original is still around
+                text_cache().record_output(text_file, doc_file)
+                print(f"   ✅ [{done}/{len(todo)}] Saved: {label} → {text_file} ({text_file.stat().st_size} bytes)")
                 converted_count += 1
-    
-    # Convert files in cpux subdirectories
-    for category in ['ai_framework', 'blockchain', 'ui_ux', 'design', 'code', 'apps']:
-        category_path = cpux_path / category
-        if category_path.exists():
-            for doc_file in category_path.glob("*.*"):
-                if doc_file.suffix.lower() in ['.docx', '.pdf', '.pptx']:
-                    print(f"📄 Converting: {category}/{doc_file.name}")
-                    
-                    if doc_file.suffix.lower() == '.docx':
-                        content = convert_docx_to_text(doc_file)
-                    elif doc_file.suffix.lower() == '.pdf':
-                        content = convert_pdf_to_text(doc_file)
-                    else:
-                        continue  # Skip PPTX for now
-                    
-                    if content and len(content) > 100:
-                        text_file = category_path / f"{doc_file.stem}.txt"
-                        with open(text_file, 'w', encoding='utf-8') as f:
-                            f.write(content)
-                        
-                        print(f"   ✅ Saved: {category}/{text_file.name}")
-                        converted_count += 1
-    
+            elif result["status"] == "empty":
+                print(f"   ⚪ [{done}/{len(todo)}] No meaningful text: {label}")
+            else:
+                print(f"   ⚠️  [{done}/{len(todo)}] Error converting {label}: {result['error']}")
+            st = doc_file.stat()
+            entry = {
+                "source": os.path.abspath(doc_file),
+                "output": str(text_file),
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                **result,
+            }
+            journal_file.write(json.dumps(entry) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
     return converted_count
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Word/PDF/PowerPoint documents to text for AI Commander")
+    parser.add_argument("--workers", type=int, default=None, help="Conversion processes (default: CPU count)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress journal and text cache and convert everything again")
+    args = parser.parse_args()
+
     print("🚀 DOCUMENT CONVERTER FOR AI COMMANDER")
     print("Converting all documents to clean text...")
-    
-    converted = convert_all_documents()
-    
+    text_cache().sweep()
+
+    converted = convert_all_documents(workers=args.workers, resume=not args.restart)
+
     print(f"\n✅ CONVERSION COMPLETE!")
     print(f"📄 Converted {converted} documents to clean text")
     print(f"\n🎯 Now restart your AI Commander to learn from CLEAN content!")
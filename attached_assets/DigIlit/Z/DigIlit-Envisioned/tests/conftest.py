@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The commander is a script directory, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,70 @@
+"""The batch converter's progress journal: resume, retry of failures, and --restart."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+import document_converter
+
+docx = pytest.importorskip("docx")
+
+
+def _write_docx(path: Path, text: str):
+    doc = docx.Document()
+    for para in text.split("\n\n"):
+        doc.add_paragraph(para)
+    doc.save(path)
+
+
+def _journal() -> dict:
+    return document_converter.load_journal()
+
+
+def _status(name: str) -> str:
+    return _journal()[str(Path(name).resolve())]["status"]
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(document_converter, "_text_cache", None)
+    _write_docx(Path("survey.docx"), "\n\n".join(["Coral reef survey of the northern atoll."] * 10))
+    _write_docx(Path("stub.docx"), "Too short.")
+    Path("broken.docx").write_bytes(b"not a zip archive")
+    return tmp_path
+
+
+def test_journal_resume_and_restart(docs, capsys):
+    output = Path("cpux/documentation/survey.txt")
+    assert document_converter.convert_all_documents(workers=1) == 1
+    assert "Coral reef survey" in output.read_text(encoding="utf-8")
+    assert (_status("survey.docx"), _status("stub.docx"), _status("broken.docx")) == ("ok", "empty", "error")
+
+    # Finished documents are skipped; the failure is retried rather than remembered as empty
+    capsys.readouterr()
+    assert document_converter.convert_all_documents(workers=1) == 0
+    out = capsys.readouterr().out
+    assert "2 of 3 documents already converted" in out
+    assert "Error converting broken.docx" in out
+
+    # Once fixed, the failed document converts; an edited one is redone too
+    _write_docx(Path("broken.docx"), "\n\n".join(["Repaired minutes of the harbour board meeting."] * 10))
+    _write_docx(Path("survey.docx"), "\n\n".join(["Revised coral reef survey with bleaching counts."] * 10))
+    assert document_converter.convert_all_documents(workers=1) == 2
+    assert _status("broken.docx") == "ok"
+    assert "bleaching counts" in output.read_text(encoding="utf-8")
+
+    # A torn last line from a crash is ignored and later entries still parse
+    journal = document_converter.JOURNAL_PATH
+    journal.write_text(journal.read_text(encoding="utf-8") + '{"source": "torn', encoding="utf-8")
+    _write_docx(Path("stub.docx"), "\n\n".join(["Stub expanded into tide table notes."] * 10))
+    assert document_converter.convert_all_documents(workers=1) == 1
+    assert json.loads(journal.read_text(encoding="utf-8").splitlines()[-1])["status"] == "ok"
+    assert _status("stub.docx") == "ok"
+
+    # --restart drops the journal and the text cache, so everything is extracted again
+    document_converter.cached_text_file("survey.docx").write_text("stale extraction " * 20, encoding="utf-8")
+    assert document_converter.convert_all_documents(workers=1, resume=False) == 3
+    assert "bleaching counts" in output.read_text(encoding="utf-8")
+    assert set(_journal()) == {str(Path(n).resolve()) for n in ("survey.docx", "stub.docx", "broken.docx")}
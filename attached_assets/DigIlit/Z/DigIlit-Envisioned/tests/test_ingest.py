@@ -0,0 +1,167 @@
+"""Ingest plumbing: chunking, ignore files and the directory walk, duplicate bodies and their aliases."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from ai_commander_core import (
+    INGEST_EXTS,
+    INGEST_MAX_BYTES,
+    EnhancedKnowledgeGraph,
+    IgnoreRules,
+    chunk_stream,
+    chunk_text,
+    walk_ingestable,
+)
+
+
+def _paragraphs(n: int) -> str:
+    return "\n\n".join(f"Paragraph {i} talks about word{i}a word{i}b and word{i}c at some length." for i in range(n))
+
+
+def _overlap(prev: str, nxt: str, limit: int) -> int:
+    """Length of the longest prefix of ``nxt`` (at most ``limit``) that ends ``prev``."""
+    return max(n for n in range(limit + 1) if prev.endswith(nxt[:n]))
+
+
+@pytest.mark.parametrize("size,overlap", [(400, 0), (400, 80), (1000, 250)])
+def test_chunk_stream_boundaries_and_overlap(size, overlap):
+    text = _paragraphs(60)
+    # Fed in awkward pieces: chunking must not depend on how the extractor splits its blocks
+    blocks = [text[i:i + 137] for i in range(0, len(text), 137)]
+    chunks = list(chunk_stream(blocks, size, overlap))
+    assert chunks == chunk_text(text, size, overlap)
+    assert len(chunks) > 1
+    assert all(len(c) <= size for c in chunks)
+    # Every chunk but the last ends on a paragraph break
+    assert all(c.endswith("\n\n") for c in chunks[:-1])
+
+    rebuilt = chunks[0]
+    for prev, nxt in zip(chunks, chunks[1:]):
+        shared = _overlap(prev, nxt, overlap)
+        if overlap:
+            assert shared > 0 and not nxt[0].isspace()  # snapped to a word start
+        else:
+            assert shared == 0
+        rebuilt += nxt[shared:]
+    assert rebuilt == text
+
+
+def test_chunk_stream_hard_cut_without_boundaries():
+    text = "x" * 1000
+    chunks = chunk_text(text, 300, 0)
+    assert [len(c) for c in chunks] == [300, 300, 300, 100]
+
+
+def test_ignore_rules_match():
+    rules = IgnoreRules(["# comment", "*.log", "build/", "/top.txt", "docs/**/draft.md", "!keep.log"])
+    assert rules.match("debug.log", False) is True
+    assert rules.match("sub/debug.log", False) is True
+    assert rules.match("keep.log", False) is False
+    assert rules.match("build", True) is True
+    assert rules.match("build", False) is None  # directory-only rule
+    assert rules.match("top.txt", False) is True
+    assert rules.match("sub/top.txt", False) is None  # anchored
+    assert rules.match("docs/a/b/draft.md", False) is True
+    assert rules.match("notes.md", False) is None
+
+
+def _tree(root: Path, files):
+    for rel, text in files.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+
+def _walk(root: Path, **kwargs):
+    return sorted(
+        os.path.relpath(path, root).replace(os.sep, "/")
+        for path, _st in walk_ingestable(root, INGEST_EXTS, INGEST_MAX_BYTES, **kwargs)
+    )
+
+
+def test_walk_respects_gitignore_and_qaignore(tmp_path):
+    _tree(tmp_path, {
+        ".gitignore": "*.log.txt\nscratch/\n",
+        ".qaignore": "private/\n",
+        "keep.md": "kept",
+        "run.log.txt": "ignored by pattern",
+        "scratch/a.md": "ignored directory",
+        "private/b.md": "ignored by .qaignore",
+        "node_modules/pkg/index.js": "pruned",
+        ".qa_textcache/x.txt": "sidecar",
+        "sub/.gitignore": "*.md\n!readme.md\n",
+        "sub/readme.md": "re-included",
+        "sub/other.md": "ignored by nested rule",
+        "sub/code.py": "print('kept')\n",
+        "image.png": "not an ingest extension",
+    })
+    assert _walk(tmp_path) == ["keep.md", "sub/code.py", "sub/readme.md"]
+    # ``only`` applies the same rules to the listed paths
+    assert _walk(tmp_path, only=[str(tmp_path / "sub" / "other.md"), str(tmp_path / "sub" / "readme.md")]) == [
+        "sub/readme.md"
+    ]
+    assert _walk(tmp_path, only=[str(tmp_path / "scratch")]) == []
+
+
+def test_walk_skips_bundles_and_generated_code(tmp_path):
+    long_line = "var a=" + "1," * 40000 + "0;\n"
+    _tree(tmp_path, {
+        "app.min.js": "x",
+        "main.3f9a1c2e.js": "x",
+        "release-20240101.js": "console.log('dates are not hashes')\n",
+        "vendor.js": long_line,
+        "schema.py": "# @generated by protoc\nX = 1\n",
+        "story.txt": "A story may say DO NOT EDIT and run on.\n",
+    })
+    skipped = {}
+    assert _walk(tmp_path, skipped=skipped) == ["release-20240101.js", "story.txt"]
+    assert skipped == {"minified": 3, "generated": 1}
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = Path("kb")
+    root.mkdir()
+    return root
+
+
+def _graph() -> EnhancedKnowledgeGraph:
+    return EnhancedKnowledgeGraph("kb", workers=1)
+
+
+def test_duplicates_share_a_row_and_promote_aliases(kb):
+    body = "\n\n".join(["Tidal turbines harvest energy from ocean currents."] * 20)
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (kb / name).write_text(body, encoding="utf-8")
+    (kb / "other.txt").write_text("Sundials tell the time from the shadow of a gnomon.", encoding="utf-8")
+    kg = _graph()
+    kg.ingest_path_recursive(kb, category="knowledge")
+    assert len(kg.documents) == 2
+    row = kg.documents.names.index("a.txt")
+    assert kg.documents.sources_of(row) == [str(kb / n) for n in ("a.txt", "b.txt", "c.txt")]
+    # Path filters see aliases too
+    kg.build_index()
+    assert [d.name for d in kg.semantic_search("tidal turbines", limit=5, path_glob="*c.txt")] == ["a.txt"]
+    kg.save_memory()
+
+    # Deleting the primary source promotes the first alias, which survives a reload
+    generation = kg.generation
+    (kb / "a.txt").unlink()
+    kg.ingest_path_recursive(kb, category="knowledge")
+    assert kg.generation > generation
+    assert len(kg.documents) == 2
+    row = kg.documents.names.index("b.txt")
+    assert kg.documents.sources_of(row) == [str(kb / "b.txt"), str(kb / "c.txt")]
+    kg.save_memory()
+    kg = _graph()
+    row = kg.documents.names.index("b.txt")
+    assert kg.documents.sources_of(row) == [str(kb / "b.txt"), str(kb / "c.txt")]
+
+    # Only when every source is gone does the body go
+    (kb / "b.txt").unlink()
+    (kb / "c.txt").unlink()
+    kg.ingest_path_recursive(kb, category="knowledge")
+    assert kg.documents.names == ["other.txt"]
@@ -0,0 +1,189 @@
+"""Round trips through the knowledge graph: ingest, save, reload, re-ingest, search."""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from ai_commander_core import EnhancedKnowledgeGraph
+
+TOPICS = {
+    "volcano.txt": "Volcano eruptions release magma, ash and sulphur gas from the mantle.",
+    "saxophone.md": "# Saxophone\n\nThe saxophone is a reed instrument common in jazz ensembles.",
+    "orchard.txt": "Orchard growers prune apple trees in winter to improve the harvest.",
+}
+
+
+def _body(sentence: str, repeat: int = 20) -> str:
+    return "\n\n".join([sentence] * repeat)
+
+
+def _graph(path="kb") -> EnhancedKnowledgeGraph:
+    return EnhancedKnowledgeGraph(path, workers=1)
+
+
+def _names(docs) -> set:
+    return {d.name for d in docs}
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = Path("kb")
+    root.mkdir()
+    for name, sentence in TOPICS.items():
+        (root / name).write_text(_body(sentence), encoding="utf-8")
+    return root
+
+
+def test_round_trip(kb):
+    kg = _graph()
+    assert kg.ingest_path_recursive(kb, category="knowledge") == 3
+    kg.build_index()
+    assert kg.semantic_search("magma eruptions", limit=1)[0].name == "volcano.txt"
+    kg.save_memory()
+
+    # A restart reloads everything and has nothing to re-ingest
+    kg = _graph()
+    assert len(kg.documents) == 3
+    assert kg.ingest_path_recursive(kb, category="knowledge") == 0
+    assert kg.semantic_search("jazz reed instrument", limit=1)[0].name == "saxophone.md"
+    row = next(r for r in range(len(kg.documents)) if kg.documents.names[r] == "orchard.txt")
+    assert "prune apple trees" in kg.documents.text_of(row)
+
+    # Incremental re-ingest: one file modified, one deleted, one added
+    (kb / "orchard.txt").write_text(_body("Orchard beekeepers move hives between pear blossoms."), encoding="utf-8")
+    (kb / "volcano.txt").unlink()
+    (kb / "glacier.txt").write_text(_body("Glacier ice carves fjords as it retreats."), encoding="utf-8")
+    assert kg.ingest_path_recursive(kb, category="knowledge") == 3
+    kg.build_index()
+    assert _names(kg.documents) == {"saxophone.md", "orchard.txt", "glacier.txt"}
+    assert kg.semantic_search("fjords glacier ice", limit=1)[0].name == "glacier.txt"
+    assert kg.semantic_search("beekeepers hives pear", limit=1)[0].name == "orchard.txt"
+    assert "volcano.txt" not in _names(kg.semantic_search("magma eruptions", limit=3))
+    kg.save_memory()
+
+    kg = _graph()
+    assert _names(kg.documents) == {"saxophone.md", "orchard.txt", "glacier.txt"}
+    assert kg.ingest_path_recursive(kb, category="knowledge") == 0
+    assert kg.semantic_search("beekeepers hives pear", limit=1)[0].name == "orchard.txt"
+
+
+def _write_txt(path: Path, text: str):
+    path.write_text(text, encoding="utf-8")
+
+
+def _write_docx(path: Path, text: str):
+    docx = pytest.importorskip("docx")
+    doc = docx.Document()
+    for para in text.split("\n\n"):
+        doc.add_paragraph(para)
+    doc.save(path)
+
+
+def _write_pptx(path: Path, text: str):
+    pptx = pytest.importorskip("pptx")
+    deck = pptx.Presentation()
+    slide = deck.slides.add_slide(deck.slide_layouts[1])
+    slide.shapes.title.text = "Findings"
+    slide.placeholders[1].text = text
+    deck.save(path)
+
+
+def _write_pdf(path: Path, text: str):
+    """One page of Helvetica text, with a valid xref table."""
+    pytest.importorskip("pdfminer")
+    line = text.split("\n\n")[0].replace("(", "").replace(")", "")
+    stream = f"BT /F1 10 Tf 40 740 Td ({line}) Tj ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+WRITERS = {".txt": _write_txt, ".md": _write_txt, ".docx": _write_docx, ".pptx": _write_pptx, ".pdf": _write_pdf}
+
+
+@pytest.mark.parametrize("suffix", sorted(WRITERS))
+def test_ingest_document(tmp_path, monkeypatch, suffix):
+    monkeypatch.chdir(tmp_path)
+    source = Path(f"report{suffix}")
+    WRITERS[suffix](source, _body("Quarterly tectonic survey of the basalt plateau."))
+    kg = _graph()
+    assert kg.ingest_document(source, "reports") == 1
+    kg.build_index()
+    assert kg.semantic_search("tectonic basalt survey", limit=1)[0].name == source.name
+    assert "basalt plateau" in kg.documents.text_of(0)
+
+
+def test_deleted_bodies_are_vacuumed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = Path("kb")
+    root.mkdir()
+    for i in range(60):
+        # Just under one chunk each, so every file is one row
+        (root / f"note{i}.txt").write_text(f"Ledger entry {i} " * 400, encoding="utf-8")
+    kg = _graph()
+    kg.ingest_path_recursive(root, category="knowledge")
+    kg.save_memory()
+    for i in range(50):
+        (root / f"note{i}.txt").unlink()
+    kg.ingest_path_recursive(root, category="knowledge")
+    kg.save_memory()
+    if kg._store._compactor is not None:
+        kg._store._compactor.join(30)
+
+    conn = sqlite3.connect(str(root / ".qa_store.sqlite"))
+    free, total = (conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("freelist_count", "page_count"))
+    conn.close()
+    assert len(kg.documents) == 10
+    assert free / total < kg._store.COMPACT_FREE_RATIO
+
+
+def test_filtered_search(kb):
+    code = Path("code")
+    code.mkdir()
+    (code / "volcano_model.py").write_text(_body("# Volcano magma flow model for eruption forecasts."), encoding="utf-8")
+    kg = _graph()
+    kg.ingest_path_recursive(kb, category="knowledge")
+    kg.ingest_path_recursive(code, category="code")
+    kg.build_index()
+    assert _names(kg.semantic_search("volcano magma eruption", limit=5)) >= {"volcano.txt", "volcano_model.py"}
+    assert _names(kg.semantic_search("volcano magma eruption", limit=5, category="code")) == {"volcano_model.py"}
+    assert _names(kg.semantic_search("volcano magma eruption", limit=5, extension="txt")) == {"volcano.txt"}
+    assert _names(kg.semantic_search("volcano magma", limit=5, path_glob="code/*")) == {"volcano_model.py"}
+    assert kg.semantic_search("volcano magma", limit=5, extension=".pdf") == []
+
+
+def test_query_cache_invalidated_by_changes(kb):
+    kg = _graph()
+    kg.ingest_path_recursive(kb, category="knowledge")
+    kg.build_index()
+    first = kg.semantic_search("glacier fjords", limit=3)
+    hits = kg.query_cache.hits
+    assert _names(kg.semantic_search("  Glacier   FJORDS ", limit=3)) == _names(first)
+    assert kg.query_cache.hits == hits + 1
+
+    (kb / "glacier.txt").write_text(_body("Glacier ice carves fjords as it retreats."), encoding="utf-8")
+    kg.ingest_path_recursive(kb, category="knowledge")
+    kg.build_index()
+    assert kg.semantic_search("glacier fjords", limit=1)[0].name == "glacier.txt"
+    assert kg.query_cache.hits == hits + 1
+
+    (kb / "glacier.txt").unlink()
+    kg.ingest_path_recursive(kb, category="knowledge")
+    assert "glacier.txt" not in _names(kg.semantic_search("glacier fjords", limit=3))
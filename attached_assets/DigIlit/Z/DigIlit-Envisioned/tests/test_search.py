@@ -0,0 +1,218 @@
+"""Search engines against reference implementations: BM25, TF-IDF, IVF, shards, filters and the query cache."""
+
+import hashlib
+import math
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from ai_commander_core import (
+    BM25Index,
+    EmbeddingMatrix,
+    EnhancedKnowledgeGraph,
+    IncrementalTfidfIndex,
+    IVFIndex,
+    QueryCache,
+    SearchFilter,
+    ShardedBM25,
+    parse_search_filters,
+)
+
+WORDS = [f"term{i:03d}" for i in range(400)]
+QUERIES = ["term001 term002 term003", "term050", "term010 term010 term399", "term123 term007 term300 term301"]
+
+
+def _corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    # Zipf-like draws, so some posting lists are long and MaxScore has terms to skip
+    weights = [1.0 / (i + 1) for i in range(len(WORDS))]
+    texts = [" ".join(rng.choices(WORDS, weights, k=rng.randint(3, 80))) for _ in range(n)]
+    keys = [hashlib.sha1(t.encode()).hexdigest() + f"{i:04x}" for i, t in enumerate(texts)]
+    return keys, texts
+
+
+def _brute_bm25(texts, query: str) -> np.ndarray:
+    """Exhaustive BM25 over ``texts`` with the index's tokenizer and parameters."""
+    docs = [Counter(BM25Index.TOKEN.findall(t.lower())) for t in texts]
+    n = len(docs)
+    avgdl = sum(sum(d.values()) for d in docs) / n
+    k1, b = BM25Index.K1, BM25Index.B
+    scores = np.zeros(n)
+    for term, qtf in Counter(BM25Index.TOKEN.findall(query.lower())).items():
+        df = sum(1 for d in docs if term in d)
+        if not df:
+            continue
+        idf = math.log1p((n - df + 0.5) / (df + 0.5)) * qtf
+        for i, d in enumerate(docs):
+            tf = d.get(term, 0)
+            if tf:
+                dl = sum(d.values())
+                scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    return scores
+
+
+def _assert_same_top(scores: np.ndarray, got_rows, got_scores, k: int):
+    """``got`` holds a best-``k`` set of ``scores`` (ties may pick different rows)."""
+    expected = np.sort(scores[scores > 0])[::-1][:k]
+    assert len(got_rows) == len(expected)
+    np.testing.assert_allclose(np.sort(got_scores)[::-1], expected, rtol=1e-5)
+    np.testing.assert_allclose(scores[got_rows], got_scores, rtol=1e-5)
+
+
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_bm25_maxscore_matches_brute_force(tmp_path, k):
+    keys, texts = _corpus(300)
+    index = BM25Index(tmp_path / "bm25")
+    index.append(keys[:200], texts[:200])
+    index.compact()
+    index.append(keys[200:], texts[200:])  # base plus tail
+    for query in QUERIES:
+        rows, scores = index.top_k(query, k)
+        _assert_same_top(_brute_bm25(texts, query), rows, scores, k)
+
+
+def test_bm25_after_delete_and_reload(tmp_path):
+    keys, texts = _corpus(300, seed=1)
+    index = BM25Index(tmp_path / "bm25")
+    index.append(keys, texts)
+    index.save()
+    keep = np.array([i % 3 != 0 for i in range(len(keys))])
+    index.retain(keep)
+    index.append(keys[:5], [texts[0] + " term001"] * 5)
+    index.save()
+    survivors = [t for t, kept in zip(texts, keep) if kept] + [texts[0] + " term001"] * 5
+
+    reloaded = BM25Index(tmp_path / "bm25")
+    assert reloaded.load()
+    assert len(reloaded) == len(survivors)
+    for query in QUERIES:
+        rows, scores = reloaded.top_k(query, 10)
+        _assert_same_top(_brute_bm25(survivors, query), rows, scores, 10)
+    # Filtered top-k is exact within the allowed rows
+    allowed = np.arange(len(survivors)) % 2 == 0
+    rows, scores = reloaded.top_k(QUERIES[0], 10, allowed=allowed)
+    assert allowed[rows].all()
+    brute = _brute_bm25(survivors, QUERIES[0])
+    brute[~allowed] = 0
+    _assert_same_top(brute, rows, scores, 10)
+
+
+def test_tfidf_sync_after_delete(tmp_path):
+    params = EnhancedKnowledgeGraph._TFIDF_PARAMS
+    keys, texts = _corpus(120, seed=2)
+    index = IncrementalTfidfIndex(tmp_path / "tfidf", params)
+    assert index.sync(keys, lambda rows: [texts[r] for r in rows]) == (120, 0)
+
+    kept = [r for r in range(len(keys)) if r % 4]
+    assert index.sync([keys[r] for r in kept], lambda rows: []) == (0, 30)
+    fresh = IncrementalTfidfIndex(tmp_path / "fresh", params)
+    fresh.append([keys[r] for r in kept], [texts[r] for r in kept])
+    assert index.keys == fresh.keys
+    np.testing.assert_array_equal(index.df, fresh.df)
+    np.testing.assert_allclose(index.idf(), fresh.idf())
+    scores = index.scores_many(QUERIES)
+    assert scores.shape == (len(QUERIES), len(kept))
+    np.testing.assert_array_equal(scores.argmax(axis=1), fresh.scores_many(QUERIES).argmax(axis=1))
+
+    index.save()
+    reloaded = IncrementalTfidfIndex(tmp_path / "tfidf", params)
+    assert reloaded.load()
+    assert reloaded.keys == fresh.keys
+    np.testing.assert_allclose(reloaded.scores_many(QUERIES), scores, rtol=1e-5)
+
+
+def _clustered(n: int, dim: int = 32, clusters: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    return (centres[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_ivf_recall_and_int8_rerank(tmp_path):
+    vectors = _clustered(3000)
+    keys = [f"k{i}" for i in range(len(vectors))]
+    exact = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    matrix = EmbeddingMatrix.build(vectors, dtype="int8")
+    ivf = IVFIndex(tmp_path / "ann", nprobe=16)
+    ivf.build(matrix, keys)
+
+    queries = exact[np.random.default_rng(1).choice(len(exact), 20, replace=False)]
+    recall = []
+    for q in queries:
+        truth = set(np.argsort(-(exact @ q))[:10].tolist())
+        rows, _ = ivf.search(matrix, q, 10)
+        recall.append(len(truth & set(rows.tolist())) / 10)
+        # Probing every list degenerates to the full quantized scan
+        rows, sims = ivf.search(matrix, q, 10, nprobe=len(ivf.centroids))
+        np.testing.assert_allclose(np.sort(sims), np.sort(matrix.scores(q)[np.argsort(-matrix.scores(q))[:10]]),
+                                   rtol=1e-5)
+        # Rerank restores the exact order among the candidates
+        wide = np.argsort(-matrix.scores(q))[:50]
+        top, top_sims = matrix.rerank(q, wide, 10)
+        np.testing.assert_array_equal(top, wide[np.argsort(-(exact[wide] @ q), kind="stable")[:10]])
+        np.testing.assert_allclose(top_sims, exact[top] @ q, rtol=1e-4)
+    assert np.mean(recall) >= 0.9
+
+    # int8 scores stay close to the exact cosine
+    assert np.abs(matrix.scores(queries[0]) - exact @ queries[0]).max() < 0.02
+
+    ivf.save()
+    reloaded = IVFIndex(tmp_path / "ann", nprobe=16)
+    assert reloaded.load()
+    np.testing.assert_array_equal(reloaded.search(matrix, queries[0], 10)[0], ivf.search(matrix, queries[0], 10)[0])
+
+
+def test_sharded_scores_match_brute_force(tmp_path):
+    keys, texts = _corpus(400, seed=3)
+    shards = ShardedBM25(tmp_path / "shards", 3)
+    try:
+        assert shards.sync(keys, lambda rows: [texts[r] for r in rows]) == (400, 0)
+        for query, rows in zip(QUERIES, shards.top_k_many(QUERIES, 10)):
+            scores = _brute_bm25(texts, query)
+            expected = np.sort(scores[scores > 0])[::-1][:10]
+            np.testing.assert_allclose(np.sort(scores[rows])[::-1], expected, rtol=1e-5)
+
+        # Deletes route to the owning shards; masks restrict each shard's rows
+        kept = [r for r in range(len(keys)) if r % 5]
+        assert shards.sync([keys[r] for r in kept], lambda rows: []) == (0, 80)
+        survivors = [texts[r] for r in kept]
+        mask = np.arange(len(kept)) % 2 == 1
+        for query, rows in zip(QUERIES, shards.top_k_many(QUERIES, 10, mask=mask)):
+            assert mask[rows].all()
+            scores = _brute_bm25(survivors, query)
+            scores[~mask] = 0
+            expected = np.sort(scores[scores > 0])[::-1][:10]
+            np.testing.assert_allclose(np.sort(scores[rows])[::-1], expected, rtol=1e-5)
+    finally:
+        shards.close()
+
+
+def test_search_filter_build():
+    assert SearchFilter.build() is None
+    flt = SearchFilter.build(category="code", extension=["PY", ".md"], min_quality=0.5)
+    assert flt.categories == ("code",)
+    assert flt.extensions == (".md", ".py")
+    assert flt.matches_path("cpux/code/tool.py")
+    assert not flt.matches_path("notes.txt")
+    glob = SearchFilter.build(path_glob="cpux/code/*")
+    assert glob.matches_path("cpux/code/a.py") and not glob.matches_path("cpux/docs/a.py")
+
+    query, opts = parse_search_filters("solar panels category:energy ext:.md,txt path:kb/* quality:0.7")
+    assert query == "solar panels"
+    assert opts == {"category": ["energy"], "extension": [".md", "txt"], "path_glob": "kb/*", "min_quality": 0.7}
+
+
+def test_query_cache_generations():
+    cache = QueryCache(capacity=2)
+    cache.put(("a",), 1, [1])
+    assert cache.get(("a",), 1) == [1]
+    assert cache.get(("a",), 2) is None  # stale generation: a miss, and the entry is gone
+    assert cache.get(("a",), 1) is None
+    cache.put(("a",), 2, [1])
+    cache.put(("b",), 2, [2])
+    cache.get(("a",), 2)
+    cache.put(("c",), 2, [3])  # evicts the least recently used
+    assert cache.get(("b",), 2) is None and cache.get(("a",), 2) == [1]
+    assert cache.stats()["size"] == 2
+    assert QueryCache.normalise("  Solar   PANELS ") == "solar panels"